@@ -1,22 +1,45 @@
 import os
 import asyncio
+import contextvars
 import json
-from typing import Dict, Any, Callable, Optional
+import time
+import threading
+import structlog
+from typing import Dict, Any, AsyncIterator, Callable, Optional
 from datetime import datetime
 
-from agno.agent import Agent
-from agno.models.openai import OpenAIChat
-import os
+# Agno, OpenAI and Tavily are imported lazily in AgentOrchestrator._build_agents:
+# together they take over a second to import, which would otherwise be paid by
+# every API replica before it can serve health checks.
 # from agno import Agent
-from agno.tools.tavily import TavilyTools
 from typing import Dict, Any, List, Optional
-from backend.models.schemas import (
+from services.metrics import FALLBACKS_USED, LLM_TOKENS, PROVIDER_LATENCY, STAGE_DURATION, record_agent_usage
+from services.cache import TTLCache
+from services.image_generation import ImagePipeline
+from services.tts import TTSPipeline
+from services.website_fetcher import WebsiteFetcher
+from services.competitor_kb import CompetitorKnowledgeBase, competitor_list, domain_of, merge_competitors
+from services.tracing import tracer
+from services.loop_monitor import activity
+from services.admission import provider_load
+from services.stage_store import company_key, fingerprint, to_jsonable
+from services.request_index import IDENTITY_FIELDS, RequestIndex, normalize_request
+from services.trend_precompute import TrendPrecompute
+from models.schemas import (
     WebScrapingResponse, 
     CompetitorInfoResponse,
     MarketTrendResponse,
     MarketPositioningResponse
 )
 
+logger = structlog.get_logger(__name__)
+
+# Speaking rate used to size marketing scripts
+WORDS_PER_SECOND = 2.5
+
+# Set when a stage returns fallback output, which is never stored for reuse
+_used_fallback: contextvars.ContextVar[bool] = contextvars.ContextVar("used_fallback", default=False)
+
 # class AgentOrchestrator:
 #     def __init__(self):
 #         self.progress_tracking: Dict[str, Dict[str, Any]] = {}
@@ -379,8 +402,53 @@ from backend.models.schemas import (
 #     #         }
 
 class AgentOrchestrator:
+    AGENT_NAMES = (
+        "web_scraping_agent",
+        "competitor_research_agent",
+        "trend_prediction_agent",
+        "market_positioning_agent"
+    )
+
     def __init__(self):
         self.progress_tracking: Dict[str, Dict[str, Any]] = {}
+        self._agents_lock = threading.Lock()
+        # Agno's debug output logs every prompt and response; keep it off in production
+        self.agent_debug = os.getenv("AGENT_DEBUG", "false").lower() == "true"
+        self.script_cache = TTLCache("marketing_script", maxsize=512, ttl=float(os.getenv("SCRIPT_CACHE_TTL", "86400")))
+        self._openai = None
+        self.image_pipeline = ImagePipeline()
+        self.tts_pipeline = TTSPipeline()
+        self.website_fetcher = WebsiteFetcher()
+        self.competitor_kb = CompetitorKnowledgeBase()
+        self.request_index = RequestIndex()
+        self.trend_precompute = TrendPrecompute(self._compute_category_trends)
+
+    def __getattr__(self, name: str):
+        # Agents are built on first access (or by warm_up) rather than in __init__
+        if name in AgentOrchestrator.AGENT_NAMES:
+            self._ensure_agents()
+            return self.__dict__[name]
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    @property
+    def agents_ready(self) -> bool:
+        return all(name in self.__dict__ for name in AgentOrchestrator.AGENT_NAMES)
+
+    def warm_up(self):
+        """Import Agno and build all agents ahead of the first analysis"""
+        self._ensure_agents()
+
+    def _ensure_agents(self):
+        with self._agents_lock:
+            if self.agents_ready:
+                return
+            for name, agent in self._build_agents().items():
+                self.__dict__.setdefault(name, agent)
+
+    def _build_agents(self) -> Dict[str, Any]:
+        from agno.agent import Agent
+        from agno.models.openai import OpenAIChat
+        from agno.tools.tavily import TavilyTools
 
         # Initialize OpenAI model with limited response length
         openai_model = OpenAIChat(
@@ -389,7 +457,7 @@ class AgentOrchestrator:
             max_tokens=500  # Limit response length
         )
         
-        self.web_scraping_agent = Agent(
+        web_scraping_agent = Agent(
             name="Web Scraping Agent",
             instructions="""
             Provide a brief company overview in 3 key points:
@@ -398,52 +466,72 @@ class AgentOrchestrator:
                         """,
             tools=[TavilyTools(search_depth="basic", max_tokens=1000)],
             model=openai_model,
-            debug_mode=True,
+            debug_mode=self.agent_debug,
             response_model=WebScrapingResponse,
             structured_outputs=True
         )
 
-        self.competitor_research_agent = Agent(
+        competitor_research_agent = Agent(
             name="Competitor Research Agent",
             instructions="""
             List top competitors with their names and websites of requested company.
             """,
-            debug_mode=True,
+            debug_mode=self.agent_debug,
             tools=[TavilyTools(search_depth="basic", max_tokens=1000)],
             model=openai_model,
             response_model=CompetitorInfoResponse,
             structured_outputs=True,
         )
 
-        self.trend_prediction_agent = Agent(
+        trend_prediction_agent = Agent(
             name="Trend Prediction Agent",
             instructions="""
             List top industry trends in the market based on requested company's industry.
             """,
-            debug_mode=True,
+            debug_mode=self.agent_debug,
             # tools=[TavilyTools(search_depth="basic", max_tokens=1000)],
             model=openai_model,
             response_model=MarketTrendResponse,
             structured_outputs=True
         )
 
-        self.market_positioning_agent = Agent(
+        market_positioning_agent = Agent(
             name="Market Positioning Agent",
             instructions="""
             Provide strategy, market gaps and advantages for requested company.
             """,
-            debug_mode=True,
+            debug_mode=self.agent_debug,
             tools=[TavilyTools(search_depth="basic", max_tokens=1000)],
             model=openai_model,
             response_model=MarketPositioningResponse,
             structured_outputs=True
         )
 
+        return {
+            "web_scraping_agent": web_scraping_agent,
+            "competitor_research_agent": competitor_research_agent,
+            "trend_prediction_agent": trend_prediction_agent,
+            "market_positioning_agent": market_positioning_agent
+        }
+
     async def run_analysis(self, analysis_id: str, company_data: Dict[str, Any], user_id: str, user_name: str = None,
-                           progress_callback: Optional[Callable] = None) -> Dict[str, Any]:
+                           progress_callback: Optional[Callable] = None, stage_store=None,
+                           mode: str = "full", checkpoint: Optional[Dict[str, Any]] = None,
+                           on_checkpoint: Optional[Callable] = None) -> Dict[str, Any]:
+        """Run the four analysis stages in order
+
+        Every computed stage output is saved to `stage_store` (when given);
+        with mode="incremental", stored outputs that are still fresh are
+        reused instead of re-running their agents, including those of a
+        near-duplicate earlier request found in `request_index`.
+
+        `checkpoint` holds the outputs of stages that completed before the
+        analysis was interrupted; those stages are skipped. After each stage,
+        `on_checkpoint` is awaited with all outputs so far.
+        """
 
         # Log the user information
-        print(f"Starting analysis for user: {user_name} (ID: {user_id})")
+        logger.info("Starting analysis", user_name=user_name, user_id=user_id)
 
         self.progress_tracking[analysis_id] = {
             "current_step": "web_scraping",
@@ -456,22 +544,60 @@ class AgentOrchestrator:
             ]
         }
 
-        try:
-            await self._update_progress(analysis_id, "web_scraping", 0, "in_progress", progress_callback)
-            website_data = await self._run_web_scraping_agent(company_data)
-            await self._update_progress(analysis_id, "web_scraping", 100, "completed", progress_callback)
+        # Incremental runs reuse stored stage outputs whose inputs are unchanged and not expired
+        reuse = mode == "incremental" and stage_store is not None
+        key = company_key(company_data)
+        # Stage inputs are fingerprinted in canonical form, so respellings of a request still match
+        request = normalize_request(company_data)
+        similar = await self.request_index.match(request) if reuse else None
+        if similar is not None:
+            self.progress_tracking[analysis_id]["similar_to"] = {
+                "company_key": similar["key"],
+                "name": similar["request"]["name"],
+                "similarity": round(similar["similarity"], 3)
+            }
 
-            await self._update_progress(analysis_id, "competitor_research", 0, "in_progress", progress_callback)
-            competitors = await self._run_competitor_research_agent(company_data, website_data)
-            await self._update_progress(analysis_id, "competitor_research", 100, "completed", progress_callback)
+        completed: Dict[str, Any] = dict(checkpoint or {})
 
-            await self._update_progress(analysis_id, "trend_prediction", 0, "in_progress", progress_callback)
-            trends = await self._run_trend_prediction_agent(company_data, website_data, competitors)
-            await self._update_progress(analysis_id, "trend_prediction", 100, "completed", progress_callback)
+        async def stage(name: str, fields: tuple, compute: Callable, **extra_inputs):
+            if name in completed:
+                # Finished before the analysis was interrupted
+                await self._update_progress(analysis_id, name, 100, "completed", progress_callback)
+                self._mark_step(analysis_id, name, resumed=True)
+                return completed[name]
+            # This company's own stored output first, then the near-duplicate's (for the same market, etc.)
+            lookups = [(key, {field: request[field] for field in fields} | extra_inputs)]
+            if similar is not None and all(
+                    similar["request"][field] == request[field] for field in fields if field not in IDENTITY_FIELDS):
+                lookups.append((similar["key"], {field: similar["request"][field] for field in fields} | extra_inputs))
+            output = await self._run_stage(analysis_id, name, lookups, compute, progress_callback, stage_store, reuse)
+            if on_checkpoint is not None:
+                completed[name] = to_jsonable(output)
+                await on_checkpoint(dict(completed))
+            return output
 
-            await self._update_progress(analysis_id, "market_positioning", 0, "in_progress", progress_callback)
-            positioning = await self._run_market_positioning_agent(company_data, website_data, competitors, trends, user_name)
-            await self._update_progress(analysis_id, "market_positioning", 100, "completed", progress_callback)
+        try:
+            website_data = await stage(
+                "web_scraping",
+                ("name", "website_url"),
+                lambda: self._run_web_scraping_agent(company_data)
+            )
+            competitors = await stage(
+                "competitor_research",
+                ("name", "market_category"),
+                lambda: self._run_competitor_research_agent(company_data, website_data)
+            )
+            trends = await stage(
+                "trend_prediction",
+                ("market_category",),
+                lambda: self._category_trends(analysis_id, company_data, website_data, competitors)
+            )
+            positioning = await stage(
+                "market_positioning",
+                ("name",),
+                lambda: self._run_market_positioning_agent(company_data, website_data, competitors, trends, user_name),
+                user_name=user_name
+            )
 
             result = {
                 "competitors": competitors,
@@ -484,38 +610,137 @@ class AgentOrchestrator:
             self.progress_tracking[analysis_id]["progress"] = 100
             self.progress_tracking[analysis_id]["current_step"] = "completed"
 
+            if stage_store is not None:
+                # Later near-duplicates of this request can reuse the outputs just stored
+                await self.request_index.add(key, request)
+
             return result
 
+        except asyncio.CancelledError:
+            # Cancelled or past its deadline: the in-flight agent call has been aborted
+            for step_data in self.progress_tracking[analysis_id]["steps"]:
+                if step_data["status"] == "in_progress":
+                    await self._update_progress(analysis_id, step_data["name"], step_data["progress"], "cancelled")
+            self.progress_tracking[analysis_id]["current_step"] = "cancelled"
+            raise
         except Exception as e:
+            for step_data in self.progress_tracking[analysis_id]["steps"]:
+                if step_data["status"] == "in_progress":
+                    await self._update_progress(analysis_id, step_data["name"], step_data["progress"], "failed")
             self.progress_tracking[analysis_id]["current_step"] = "failed"
             self.progress_tracking[analysis_id]["error"] = str(e)
             raise e
 
+    async def _run_stage(self, analysis_id: str, stage: str, lookups: List[tuple], compute: Callable,
+                         progress_callback: Optional[Callable], stage_store, reuse: bool) -> Any:
+        """Run one stage (or reuse its stored output), tracking progress and storing what it computed
+
+        `lookups` are (company key, inputs) pairs whose stored outputs may be
+        reused, in order of preference; a computed output is stored under the first.
+        """
+        with tracer.start_span(f"stage.{stage}", {"analysis.id": analysis_id}) as span, activity(f"stage.{stage}"):
+            await self._update_progress(analysis_id, stage, 0, "in_progress", progress_callback)
+            key, inputs_fingerprint = lookups[0][0], fingerprint(lookups[0][1])
+            stored = None
+            for lookup_key, lookup_inputs in (lookups if reuse else []):
+                stored = await stage_store.load(lookup_key, stage, fingerprint(lookup_inputs))
+                if stored is not None:
+                    stored["company_key"] = lookup_key
+                    break
+            span.set_attribute("reused", stored is not None)
+            if stored is not None:
+                output = stored["output"]
+                self._mark_step(analysis_id, stage, reused=True, computed_at=stored["computed_at"],
+                                reused_from=stored["company_key"])
+            else:
+                token = _used_fallback.set(False)
+                try:
+                    output = await compute()
+                    fell_back = _used_fallback.get()
+                finally:
+                    _used_fallback.reset(token)
+                if stage_store is not None and not fell_back:
+                    await stage_store.save(key, stage, inputs_fingerprint, output)
+            await self._update_progress(analysis_id, stage, 100, "completed", progress_callback)
+            return output
+
+    def _mark_step(self, analysis_id: str, stage: str, **fields):
+        for step_data in self.progress_tracking.get(analysis_id, {}).get("steps", []):
+            if step_data["name"] == stage:
+                step_data.update(fields)
+
+    def _use_fallback(self, stage: str):
+        FALLBACKS_USED.labels(stage).inc()
+        _used_fallback.set(True)
+
+    async def _run_agent(self, agent_name: str, prompt: str):
+        """Run an agent, recording its latency, token usage and Tavily calls
+
+        Uses `arun` so that cancelling the analysis task aborts the request
+        in flight instead of waiting for it in a worker thread.
+        """
+        if not self.agents_ready:
+            # Importing Agno and building the agents takes a few hundred ms; keep it off the loop
+            await asyncio.get_running_loop().run_in_executor(None, self._ensure_agents)
+        agent = getattr(self, agent_name)
+        start = time.perf_counter()
+        status = "ok"
+        with tracer.start_span(f"agent.{agent_name}", {"provider": "openai", "agent": agent_name}) as span, \
+                provider_load.track("openai"):
+            try:
+                response = await agent.arun(prompt)
+                record_agent_usage(agent_name, response)
+                tools = getattr(response, "tools", None) or []
+                span.set_attribute("tool_calls", len(tools))
+                return response
+            except asyncio.CancelledError:
+                status = "cancelled"
+                raise
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                PROVIDER_LATENCY.labels("openai", agent_name, status).observe(time.perf_counter() - start)
+
     async def _run_web_scraping_agent(self, company_data: Dict[str, Any]) -> Dict[str, Any]:
+        page = None
         try:
+            # The company's own site is fetched first-hand; Tavily only fills the gaps
+            if self.website_fetcher.enabled:
+                page = await self.website_fetcher.fetch(company_data['website_url'])
+            website_content = ""
+            if page and page["text"]:
+                website_content = f"""
+            Website content ({page['title']}):
+            {page['text']}
+
+            Use the website content above; only search with Tavily for fields it does not cover.
+            """
             prompt = f"""
             Company: {company_data['name']}
             Website: {company_data['website_url']}
-            
+            {website_content}
             Please provide a structured response with the following fields:
             - company_overview, products, target_audience,pricing, features & technology.dont call tavily search multiple times.
             only call once. if u dont find the filed values, return null values.
             """
-            response = self.web_scraping_agent.run(prompt)
-            # Ensure the response is properly formatted as a dictionary
-            if isinstance(response, dict) and hasattr(response, 'content'):
-                return response.content
-            elif isinstance(response, str):
-                # If response is a string, try to parse it as JSON
+            response = await self._run_agent("web_scraping_agent", prompt)
+            # Structured outputs come back as a WebScrapingResponse; plain text may still be JSON
+            content = getattr(response, 'content', response)
+            if hasattr(content, "model_dump"):
+                content = content.model_dump()
+            elif isinstance(content, str):
                 try:
-                    return json.loads(response)
+                    content = json.loads(content)
                 except json.JSONDecodeError:
-                    # If parsing fails, return default structure
-                    pass
+                    content = None
+            if isinstance(content, dict):
+                return content
             
             # If we get here, return default structure
+            self._use_fallback("web_scraping")
             return {
-                "company_overview": f"{company_data['name']} is a company in the {company_data['market_category']} market.",
+                "company_overview": (page and page["description"]) or f"{company_data['name']} is a company in the {company_data['market_category']} market.",
                 "products": [company_data['product_description']],
                 "target_audience": "Small to medium businesses",
                 "pricing": "Competitive pricing model",
@@ -523,9 +748,10 @@ class AgentOrchestrator:
                 "technology": "Modern tech stack"
             }
         except Exception as e:
-            print(f"Error in web scraping agent: {str(e)}")
+            logger.warning("Web scraping agent failed, using fallback", error=str(e))
+            self._use_fallback("web_scraping")
             return {
-                "company_overview": f"{company_data['name']} is a company in the {company_data['market_category']} market.",
+                "company_overview": (page and page["description"]) or f"{company_data['name']} is a company in the {company_data['market_category']} market.",
                 "products": [company_data['product_description']],
                 "target_audience": "Small to medium businesses",
                 "pricing": "Competitive pricing model",
@@ -534,17 +760,39 @@ class AgentOrchestrator:
             }
 
     async def _run_competitor_research_agent(self, company_data: Dict[str, Any], website_data: Dict[str, Any]) -> list:
+        if not self.competitor_kb.enabled:
+            return await self._research_competitors(company_data)
+
+        # Seed from competitors already known in this category; the agent only fills gaps
+        own_domain = domain_of(company_data['website_url'])
+        known = await self.competitor_kb.seed(company_data['market_category'], exclude_domains=[own_domain])
+        if len(known) >= self.competitor_kb.min_seed:
+            return known
+        output = await self._research_competitors(company_data, known)
+        if _used_fallback.get():
+            return known or output
+        found = [competitor for competitor in competitor_list(output) if domain_of(competitor.get("website")) != own_domain]
         try:
+            await self.competitor_kb.record(company_data['market_category'], found, exclude_domains=[own_domain])
+        except Exception as e:
+            logger.warning("Failed to record competitors", error=str(e))
+        return merge_competitors(known, found)
+
+    async def _research_competitors(self, company_data: Dict[str, Any], known: Optional[list] = None):
+        try:
+            known_names = ", ".join(competitor["name"] for competitor in known or [])
             prompt = f"""
             Find competitors of {company_data['name']} in the {company_data['market_category']} space.
+            {f"Already known (find others): {known_names}" if known_names else ""}
             """
 
-            response = self.competitor_research_agent.run(prompt)
+            response = await self._run_agent("competitor_research_agent", prompt)
             return response.content
             
 
         except Exception as e:
-            print(f"Error in competitor research agent: {str(e)}")
+            logger.warning("Competitor research agent failed, using fallback", error=str(e))
+            self._use_fallback("competitor_research")
             return [
                 {
                     "name": "Competitor A",
@@ -569,6 +817,28 @@ class AgentOrchestrator:
                 }
             ]
 
+    async def _category_trends(self, analysis_id: str, company_data: Dict[str, Any], website_data: Dict[str, Any],
+                               competitors: list) -> list:
+        """The market's trends from its precomputed category report, else from the trend agent"""
+        report = self.trend_precompute.lookup(company_data['market_category'])
+        if report is not None:
+            self._mark_step(analysis_id, "trend_prediction", precomputed=True, computed_at=report["computed_at"])
+            return report["trends"]
+        trends = await self._run_trend_prediction_agent(company_data, website_data, competitors)
+        if not _used_fallback.get():
+            self.trend_precompute.store(company_data['market_category'], to_jsonable(trends))
+        return trends
+
+    async def _compute_category_trends(self, market_category: str) -> Optional[list]:
+        """Trends for a category outside any analysis (for the precompute job); None if the agent failed"""
+        token = _used_fallback.set(False)
+        try:
+            with tracer.start_span("trend_precompute", {"market_category": market_category}):
+                trends = await self._run_trend_prediction_agent({"market_category": market_category}, {}, [])
+            return None if _used_fallback.get() else to_jsonable(trends)
+        finally:
+            _used_fallback.reset(token)
+
     async def _run_trend_prediction_agent(self, company_data: Dict[str, Any], website_data: Dict[str, Any], competitors: list) -> list:
         try:
             prompt = f"""
@@ -580,20 +850,25 @@ class AgentOrchestrator:
             
             Ensure the response is in valid JSON format with these exact field names.
             """
-            response = self.trend_prediction_agent.run(prompt)
+            response = await self._run_agent("trend_prediction_agent", prompt)
             
-            # Handle different response formats
-            if isinstance(response, dict):
-                if hasattr(response, 'content'):
-                    return response.content
-                return response
-            elif isinstance(response, str):
+            # Handle different response formats: structured output (one trend or a list), a dict or JSON text
+            content = getattr(response, 'content', response)
+            if isinstance(content, str):
                 try:
-                    return json.loads(response)
+                    content = json.loads(content)
                 except json.JSONDecodeError:
-                    pass
+                    content = None
+            trends = [
+                item.model_dump() if hasattr(item, 'model_dump') else item
+                for item in (content if isinstance(content, list) else [content])
+            ]
+            trends = [trend for trend in trends if isinstance(trend, dict) and trend.get("trend")]
+            if trends:
+                return trends
                     
             # Default response if parsing fails
+            self._use_fallback("trend_prediction")
             return [
                 {
                     "trend": "AI-Powered Features",
@@ -612,7 +887,8 @@ class AgentOrchestrator:
                 }
             ]
         except Exception as e:
-            print(f"Error in trend prediction agent: {str(e)}")
+            logger.warning("Trend prediction agent failed, using fallback", error=str(e))
+            self._use_fallback("trend_prediction")
             return [
                 {
                     "trend": "AI-Powered Features",
@@ -634,9 +910,13 @@ class AgentOrchestrator:
 
             {user_context}
             """
-            response = self.market_positioning_agent.run(prompt)
-            return response.content
+            response = await self._run_agent("market_positioning_agent", prompt)
+            # Structured outputs come back as a MarketPositioningResponse; run_analysis reads it as a dict
+            content = response.content
+            return content.model_dump() if hasattr(content, "model_dump") else content
         except Exception as e:
+            logger.warning("Market positioning agent failed, using fallback", error=str(e))
+            self._use_fallback("market_positioning")
             return {
                 "strategy": f"Position {company_data['name']} as a modern, user-first solution built for growth.",
                 "market_gaps": ["Lack of mobile-first tools", "Limited smart automation"],
@@ -667,6 +947,11 @@ class AgentOrchestrator:
                 if step_data["name"] == step:
                     step_data["status"] = status
                     step_data["progress"] = progress
+                    if status == "in_progress":
+                        step_data["started_at"] = time.time()
+                    elif "started_at" in step_data:
+                        step_data["duration"] = round(time.time() - step_data["started_at"], 3)
+                        STAGE_DURATION.labels(step, status).observe(step_data["duration"])
                     break
             
             # Update current step
@@ -682,7 +967,7 @@ class AgentOrchestrator:
                 try:
                     await callback(step, progress, status, f"Step {step} {status}")
                 except Exception as e:
-                    print(f"Progress callback failed: {e}")
+                    logger.warning("Progress callback failed", step=step, error=str(e))
 
     def cleanup_analysis(self, analysis_id: str):
         """Clean up analysis tracking data"""
@@ -694,10 +979,121 @@ class AgentOrchestrator:
         analysis_id: str, 
         style: str, 
         duration: int, 
-        user_id: str
+        user_id: str,
+        context: Optional[Dict[str, Any]] = None,
+        cacheable: bool = False
     ) -> str:
         """Generate a marketing script based on analysis results"""
-        # Mock marketing script generation
+        chunks = []
+        async for chunk in self.stream_marketing_script(analysis_id, style, duration, context, cacheable):
+            chunks.append(chunk)
+        return "".join(chunks).strip()
+
+    async def stream_marketing_script(
+        self,
+        analysis_id: str,
+        style: str,
+        duration: int,
+        context: Optional[Dict[str, Any]] = None,
+        cacheable: bool = False
+    ) -> AsyncIterator[str]:
+        """Stream a marketing script written by the LLM from the analysis context.
+
+        Scripts are cached per (analysis_id, style, duration) when cacheable
+        (the context comes from a completed analysis); a cache hit is
+        yielded as a single chunk. Without an analysis context or OpenAI key,
+        or if the model fails before producing any text, the style's template
+        is used instead (and not cached).
+        """
+        cache_key = (analysis_id, style, duration)
+        cached = self.script_cache.get(cache_key) if cacheable else None
+        if cached is not None:
+            yield cached
+            return
+
+        if not context or not os.getenv("OPENAI_API_KEY"):
+            FALLBACKS_USED.labels("marketing_script").inc()
+            yield self._template_script(style, duration)
+            return
+
+        chunks = []
+        try:
+            async for chunk in self._stream_script_completion(self._script_prompt(context, style, duration), duration):
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            if chunks:
+                raise
+            logger.warning("Script generation failed, using template", analysis_id=analysis_id, error=str(e))
+            FALLBACKS_USED.labels("marketing_script").inc()
+            yield self._template_script(style, duration)
+            return
+
+        if cacheable:
+            self.script_cache.set(cache_key, "".join(chunks).strip())
+
+    def _script_prompt(self, context: Dict[str, Any], style: str, duration: int) -> str:
+        def as_list(value) -> list:
+            # Structured agent outputs are stored as a single object rather than a list
+            return [value] if isinstance(value, dict) else list(value or [])
+
+        competitors = ", ".join(
+            c.get("name", "") for c in as_list(context.get("competitors")) if isinstance(c, dict)
+        ) or "unknown"
+        trends = "; ".join(
+            t.get("trend", "") for t in as_list(context.get("market_trends")) if isinstance(t, dict)
+        ) or "none identified"
+        return f"""
+        Write a {style} voice-over script for a {duration}-second marketing video
+        (about {int(duration * WORDS_PER_SECOND)} words) for {context.get('name', 'the company')}.
+
+        Product: {context.get('product_description', '')}
+        Market: {context.get('market_category', '')}
+        Competitors: {competitors}
+        Market trends: {trends}
+        Market gaps it fills: {'; '.join(map(str, as_list(context.get('market_gaps'))))}
+        Competitive advantages: {'; '.join(map(str, as_list(context.get('competitive_advantages'))))}
+        Positioning: {context.get('positioning_strategy', '')}
+
+        Return only the spoken script as plain text, without headings, scene directions or quotes.
+        """
+
+    async def _stream_script_completion(self, prompt: str, duration: int) -> AsyncIterator[str]:
+        client = self._openai_client()
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            stream = await client.chat.completions.create(
+                model=os.getenv("OPENAI_SCRIPT_MODEL", "gpt-4o-mini"),
+                messages=[
+                    {"role": "system", "content": "You are a copywriter for short product marketing videos."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.8,
+                max_tokens=int(duration * WORDS_PER_SECOND * 2) + 50,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            async for event in stream:
+                if event.usage:
+                    LLM_TOKENS.labels("script_generator", "input").inc(event.usage.prompt_tokens)
+                    LLM_TOKENS.labels("script_generator", "output").inc(event.usage.completion_tokens)
+                if event.choices and event.choices[0].delta.content:
+                    yield event.choices[0].delta.content
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            PROVIDER_LATENCY.labels("openai", "script_generator", status).observe(time.perf_counter() - start)
+
+    def _openai_client(self):
+        if self._openai is None:
+            from openai import AsyncOpenAI
+            self._openai = AsyncOpenAI()
+        return self._openai
+
+    def _template_script(self, style: str, duration: int) -> str:
+        """Canned script for a style, trimmed to the duration"""
         script_templates = {
             "professional": f"""
             Welcome to our comprehensive solution for modern businesses. 
@@ -746,8 +1142,7 @@ class AgentOrchestrator:
         template = script_templates.get(style, script_templates["professional"])
         
         # Adjust length based on duration (rough estimate)
-        words_per_second = 2.5
-        target_words = int(duration * words_per_second)
+        target_words = int(duration * WORDS_PER_SECOND)
         
         # Simple length adjustment
         if target_words < 50:
@@ -757,31 +1152,101 @@ class AgentOrchestrator:
         
         return template.strip()
 
-    async def generate_images(self, script: str, company_name: str, style: str = "professional") -> list:
-        """Generate marketing images based on script"""
-        # Mock image generation
-        return [
-            {
-                "url": "https://via.placeholder.com/800x600/4F46E5/FFFFFF?text=Marketing+Image+1",
-                "prompt": f"Professional marketing image for {company_name}",
-                "timestamp": 0,
-                "source": "mock"
-            },
-            {
-                "url": "https://via.placeholder.com/800x600/7C3AED/FFFFFF?text=Marketing+Image+2", 
-                "prompt": f"Modern business concept for {company_name}",
-                "timestamp": 1,
-                "source": "mock"
-            },
-            {
-                "url": "https://via.placeholder.com/800x600/059669/FFFFFF?text=Marketing+Image+3",
-                "prompt": f"Success and growth visualization for {company_name}",
-                "timestamp": 2,
-                "source": "mock"
-            }
-        ]
+    async def generate_images(
+        self, script: str, company_name: str, style: str = "professional", count: int = 3, storage=None
+    ) -> list:
+        """Generate marketing images based on script (stored via `storage` when given)"""
+        return await self.image_pipeline.generate(script, company_name, style, count, storage)
+
+    def stream_images(
+        self, script: str, company_name: str, style: str = "professional", count: int = 3, storage=None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield marketing images as each one is generated and stored"""
+        return self.image_pipeline.stream(script, company_name, style, count, storage)
+
+    async def generate_audio(self, script: str, voice: str = "professional_male", storage=None) -> Optional[str]:
+        """Generate the voice-over for a script and return its URL (stored via `storage` when given)"""
+        result = await self.tts_pipeline.synthesize(script, voice, storage)
+        return result["audio_url"]
+
+    def stream_audio(self, script: str, voice: str = "professional_male") -> AsyncIterator[bytes]:
+        """Yield voice-over MP3 chunks in script order as they are synthesized"""
+        return self.tts_pipeline.stream(script, voice)
+
+    async def run_asset_generation(
+        self,
+        asset_id: str,
+        analysis_id: str,
+        context: Dict[str, Any],
+        user_id: str,
+        storage,
+        style: str = "professional",
+        duration: int = 30,
+        voice: str = "professional_male",
+        image_count: int = 3,
+        progress_callback: Optional[Callable] = None
+    ) -> Dict[str, Any]:
+        """Generate a marketing asset as a DAG: script, then images and audio in parallel.
+
+        Each node writes its output to the asset record as soon as it finishes.
+        A failed media branch does not cancel the other one; the asset ends as
+        "partial" instead of "completed".
+        """
+        self.progress_tracking[asset_id] = {
+            "current_step": "script",
+            "progress": 0,
+            "steps": [
+                {"name": "script", "status": "pending", "progress": 0},
+                {"name": "images", "status": "pending", "progress": 0},
+                {"name": "audio", "status": "pending", "progress": 0}
+            ]
+        }
+
+        try:
+            with tracer.start_span("asset.script", {"asset.id": asset_id}), activity("asset.script"):
+                await self._update_progress(asset_id, "script", 0, "in_progress", progress_callback)
+                await storage.update_marketing_asset(asset_id, {"status": "generating_script"})
+                script = await self.generate_marketing_script(
+                    analysis_id, style, duration, user_id, context, cacheable=context.get("cacheable", False)
+                )
+                await storage.update_marketing_asset(asset_id, {"script_content": script, "status": "generating_media"})
+                await self._update_progress(asset_id, "script", 100, "completed", progress_callback)
+        except Exception as e:
+            await self._update_progress(asset_id, "script", 0, "failed", progress_callback)
+            self.progress_tracking[asset_id]["current_step"] = "failed"
+            self.progress_tracking[asset_id]["error"] = str(e)
+            raise
+
+        async def images_branch():
+            with tracer.start_span("asset.images", {"asset.id": asset_id}), activity("asset.images"):
+                images = await self.generate_images(script, context.get("name", ""), style, image_count, storage)
+                if not any(image.get("url") for image in images):
+                    raise Exception(images[0].get("error", "No images generated") if images else "No images generated")
+                # Prompts are long and only needed for generation; the stored list keeps the rest
+                stored = [{key: value for key, value in image.items() if key != "prompt"} for image in images]
+                await storage.update_marketing_asset(asset_id, {"images": json.dumps(stored)})
+                return images
+
+        async def audio_branch():
+            with tracer.start_span("asset.audio", {"asset.id": asset_id}), activity("asset.audio"):
+                audio_url = await self.generate_audio(script, voice, storage)
+                await storage.update_marketing_asset(asset_id, {"audio_url": audio_url})
+                return audio_url
+
+        async def run_branch(step: str, branch: Callable):
+            await self._update_progress(asset_id, step, 0, "in_progress", progress_callback)
+            try:
+                output = await branch()
+            except Exception as e:
+                logger.error("Asset step failed", asset_id=asset_id, step=step, error=str(e))
+                await self._update_progress(asset_id, step, 0, "failed", progress_callback)
+                return None
+            await self._update_progress(asset_id, step, 100, "completed", progress_callback)
+            return output
+
+        images, audio_url = await asyncio.gather(run_branch("images", images_branch), run_branch("audio", audio_branch))
 
-    async def generate_audio(self, script: str, voice: str = "professional_male") -> Optional[str]:
-        """Generate audio from script"""
-        # Mock audio generation
-        return "https://via.placeholder.com/audio/mock-audio-file.mp3" 
\ No newline at end of file
+        status = "completed" if images is not None and audio_url is not None else "partial"
+        await storage.update_marketing_asset(asset_id, {"status": status})
+        self.progress_tracking[asset_id]["current_step"] = status
+        return {"status": status, "script": script, "images": images or [], "audio_url": audio_url} 
\ No newline at end of file
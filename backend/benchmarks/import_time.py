@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check for the API process
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter and fails
+if the cumulative import time of `main` exceeds the budget, or if any module
+that should be deferred (Agno, OpenAI, Tavily, numpy) is imported at startup.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 500 --runs 5
+"""
+
+import os
+import re
+import sys
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported on first use, never by `import main`
+DEFERRED_MODULES = ["agno", "openai", "tavily", "numpy"]
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure_once(target: str) -> Dict[str, Tuple[int, int]]:
+    """Return {module: (self_us, cumulative_us)} for one cold import of target"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(BACKEND_DIR), BACKEND_DIR, env.get("PYTHONPATH", "")]
+    ).rstrip(os.pathsep)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {target} failed:\n{proc.stderr[-2000:]}")
+
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the API import-time budget")
+    parser.add_argument("--target", default="main", help="module to import (default: main)")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", "750")))
+    parser.add_argument("--runs", type=int, default=3, help="take the best of N cold imports")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest modules to print")
+    args = parser.parse_args()
+
+    runs = [measure_once(args.target) for _ in range(args.runs)]
+    best = min(runs, key=lambda modules: modules.get(args.target, (0, 0))[1])
+    total_ms = best.get(args.target, (0, 0))[1] / 1000
+
+    print(f"import {args.target}: {total_ms:.1f} ms (best of {args.runs}, budget {args.budget_ms:.0f} ms)")
+    slowest: List[Tuple[str, int]] = sorted(
+        ((name, timings[0]) for name, timings in best.items()), key=lambda item: item[1], reverse=True
+    )[:args.top]
+    for name, self_us in slowest:
+        print(f"   {self_us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms exceeds budget of {args.budget_ms:.0f} ms")
+    eager = sorted({name.split(".")[0] for name in best if name.split(".")[0] in DEFERRED_MODULES})
+    if eager:
+        failures.append(f"deferred modules imported at startup: {', '.join(eager)}")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+    print("✅ Import-time budget met")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark for the analysis pipeline
+
+Drives POST /api/analyze-company -> GET progress (polling) -> GET results
+against the real FastAPI app in-process, with OpenAI/Tavily replaced by
+deterministic stub agents and storage backed by the embedded SQLite backend
+wrapped in Appwrite-like latency. Reports end-to-end latency percentiles,
+analyses/minute at N concurrent users, event-loop lag and memory growth, and
+can save or compare against baselines in benchmarks/baselines/.
+
+    python -m benchmarks.pipeline --users 8 --analyses-per-user 3
+    python -m benchmarks.pipeline --openai 800:200:0.02 --save-baseline default
+    python -m benchmarks.pipeline --compare default --tolerance 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import platform
+import tracemalloc
+from typing import Dict, Any, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(BACKEND_DIR, "benchmarks", "baselines")
+
+# Metrics compared against baselines: (key, higher_is_better)
+COMPARED_METRICS = [
+    ("latency_p50_s", False),
+    ("latency_p95_s", False),
+    ("latency_p99_s", False),
+    ("analyses_per_minute", True),
+    ("loop_lag_p99_ms", False)
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for an empty list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class LoopLagSampler:
+    """Measures how late a periodic asyncio.sleep wakes up"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples_ms: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples_ms.append(max(0.0, (loop.time() - start - self.interval) * 1000))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def configure_environment(args):
+    """Point the app at a throwaway SQLite store before main is imported"""
+    state_dir = tempfile.mkdtemp(prefix="competeiq-bench-")
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(state_dir, "bench.db")
+    os.environ["LOCAL_STATE_DIR"] = state_dir
+    os.environ.setdefault("AGENT_WARMUP", "false")
+    # Bench companies have made-up domains; don't try to fetch them
+    os.environ.setdefault("WEBSITE_FETCH", "false")
+    # Every run measures the full agent pipeline, not knowledge-base lookups
+    os.environ.setdefault("COMPETITOR_KB", "false")
+    os.environ.setdefault("TREND_PRECOMPUTE", "false")
+    # The bench saturates the loop on purpose; measure it rather than shed on it
+    os.environ["ADMISSION_MAX_LOOP_LAG_MS"] = "0"
+    for path in (os.path.dirname(BACKEND_DIR), BACKEND_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+async def run_user(client, user: str, analyses: int, poll_interval: float, timeout: float,
+                   latencies: List[float], errors: List[str], priority: str = "interactive", first_index: int = 0):
+    """One simulated user running analyses back to back"""
+    for index in range(first_index, first_index + analyses):
+        started = time.perf_counter()
+        try:
+            response = await client.post("/api/analyze-company", headers={"Authorization": f"Bearer {user}"}, json={
+                "name": f"Bench Co {user}-{index}",
+                "website_url": f"https://bench-{user}-{index}.example",
+                "product_description": "Collaboration software for small teams",
+                "market_category": "Productivity SaaS",
+                "user_name": user,
+                "priority": priority,
+                # Abandoned analyses are cancelled server-side rather than left running
+                "deadline_seconds": timeout
+            })
+            response.raise_for_status()
+            analysis_id = response.json()["analysis_id"]
+
+            status = "pending"
+            while status not in ("completed", "failed", "cancelled"):
+                if time.perf_counter() - started > timeout:
+                    raise TimeoutError(f"analysis {analysis_id} did not finish within {timeout}s")
+                await asyncio.sleep(poll_interval)
+                progress = await client.get(f"/api/analysis/{analysis_id}/progress")
+                progress.raise_for_status()
+                status = progress.json()["status"]
+
+            if status != "completed":
+                raise RuntimeError(f"analysis {analysis_id} ended as {status}")
+            results = await client.get(f"/api/analysis/{analysis_id}")
+            results.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    import httpx
+    import main
+    from fastapi import Depends
+    from benchmarks.stubs import LatencyProfile, StubRandom, StubStorage, install_stubs
+
+    rng = StubRandom(args.seed)
+    install_stubs(
+        main.agent_orchestrator, rng,
+        openai=LatencyProfile.parse(args.openai),
+        tavily=LatencyProfile.parse(args.tavily)
+    )
+    await main.storage.initialize()
+    main.storage = StubStorage(
+        main.storage, rng, LatencyProfile.parse(args.appwrite), blocking=not args.async_storage
+    )
+    # Built at import around the real storage; stage results must pay the stub latency too
+    main.stage_store.storage = main.storage
+
+    # Each simulated user authenticates with its own name as the token
+    async def bench_user(token: str = Depends(main.request_token)) -> Dict[str, Any]:
+        return {"$id": token, "name": token}
+    main.app.dependency_overrides[main.current_user] = bench_user
+
+    latencies: List[float] = []
+    batch_latencies: List[float] = []
+    errors: List[str] = []
+    sampler = LoopLagSampler()
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    sampler.start()
+    main.loop_monitor.start()
+    started = time.perf_counter()
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Batch users submit all their analyses at once, alongside the interactive users
+        await asyncio.gather(*[
+            run_user(client, f"bench-user-{user}", args.analyses_per_user, args.poll_interval,
+                     args.timeout, latencies, errors)
+            for user in range(args.users)
+        ], *[
+            run_user(client, f"bench-batch-{user}", 1, args.poll_interval, args.timeout,
+                     batch_latencies, errors, priority="batch", first_index=index)
+            for user in range(args.batch_users)
+            for index in range(args.batch_analyses)
+        ])
+
+    elapsed = time.perf_counter() - started
+    await sampler.stop()
+    await main.loop_monitor.stop()
+    memory_after, memory_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "config": {
+            "users": args.users,
+            "analyses_per_user": args.analyses_per_user,
+            "openai": args.openai,
+            "tavily": args.tavily,
+            "appwrite": args.appwrite,
+            "async_storage": args.async_storage,
+            "batch_users": args.batch_users,
+            "batch_analyses": args.batch_analyses,
+            "seed": args.seed,
+            "python": platform.python_version()
+        },
+        "completed": len(latencies) + len(batch_latencies),
+        "failed": len(errors),
+        "elapsed_s": round(elapsed, 3),
+        "latency_p50_s": round(percentile(latencies, 50), 3),
+        "latency_p95_s": round(percentile(latencies, 95), 3),
+        "latency_p99_s": round(percentile(latencies, 99), 3),
+        "batch_latency_p95_s": round(percentile(batch_latencies, 95), 3),
+        "analyses_per_minute": round((len(latencies) + len(batch_latencies)) / elapsed * 60, 2) if elapsed else 0.0,
+        "loop_lag_p50_ms": round(percentile(sampler.samples_ms, 50), 2),
+        "loop_lag_p99_ms": round(percentile(sampler.samples_ms, 99), 2),
+        "loop_lag_max_ms": round(max(sampler.samples_ms, default=0.0), 2),
+        "memory_growth_kb": round((memory_after - memory_before) / 1024, 1),
+        "memory_peak_kb": round(memory_peak / 1024, 1),
+        "blocking_sites": [
+            f"{o['activity']} @ {o['site']}: {o['count']}x, {o['total_ms']}ms"
+            for o in main.loop_monitor.summary()["offenders"][:5]
+        ],
+        "errors": sorted(set(errors))[:10]
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    config = report["config"]
+    print(f"Analysis pipeline benchmark: {config['users']} users x {config['analyses_per_user']} analyses")
+    print(f"   - Providers: openai={config['openai']} tavily={config['tavily']} appwrite={config['appwrite']}")
+    print(f"   - Completed: {report['completed']}, failed: {report['failed']} in {report['elapsed_s']}s")
+    print(f"   - Latency p50/p95/p99: {report['latency_p50_s']}s / {report['latency_p95_s']}s / {report['latency_p99_s']}s")
+    if config.get("batch_users"):
+        print(f"   - Batch load: {config['batch_users']} users x {config['batch_analyses']} analyses, "
+              f"p95 {report['batch_latency_p95_s']}s (latencies above are interactive only)")
+    print(f"   - Throughput: {report['analyses_per_minute']} analyses/min")
+    print(f"   - Event-loop lag p50/p99/max: {report['loop_lag_p50_ms']} / {report['loop_lag_p99_ms']} / {report['loop_lag_max_ms']} ms")
+    print(f"   - Memory growth: {report['memory_growth_kb']} KiB (peak {report['memory_peak_kb']} KiB)")
+    if report.get("blocking_sites"):
+        print("   - Top event-loop blocking sites:")
+        for site in report["blocking_sites"]:
+            print(f"       {site}")
+    for error in report["errors"]:
+        print(f"   ! {error}")
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return regressions beyond tolerance (a fraction, e.g. 0.2 for 20%)"""
+    regressions = []
+    # Any analysis lost is a regression, whatever the tolerance
+    for key, higher_is_better in (("completed", True), ("failed", False)):
+        old, new = baseline.get(key, 0), report.get(key, 0)
+        regressed = new < old if higher_is_better else new > old
+        print(f" {'❌' if regressed else '  '} {key}: {old} -> {new}")
+        if regressed:
+            regressions.append(key)
+    for key, higher_is_better in COMPARED_METRICS:
+        old, new = baseline.get(key), report.get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        marker = "❌" if regressed else "  "
+        print(f" {marker} {key}: {old} -> {new} ({change:+.1%})")
+        if regressed:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end analysis pipeline benchmark")
+    parser.add_argument("--users", type=int, default=4, help="concurrent users")
+    parser.add_argument("--analyses-per-user", type=int, default=3)
+    parser.add_argument("--openai", default="200:50:0", help="OpenAI latency mean:jitter ms:error_rate")
+    parser.add_argument("--tavily", default="100:30:0", help="Tavily latency mean:jitter ms:error_rate")
+    parser.add_argument("--appwrite", default="20:5:0", help="Appwrite latency mean:jitter ms:error_rate")
+    parser.add_argument("--batch-users", type=int, default=0, help="users submitting batch analyses all at once")
+    parser.add_argument("--batch-analyses", type=int, default=10, help="analyses per batch user")
+    parser.add_argument("--async-storage", action="store_true", help="model storage calls as non-blocking")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="progress polling interval (s)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="per-analysis timeout (s)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--save-baseline", metavar="NAME", help="save the report as a named baseline")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a named baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression fraction")
+    parser.add_argument("--json", action="store_true", help="print the raw JSON report")
+    args = parser.parse_args()
+
+    configure_environment(args)
+    report = asyncio.run(run_benchmark(args))
+    print(json.dumps(report, indent=2)) if args.json else print_report(report)
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {path}")
+
+    if args.compare:
+        path = os.path.join(BASELINE_DIR, f"{args.compare}.json")
+        with open(path) as f:
+            baseline = json.load(f)
+        baseline_config = baseline.get("config", {})
+        differing = sorted(key for key in set(baseline_config) | set(report["config"])
+                           if baseline_config.get(key) != report["config"].get(key))
+        if differing:
+            print(f"⚠️  Baseline was recorded with a different configuration: {', '.join(differing)}")
+        regressions = compare_to_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
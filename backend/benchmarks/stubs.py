@@ -0,0 +1,193 @@
+"""
+Deterministic provider stubs for benchmarks
+
+StubAgent stands in for an Agno agent (OpenAI model + Tavily tools) and
+StubStorage wraps a StorageBackend to add Appwrite-like latency. Latency and
+error injection are driven by a seeded RNG so runs are reproducible.
+
+Like the real Agno `agent.run` and Appwrite SDK calls, stub latency blocks the
+calling thread (`StubAgent.arun` and StubStorage(blocking=False) model fully
+async providers instead).
+"""
+
+import time
+import random
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from models.schemas import (
+    WebScrapingResponse,
+    CompetitorInfoResponse,
+    MarketTrendResponse,
+    MarketPositioningResponse
+)
+
+
+class StubProviderError(Exception):
+    """Injected provider failure"""
+
+
+@dataclass
+class LatencyProfile:
+    """Latency (milliseconds) and error injection for one provider"""
+    mean_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyProfile":
+        """Parse "mean[:jitter[:error_rate]]", e.g. "800:200:0.02" """
+        parts = [float(part) for part in spec.split(":")] if spec else []
+        return cls(*parts)
+
+
+class StubRandom:
+    """Thread-safe seeded RNG shared by all stubs of a run"""
+
+    def __init__(self, seed: int):
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, profile: LatencyProfile) -> float:
+        with self._lock:
+            jitter = self._random.uniform(-profile.jitter_ms, profile.jitter_ms) if profile.jitter_ms else 0.0
+        return max(0.0, profile.mean_ms + jitter) / 1000
+
+    def fails(self, profile: LatencyProfile) -> bool:
+        if not profile.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < profile.error_rate
+
+
+@dataclass
+class StubRunResponse:
+    """Minimal stand-in for Agno's RunResponse"""
+    content: Any
+    metrics: Dict[str, Any] = field(default_factory=dict)
+    tools: List[Dict[str, Any]] = field(default_factory=list)
+
+
+# Canned structured outputs, one per agent
+STUB_CONTENT = {
+    "web_scraping_agent": lambda: WebScrapingResponse(
+        company_overview="Stub Co builds collaboration software for small teams.",
+        products=["Stub Workspace", "Stub Chat"],
+        target_audience="Small and medium businesses",
+        pricing="Per-seat subscription",
+        features=["Real-time editing", "Integrations"],
+        technology="Cloud-native SaaS"
+    ),
+    "competitor_research_agent": lambda: CompetitorInfoResponse(
+        name="Competitor A",
+        website="https://competitor-a.example",
+        market_share=30.0,
+        strengths=["Brand recognition"],
+        weaknesses=["High pricing"]
+    ),
+    "trend_prediction_agent": lambda: MarketTrendResponse(
+        trend="AI-assisted workflows",
+        impact="High",
+        confidence=80
+    ),
+    "market_positioning_agent": lambda: MarketPositioningResponse(
+        strategy="Position as the simplest collaboration suite for growing teams.",
+        market_gaps=["Affordable AI features"],
+        advantages=["Ease of use"]
+    )
+}
+
+
+class StubAgent:
+    """Emulates `Agent.run`: one OpenAI completion plus optional Tavily searches"""
+
+    def __init__(
+        self,
+        name: str,
+        rng: StubRandom,
+        openai: LatencyProfile,
+        tavily: Optional[LatencyProfile] = None,
+        tavily_calls: int = 1
+    ):
+        self.name = name
+        self.rng = rng
+        self.openai = openai
+        self.tavily = tavily
+        self.tavily_calls = tavily_calls if tavily else 0
+        self.calls = 0
+
+    def _call_providers(self):
+        for _ in range(self.tavily_calls):
+            time.sleep(self.rng.delay(self.tavily))
+            if self.rng.fails(self.tavily):
+                raise StubProviderError(f"{self.name}: injected Tavily error")
+        time.sleep(self.rng.delay(self.openai))
+        if self.rng.fails(self.openai):
+            raise StubProviderError(f"{self.name}: injected OpenAI error")
+
+    def _response(self) -> StubRunResponse:
+        self.calls += 1
+        return StubRunResponse(
+            content=STUB_CONTENT[self.name](),
+            metrics={"input_tokens": [350], "output_tokens": [120], "total_tokens": [470]},
+            tools=[{"tool_name": "web_search_using_tavily"} for _ in range(self.tavily_calls)]
+        )
+
+    def run(self, prompt: str, **kwargs) -> StubRunResponse:
+        self._call_providers()
+        return self._response()
+
+    async def arun(self, prompt: str, **kwargs) -> StubRunResponse:
+        for _ in range(self.tavily_calls):
+            await asyncio.sleep(self.rng.delay(self.tavily))
+            if self.rng.fails(self.tavily):
+                raise StubProviderError(f"{self.name}: injected Tavily error")
+        await asyncio.sleep(self.rng.delay(self.openai))
+        if self.rng.fails(self.openai):
+            raise StubProviderError(f"{self.name}: injected OpenAI error")
+        return self._response()
+
+
+class StubStorage:
+    """Wraps a StorageBackend, adding Appwrite-like latency and errors to every call"""
+
+    def __init__(self, backend, rng: StubRandom, profile: LatencyProfile, blocking: bool = True):
+        self._backend = backend
+        self._rng = rng
+        self._profile = profile
+        self._blocking = blocking
+        self.calls = 0
+
+    def __getattr__(self, name: str):
+        target = getattr(self._backend, name)
+        if not callable(target) or not asyncio.iscoroutinefunction(target):
+            return target
+
+        async def call(*args, **kwargs):
+            self.calls += 1
+            delay = self._rng.delay(self._profile)
+            if self._blocking:
+                time.sleep(delay)
+            else:
+                await asyncio.sleep(delay)
+            if self._rng.fails(self._profile):
+                raise StubProviderError(f"injected storage error in {name}")
+            return await target(*args, **kwargs)
+
+        return call
+
+
+def install_stubs(
+    orchestrator,
+    rng: StubRandom,
+    openai: LatencyProfile,
+    tavily: LatencyProfile
+):
+    """Replace the orchestrator's Agno agents with stubs (agents are lazily built, so Agno is never imported)"""
+    tool_agents = {"web_scraping_agent", "competitor_research_agent", "market_positioning_agent"}
+    for name in orchestrator.AGENT_NAMES:
+        setattr(orchestrator, name, StubAgent(
+            name, rng, openai, tavily if name in tool_agents else None
+        ))
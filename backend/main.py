@@ -1,6 +1,6 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Depends
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import asyncio
@@ -9,15 +9,33 @@ from dotenv import load_dotenv
 import uuid
 from datetime import datetime
 import json
+import hmac
+import mimetypes
+import structlog
 
 # Import our modules
 from agents.agent_orchestrator import AgentOrchestrator
 from services.appwrite_service import AppwriteService
+from services.storage_backend import create_storage_backend
+from services import metrics
+from services.tracing import tracer, trace_id_for
+from services.loop_monitor import loop_monitor, activity, LoopMonitorMiddleware
+from services.logging_config import configure_logging
+from services.cache import TTLCache
+from services.auth import SessionAuthenticator
+from services.scheduler import FairScheduler
+from services.admission import AdmissionController
+from services.stage_store import StageStore
+from services.competitor_kb import category_key
+from services.profiling import analysis_profiles, memory_tracker, profile_analysis, profile_window
 from models.schemas import *
 
 # Load environment variables
 load_dotenv()
 
+configure_logging()
+logger = structlog.get_logger(__name__)
+
 app = FastAPI(title="CompeteIQ Backend API", version="1.0.0")
 
 # CORS middleware
@@ -29,13 +47,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Attribute event-loop stalls to the endpoint being served
+app.add_middleware(LoopMonitorMiddleware)
+
 # Initialize services
+# Appwrite always handles auth; persistence goes through the backend selected
+# by STORAGE_BACKEND (the same AppwriteService instance unless "sqlite").
 appwrite_service = AppwriteService()
+storage = create_storage_backend(appwrite_service)
 agent_orchestrator = AgentOrchestrator()
+authenticator = SessionAuthenticator(appwrite_service)
+analysis_scheduler = FairScheduler()
+admission = AdmissionController(analysis_scheduler, loop_monitor)
+stage_store = StageStore(storage)
 
 # WebSocket connections for real-time progress
 websocket_connections: Dict[str, WebSocket] = {}
 
+# Background analysis tasks in this process, so they can be cancelled
+analysis_tasks: Dict[str, asyncio.Task] = {}
+# Background asset jobs, kept referenced until done and cancelled on shutdown
+asset_tasks: Dict[str, asyncio.Task] = {}
+# Default deadline for analyses that don't set deadline_seconds (0 disables)
+ANALYSIS_DEADLINE_SECONDS = float(os.getenv("ANALYSIS_DEADLINE_SECONDS", "0"))
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+# Statuses of analyses a crashed or redeployed process may have left behind
+INTERRUPTED_STATUSES = ("pending", "in_progress")
+# Restart those at startup; only safe where no other replica may still be running them
+ANALYSIS_RESUME_ON_STARTUP = os.getenv("ANALYSIS_RESUME_ON_STARTUP", "false").lower() == "true"
+# Background agent warm-up (AGENT_WARMUP), kept so its errors are logged
+agent_warmup: Optional[asyncio.Future] = None
+# Set on shutdown: analyses cancelled from then on are left interrupted (resumable), not cancelled
+shutting_down = False
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -46,10 +90,122 @@ async def health_check():
     """Health check endpoint"""
     return {"message": "CompeteIQ Backend API is running", "status": "healthy"}
 
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 503 while this replica is saturated, so load balancers route new work elsewhere"""
+    state = admission.readiness()
+    if not state["ready"]:
+        return JSONResponse(status_code=503, content=state, headers={"Retry-After": str(state["retry_after"])})
+    return state
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus metrics endpoint"""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/loop")
+async def debug_loop(stalls: int = 10):
+    """Event-loop lag and blocking-call summary"""
+    return loop_monitor.summary(stalls=stalls)
+
+@app.get("/debug/scheduler")
+async def debug_scheduler():
+    """Analysis scheduler slots and queue depth"""
+    return analysis_scheduler.summary()
+
+@app.get("/debug/trends")
+async def debug_trends():
+    """Precomputed market trend reports: most-requested categories and report ages"""
+    return agent_orchestrator.trend_precompute.summary()
+
+# Admin-only diagnostics (require ADMIN_API_TOKEN in the X-Admin-Token header)
+async def verify_admin(x_admin_token: Optional[str] = Header(None)):
+    admin_token = os.getenv("ADMIN_API_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Admin API is disabled (ADMIN_API_TOKEN is not set)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.get("/debug/profile", dependencies=[Depends(verify_admin)])
+async def profile_process(seconds: float = 10.0, interval_ms: float = 5.0):
+    """Sample all threads for a time window; returns collapsed stacks for flamegraph.pl/speedscope"""
+    if not 0 < seconds <= 120 or not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="seconds must be in (0, 120] and interval_ms in [1, 1000]")
+    profiler = await profile_window(seconds, interval_ms / 1000)
+    return Response(content=profiler.collapsed(), media_type="text/plain")
+
+@app.post("/debug/profile/analyses", dependencies=[Depends(verify_admin)])
+async def arm_analysis_profiling(count: int = 1):
+    """Profile the next `count` analyses that start"""
+    if not 1 <= count <= 100:
+        raise HTTPException(status_code=400, detail="count must be between 1 and 100")
+    return {"armed": analysis_profiles.arm(count)}
+
+@app.get("/debug/profile/analyses", dependencies=[Depends(verify_admin)])
+async def list_analysis_profiles():
+    return {"armed": analysis_profiles.armed, "profiles": analysis_profiles.list()}
+
+@app.get("/debug/profile/analyses/{analysis_id}", dependencies=[Depends(verify_admin)])
+async def get_analysis_profile(analysis_id: str):
+    """Collapsed stacks captured while the analysis was running on the event loop"""
+    collapsed = await asyncio.get_running_loop().run_in_executor(None, analysis_profiles.get, analysis_id)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(content=collapsed, media_type="text/plain")
+
+@app.post("/debug/memory/start", dependencies=[Depends(verify_admin)])
+async def start_memory_tracking(frames: int = 25):
+    """Start tracemalloc; a snapshot is then taken after every analysis"""
+    memory_tracker.start(frames)
+    await asyncio.get_running_loop().run_in_executor(None, memory_tracker.snapshot, "baseline")
+    return {"tracing": memory_tracker.tracing, "snapshots": memory_tracker.list()}
+
+@app.post("/debug/memory/stop", dependencies=[Depends(verify_admin)])
+async def stop_memory_tracking():
+    memory_tracker.stop()
+    return {"tracing": memory_tracker.tracing}
+
+@app.get("/debug/memory/snapshots", dependencies=[Depends(verify_admin)])
+async def list_memory_snapshots():
+    return {"tracing": memory_tracker.tracing, "snapshots": memory_tracker.list()}
+
+@app.get("/debug/memory/diff", dependencies=[Depends(verify_admin)])
+async def diff_memory_snapshots(base: Optional[str] = None, target: Optional[str] = None,
+                                limit: int = 25, group_by: str = "lineno"):
+    """Top allocation growth between two snapshots (default: the last two)"""
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by must be lineno, filename or traceback")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: memory_tracker.diff(base, target, limit, group_by)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def log_warmup_result(future: asyncio.Future):
+    """Log a failed background agent warm-up (it is retried on first use)"""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Agent warm-up failed; agents will be built on first use", error=str(future.exception()))
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
+    loop_monitor.start()
+    agent_orchestrator.trend_precompute.start()
+
+    # Agents are built lazily on first use; optionally build them in the
+    # background so the first analysis doesn't pay for the Agno imports.
+    if os.getenv("AGENT_WARMUP", "false").lower() == "true":
+        global agent_warmup
+        agent_warmup = asyncio.get_running_loop().run_in_executor(None, agent_orchestrator.warm_up)
+        agent_warmup.add_done_callback(log_warmup_result)
+
     try:
+        if storage is not appwrite_service:
+            await storage.initialize()
+            if ANALYSIS_RESUME_ON_STARTUP:
+                asyncio.create_task(resume_interrupted_analyses())
+
         # Check if required environment variables are set
         required_vars = {
             "APPWRITE_API_KEY": os.getenv("APPWRITE_API_KEY"),
@@ -60,31 +216,59 @@ async def startup_event():
         missing_vars = [var for var, value in required_vars.items() if not value]
         
         if missing_vars:
-            print("⚠️  Warning: Missing required environment variables:")
-            for var in missing_vars:
-                print(f"   - {var}")
-            print("   Some features may not work properly.")
-            print("   Please set these variables in your .env file.")
+            logger.warning(
+                "Missing required environment variables; some features may not work properly. "
+                "Please set these variables in your .env file.",
+                missing=missing_vars
+            )
             return
         
-        await appwrite_service.initialize()
-        print("✅ Backend services initialized successfully")
+        # Appwrite's schema only needs verifying when it is the storage backend
+        await appwrite_service.initialize(verify_schema=storage is appwrite_service)
+        if storage is appwrite_service and ANALYSIS_RESUME_ON_STARTUP:
+            asyncio.create_task(resume_interrupted_analyses())
+        logger.info("Backend services initialized successfully")
         
     except Exception as e:
-        print(f"❌ Failed to initialize backend services: {e}")
-        print("   The server will start but some features may not work.")
-        print("   Please check your environment variables and API keys.")
+        logger.error(
+            "Failed to initialize backend services; the server will start but some features may not work. "
+            "Please check your environment variables and API keys.",
+            error=str(e)
+        )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background monitors and asset jobs on shutdown"""
+    global shutting_down
+    shutting_down = True
+    for task in list(asset_tasks.values()):
+        task.cancel()
+    await asyncio.gather(*asset_tasks.values(), return_exceptions=True)
+    await loop_monitor.stop()
+    await agent_orchestrator.trend_precompute.stop()
+    await agent_orchestrator.website_fetcher.close()
+    agent_orchestrator.competitor_kb.close()
+    agent_orchestrator.request_index.flush()
+    storage.close()
 
 @app.websocket("/ws/analysis/{analysis_id}")
 async def websocket_endpoint(websocket: WebSocket, analysis_id: str):
     await websocket.accept()
     websocket_connections[analysis_id] = websocket
+    metrics.WEBSOCKET_CONNECTIONS.inc()
     try:
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
         if analysis_id in websocket_connections:
             del websocket_connections[analysis_id]
+    finally:
+        metrics.WEBSOCKET_CONNECTIONS.dec()
+
+@app.websocket("/ws/assets/{asset_id}")
+async def asset_websocket_endpoint(websocket: WebSocket, asset_id: str):
+    # Asset jobs report progress on the same channel, keyed by asset_id
+    await websocket_endpoint(websocket, asset_id)
 
 async def send_progress_update(analysis_id: str, progress_data: dict):
     """Send progress update to connected WebSocket clients"""
@@ -92,32 +276,53 @@ async def send_progress_update(analysis_id: str, progress_data: dict):
         try:
             await websocket_connections[analysis_id].send_json(progress_data)
         except Exception as e:
-            print(f"Failed to send progress update: {e}")
+            logger.warning("Failed to send progress update", analysis_id=analysis_id, error=str(e))
+
+# Per-request authentication: an Appwrite JWT in "Authorization: Bearer" (or X-Appwrite-JWT)
+async def request_token(
+    authorization: Optional[str] = Header(None),
+    x_appwrite_jwt: Optional[str] = Header(None)
+) -> str:
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:].strip()
+    if x_appwrite_jwt:
+        return x_appwrite_jwt
+    raise HTTPException(status_code=401, detail="User not authenticated")
+
+async def current_user(token: str = Depends(request_token)) -> Dict[str, Any]:
+    try:
+        user = await authenticator.authenticate(token)
+    except Exception as e:
+        logger.error("Authentication backend unavailable", error=str(e))
+        raise HTTPException(status_code=503, detail="Authentication service unavailable")
+    if not user:
+        raise HTTPException(status_code=401, detail="User not authenticated")
+    return user
 
 # Authentication endpoints (using Appwrite)
 @app.post("/auth/login")
 async def login(credentials: LoginRequest):
     try:
         session = await appwrite_service.login(credentials.email, credentials.password)
-        return {"session": session, "message": "Login successful"}
+        # Server-side sessions carry a secret that can be exchanged for an API JWT
+        jwt = await appwrite_service.create_jwt(session["secret"]) if session.get("secret") else None
+        return {"session": session, "jwt": jwt, "message": "Login successful"}
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
 
 @app.post("/auth/logout")
-async def logout():
+async def logout(token: str = Depends(request_token)):
+    # Refuse the token locally right away, even if Appwrite is unreachable
+    authenticator.revoke(token)
     try:
-        await appwrite_service.logout()
+        await appwrite_service.logout(token)
         return {"message": "Logout successful"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/auth/user")
-async def get_user():
-    try:
-        user = await appwrite_service.get_current_user()
-        return user
-    except Exception as e:
-        raise HTTPException(status_code=401, detail=str(e))
+async def get_user(user: Dict[str, Any] = Depends(current_user)):
+    return user
 
 @app.post("/auth/register")
 async def register(user_data: RegisterRequest):
@@ -129,171 +334,372 @@ async def register(user_data: RegisterRequest):
 
 # Company Analysis endpoints
 @app.post("/api/analyze-company")
-async def analyze_company(request: CompanyAnalysisRequest):
+async def analyze_company(request: CompanyAnalysisRequest, user: Dict[str, Any] = Depends(current_user)):
+    analysis_id = None
     try:
-        print(f"Analysis requested by user: {request.user_name}")
-        
-        # Try to get current user, but don't require authentication
-        # user = await appwrite_service.get_current_user()
-        user = {"$id": request.user_name}
-        if user is None:
-            print("User not authenticated, using default user")
-            # Use a default user ID for unauthenticated requests
-            user = {"$id": "default_user"}
+        logger.info("Analysis requested", user_name=request.user_name)
+
+        # Quotas, fair-share weights and ownership are keyed on the authenticated
+        # user, never on the client-supplied user_name (a display name only).
+        # Shed load before creating any records
+        rejection = admission.check(user["$id"], request.priority)
+        if rejection:
+            logger.warning("Analysis rejected by admission control", reason=rejection["reason"], priority=request.priority)
+            raise HTTPException(
+                status_code=rejection["status"],
+                detail=f"Server busy ({rejection['reason']}), retry later",
+                headers={"Retry-After": str(rejection["retry_after"])}
+            )
+
+        estimated_wait = analysis_scheduler.estimated_wait(request.priority)
+        # The deadline runs from now, so it includes time spent queued
+        deadline_seconds = request.deadline_seconds or ANALYSIS_DEADLINE_SECONDS
+        deadline = asyncio.get_running_loop().time() + deadline_seconds if deadline_seconds else None
 
         # Create analysis ID
         analysis_id = str(uuid.uuid4())
         company_id = str(uuid.uuid4())
+        # Queue it right away so concurrent requests see it in the admission check
+        analysis_scheduler.submit(analysis_id, user["$id"], request.priority)
+        # Most-requested categories get their trend reports precomputed
+        agent_orchestrator.trend_precompute.record(request.market_category)
 
-        # Store company data in Appwrite
-        company_data = {
-            "name": request.name,
-            "website_url": request.website_url,
-            "product_description": request.product_description,
-            "market_category": request.market_category,
-            "analysis_status": "pending",
-            "user_id": user["$id"]
-        }
+        # One trace per analysis: the background task inherits this span's context
+        with tracer.start_span("POST /api/analyze-company", {"analysis.id": analysis_id, "user.id": user["$id"]},
+                               trace_id=trace_id_for(analysis_id)):
+            # Store company data in Appwrite
+            company_data = {
+                "name": request.name,
+                "website_url": request.website_url,
+                "product_description": request.product_description,
+                "market_category": request.market_category,
+                "analysis_status": "pending",
+                "user_id": user["$id"]
+            }
         
-        await appwrite_service.create_company(company_id, company_data)
+            await storage.create_company(company_id, company_data)
 
-        # Create analysis record
-        analysis_data = {
-            "company_id": company_id,
-            "user_id": user["$id"],
-            "status": "pending"
-        }
+            # Create analysis record
+            analysis_data = {
+                "company_id": company_id,
+                "user_id": user["$id"],
+                "status": "pending",
+                "checkpoint": json.dumps({"request": {
+                    "user_name": request.user_name, "priority": request.priority, "mode": request.mode
+                }, "stages": {}})
+            }
         
-        await appwrite_service.create_analysis(analysis_id, analysis_data)
+            await storage.create_analysis(analysis_id, analysis_data)
 
-        # Start analysis in background
-        asyncio.create_task(run_analysis(analysis_id, company_data, user["$id"], request.user_name))
+            # Start analysis in background
+            start_analysis_task(
+                analysis_id, company_data, user["$id"], request.user_name, request.priority, deadline, request.mode
+            )
 
         return {
             "analysis_id": analysis_id,
             "company_id": company_id,
             "status": "started",
-            "estimated_duration": 120
+            "estimated_duration": round(estimated_wait + analysis_scheduler.average_run_time)
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in analyze_company: {e}")
+        logger.exception("Error in analyze_company")
+        if analysis_id:
+            analysis_scheduler.discard(analysis_id)
         raise HTTPException(status_code=500, detail=str(e))
 
-async def run_analysis(analysis_id: str, company_data: dict, user_id: str, user_name: str):
-    """Run the complete analysis using Agno agent orchestration"""
+def start_analysis_task(analysis_id: str, company_data: dict, user_id: str, user_name: str, priority: str,
+                        deadline: Optional[float], mode: str, checkpoint: Optional[Dict[str, Any]] = None):
+    """Run an analysis in the background, registered so it can be cancelled"""
+    task = asyncio.create_task(run_analysis(
+        analysis_id, company_data, user_id, user_name, priority, deadline, mode, checkpoint
+    ))
+    analysis_tasks[analysis_id] = task
+    task.add_done_callback(lambda _: analysis_tasks.pop(analysis_id, None))
+
+async def run_analysis(analysis_id: str, company_data: dict, user_id: str, user_name: str,
+                       priority: str = "interactive", deadline: Optional[float] = None, mode: str = "full",
+                       checkpoint: Optional[Dict[str, Any]] = None):
+    """Run the complete analysis, until it finishes, is cancelled or reaches `deadline` (loop time)"""
+    # Runs in its own task, so the bound context only applies to this analysis
+    structlog.contextvars.bind_contextvars(analysis_id=analysis_id, user_id=user_id)
+    cm = asyncio.timeout_at(deadline)
+    try:
+        async with cm:
+            await _run_analysis(analysis_id, company_data, user_id, user_name, priority, mode, checkpoint)
+    except (asyncio.CancelledError, TimeoutError) as e:
+        # A TimeoutError from inside the analysis has already been recorded as a failure
+        if isinstance(e, TimeoutError) and not (deadline is not None and cm.expired()):
+            raise
+        if isinstance(e, asyncio.CancelledError) and shutting_down:
+            # Keep the interrupted status, so the next process can resume from the checkpoint
+            logger.info("Analysis interrupted by shutdown")
+            raise
+        reason = "deadline" if isinstance(e, TimeoutError) else "cancelled"
+        metrics.ANALYSES_TOTAL.labels("cancelled").inc()
+        logger.info("Analysis cancelled", reason=reason)
+        try:
+            await storage.update_analysis(analysis_id, {"status": "cancelled"})
+        except Exception as update_error:
+            logger.error("Failed to update analysis status to cancelled", error=str(update_error))
+        await send_progress_update(analysis_id, {
+            "step": agent_orchestrator.get_progress(analysis_id).get("current_step", "queued"),
+            "progress": 0,
+            "status": "cancelled",
+            "message": f"Analysis cancelled ({reason})"
+        })
+        if isinstance(e, asyncio.CancelledError):
+            raise
+
+async def save_checkpoint(analysis_id: str, request_info: Dict[str, Any], stages: Dict[str, Any]):
+    """Persist the outputs of completed stages so an interrupted analysis can resume after them"""
     try:
-        # Update status to in_progress
-        await appwrite_service.update_analysis(analysis_id, {"status": "in_progress"})
+        await storage.update_analysis(analysis_id, {
+            "checkpoint": json.dumps({"request": request_info, "stages": stages}, default=str)
+        })
+    except Exception as e:
+        logger.warning("Failed to checkpoint analysis", analysis_id=analysis_id, stages=list(stages), error=str(e))
+
+async def _run_analysis(analysis_id: str, company_data: dict, user_id: str, user_name: str, priority: str, mode: str,
+                        checkpoint: Optional[Dict[str, Any]]):
+    request_info = {"user_name": user_name, "priority": priority, "mode": mode}
+    with tracer.start_span("run_analysis", {"analysis.id": analysis_id, "user.id": user_id}), \
+            activity("run_analysis"), profile_analysis(analysis_id):
+        # Wait for a fair-share slot; the progress endpoint reports the queue position meanwhile
+        async with analysis_scheduler.slot(analysis_id, user_id, priority):
+            metrics.ANALYSES_IN_FLIGHT.inc()
+            try:
+                # Update status to in_progress
+                await storage.update_analysis(analysis_id, {"status": "in_progress"})
         
-        # Run analysis using Agno agent orchestrator
-        result = await agent_orchestrator.run_analysis(
-            analysis_id=analysis_id,
-            company_data=company_data,
-            user_id=user_id,
-            user_name=user_name,
-            progress_callback=lambda step, progress, status, message: 
-                asyncio.create_task(send_progress_update(analysis_id, {
-                    "step": step,
-                    "progress": progress,
-                    "status": status,
-                    "message": message
-                }))
-        )
+                # Run analysis using Agno agent orchestrator
+                result = await agent_orchestrator.run_analysis(
+                    analysis_id=analysis_id,
+                    company_data=company_data,
+                    user_id=user_id,
+                    user_name=user_name,
+                    stage_store=stage_store,
+                    mode=mode,
+                    checkpoint=checkpoint,
+                    on_checkpoint=lambda stages: save_checkpoint(analysis_id, request_info, stages),
+                    progress_callback=lambda step, progress, status, message: 
+                        asyncio.create_task(send_progress_update(analysis_id, {
+                            "step": step,
+                            "progress": progress,
+                            "status": status,
+                            "message": message
+                        }))
+                )
 
-        # Store results in Appwrite
-        # Convert Pydantic models to dictionaries and then to JSON
-        def convert_to_json_serializable(obj):
-            if isinstance(obj, (list, tuple)):
-                return [convert_to_json_serializable(item) for item in obj]
-            elif hasattr(obj, 'dict'):  # Check if it's a Pydantic model
-                return obj.dict()
-            return obj
+                # Store results in Appwrite
+                # Convert Pydantic models to dictionaries and then to JSON
+                def convert_to_json_serializable(obj):
+                    if isinstance(obj, (list, tuple)):
+                        return [convert_to_json_serializable(item) for item in obj]
+                    elif hasattr(obj, 'dict'):  # Check if it's a Pydantic model
+                        return obj.dict()
+                    return obj
             
-        # Convert Pydantic models to dictionaries and then to JSON strings
-        competitors_json = json.dumps(convert_to_json_serializable(result["competitors"]))
-        market_trends_json = json.dumps(convert_to_json_serializable(result["market_trends"]))
-        market_gaps_json = json.dumps(convert_to_json_serializable(result["market_gaps"]))
-        competitive_advantages_json = json.dumps(convert_to_json_serializable(result["competitive_advantages"]))
+                # Convert Pydantic models to dictionaries and then to JSON strings
+                competitors_json = json.dumps(convert_to_json_serializable(result["competitors"]))
+                market_trends_json = json.dumps(convert_to_json_serializable(result["market_trends"]))
+                market_gaps_json = json.dumps(convert_to_json_serializable(result["market_gaps"]))
+                competitive_advantages_json = json.dumps(convert_to_json_serializable(result["competitive_advantages"]))
         
-        print(f"DEBUG: JSON lengths - competitors: {len(competitors_json)}, trends: {len(market_trends_json)}, gaps: {len(market_gaps_json)}, advantages: {len(competitive_advantages_json)}")
+                logger.debug(
+                    "Serialized analysis results",
+                    competitors_bytes=len(competitors_json),
+                    trends_bytes=len(market_trends_json),
+                    gaps_bytes=len(market_gaps_json),
+                    advantages_bytes=len(competitive_advantages_json)
+                )
         
-        try:
-            await appwrite_service.update_analysis(analysis_id, {
-                "status": "completed",
-                "competitors": competitors_json,
-                "market_trends": market_trends_json,
-                "market_gaps": market_gaps_json,
-                "positioning_strategy": result["positioning_strategy"][:250] if len(result["positioning_strategy"]) > 250 else result["positioning_strategy"],
-                "competitive_advantages": competitive_advantages_json
-            })
-            print(f"DEBUG: Successfully stored analysis results for {analysis_id}")
-        except Exception as storage_error:
-            print(f"ERROR: Failed to store analysis results in Appwrite: {storage_error}")
-            # Try to store a minimal version with just the status
-            try:
-                await appwrite_service.update_analysis(analysis_id, {
-                    "status": "completed",
-                    "competitors": "Analysis completed but data too large for storage",
-                    "market_trends": "Analysis completed but data too large for storage",
-                    "market_gaps": "Analysis completed but data too large for storage",
-                    "positioning_strategy": result["positioning_strategy"][:200] if len(result["positioning_strategy"]) > 200 else result["positioning_strategy"],
-                    "competitive_advantages": "Analysis completed but data too large for storage"
-                })
-                print(f"DEBUG: Stored minimal analysis results for {analysis_id}")
-            except Exception as minimal_storage_error:
-                print(f"ERROR: Failed to store even minimal analysis results: {minimal_storage_error}")
-                raise Exception(f"Analysis completed but failed to store results: {storage_error}")
+                try:
+                    await storage.update_analysis(analysis_id, {
+                        "status": "completed",
+                        "competitors": competitors_json,
+                        "market_trends": market_trends_json,
+                        "market_gaps": market_gaps_json,
+                        "positioning_strategy": result["positioning_strategy"][:250] if len(result["positioning_strategy"]) > 250 else result["positioning_strategy"],
+                        "competitive_advantages": competitive_advantages_json,
+                        # The results supersede the stage checkpoint
+                        "checkpoint": None
+                    })
+                    logger.debug("Stored analysis results")
+                except Exception as storage_error:
+                    logger.error("Failed to store analysis results", error=str(storage_error))
+                    # Try to store a minimal version with just the status
+                    try:
+                        await storage.update_analysis(analysis_id, {
+                            "status": "completed",
+                            "competitors": "Analysis completed but data too large for storage",
+                            "market_trends": "Analysis completed but data too large for storage",
+                            "market_gaps": "Analysis completed but data too large for storage",
+                            "positioning_strategy": result["positioning_strategy"][:200] if len(result["positioning_strategy"]) > 200 else result["positioning_strategy"],
+                            "competitive_advantages": "Analysis completed but data too large for storage"
+                        })
+                        logger.debug("Stored minimal analysis results")
+                    except Exception as minimal_storage_error:
+                        logger.error("Failed to store even minimal analysis results", error=str(minimal_storage_error))
+                        raise Exception(f"Analysis completed but failed to store results: {storage_error}")
 
-    except Exception as e:
-        print(f"Analysis failed: {e}")
-        # Try to update status to failed, but don't let this error propagate
-        try:
-            await appwrite_service.update_analysis(analysis_id, {"status": "failed"})
-        except Exception as update_error:
-            print(f"Failed to update analysis status to failed: {update_error}")
-        raise
+                metrics.ANALYSES_TOTAL.labels("completed").inc()
+
+            except Exception as e:
+                metrics.ANALYSES_TOTAL.labels("failed").inc()
+                logger.error("Analysis failed", error=str(e))
+                # Try to update status to failed, but don't let this error propagate
+                try:
+                    await storage.update_analysis(analysis_id, {"status": "failed"})
+                except Exception as update_error:
+                    logger.error("Failed to update analysis status to failed", error=str(update_error))
+                raise
+            finally:
+                metrics.ANALYSES_IN_FLIGHT.dec()
 
 @app.get("/api/analysis/{analysis_id}/progress")
 async def get_analysis_progress(analysis_id: str):
     try:
-        analysis = await appwrite_service.get_analysis(analysis_id)
+        analysis = await storage.get_analysis(analysis_id)
         if not analysis:
             raise HTTPException(status_code=404, detail="Analysis not found")
 
         # Get progress from agent orchestrator
         progress = agent_orchestrator.get_progress(analysis_id)
-        
-        return {
+        queue = analysis_scheduler.position(analysis_id)
+
+        response = {
             "analysis_id": analysis_id,
             "current_step": progress.get("current_step", "unknown"),
             "progress": progress.get("progress", 0),
             "status": analysis.get("status", "pending"),
             "steps": progress.get("steps", [])
         }
+        if progress.get("similar_to"):
+            response["similar_to"] = progress["similar_to"]
+        if queue and queue["state"] == "queued":
+            response["current_step"] = "queued"
+            response["queue_position"] = queue["position"]
+        return response
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def resume_analysis(analysis: Dict[str, Any]) -> List[str]:
+    """Restart an interrupted analysis from its first incomplete stage; returns the stages it skips"""
+    analysis_id = analysis["$id"]
+    company = await storage.get_company(analysis["company_id"])
+    if not company:
+        raise Exception(f"Company {analysis['company_id']} of analysis {analysis_id} not found")
+    company_data = {
+        key: company.get(key)
+        for key in ("name", "website_url", "product_description", "market_category", "analysis_status", "user_id")
+    }
+    checkpoint = safe_json_loads(analysis.get("checkpoint"), {}, analysis_id)
+    request_info = checkpoint.get("request", {})
+    stages = checkpoint.get("stages", {})
+    priority = request_info.get("priority", "interactive")
+
+    analysis_scheduler.submit(analysis_id, analysis["user_id"], priority)
+    deadline = asyncio.get_running_loop().time() + ANALYSIS_DEADLINE_SECONDS if ANALYSIS_DEADLINE_SECONDS else None
+    start_analysis_task(
+        analysis_id, company_data, analysis["user_id"], request_info.get("user_name", analysis["user_id"]),
+        priority, deadline, request_info.get("mode", "full"), stages
+    )
+    logger.info("Resuming analysis", analysis_id=analysis_id, completed_stages=list(stages))
+    return list(stages)
+
+async def resume_interrupted_analyses():
+    """Restart the analyses a previous process left pending or in progress"""
+    try:
+        analyses = await storage.list_analyses_by_status(list(INTERRUPTED_STATUSES))
+    except Exception as e:
+        logger.error("Failed to list interrupted analyses", error=str(e))
+        return
+    resumed = 0
+    for analysis in analyses:
+        if analysis["$id"] in analysis_tasks:
+            continue
+        try:
+            await resume_analysis(analysis)
+            resumed += 1
+        except Exception as e:
+            logger.error("Failed to resume analysis", analysis_id=analysis["$id"], error=str(e))
+    logger.info("Resumed interrupted analyses", count=resumed)
+
+@app.post("/api/analysis/{analysis_id}/resume")
+async def resume_analysis_endpoint(analysis_id: str):
+    """Resume an analysis interrupted by a crash or deploy, skipping its checkpointed stages"""
+    try:
+        analysis = await storage.get_analysis(analysis_id)
+        if not analysis:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+        status = analysis.get("status", "pending")
+        if status not in INTERRUPTED_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Analysis is {status}, not interrupted")
+        if analysis_id in analysis_tasks:
+            raise HTTPException(status_code=409, detail="Analysis is still running")
+
+        completed_stages = await resume_analysis(analysis)
+        return {"analysis_id": analysis_id, "status": "resumed", "completed_stages": completed_stages}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Failed to resume analysis", analysis_id=analysis_id, error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/analysis/{analysis_id}")
+async def cancel_analysis(analysis_id: str):
+    """Cancel a queued or running analysis, aborting its in-flight agent call and freeing its slot"""
+    try:
+        analysis = await storage.get_analysis(analysis_id)
+        if not analysis:
+            raise HTTPException(status_code=404, detail="Analysis not found")
+        status = analysis.get("status", "pending")
+        if status in TERMINAL_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Analysis already {status}")
+
+        task = analysis_tasks.get(analysis_id)
+        if task is not None:
+            task.cancel()
+            # run_analysis records the cancellation itself; give it a moment to do so
+            await asyncio.wait({task}, timeout=5)
+        else:
+            # Not running in this process (e.g. lost in a restart)
+            analysis_scheduler.discard(analysis_id)
+            await storage.update_analysis(analysis_id, {"status": "cancelled"})
+
+        logger.info("Analysis cancelled by request", analysis_id=analysis_id, previous_status=status)
+        return {"analysis_id": analysis_id, "status": "cancelled"}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Failed to cancel analysis", analysis_id=analysis_id, error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+def safe_json_loads(json_str, default_value, analysis_id: str):
+    """Parse a JSON-encoded analysis field, falling back to a default"""
+    if not json_str:
+        return default_value
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError as e:
+        logger.warning("Invalid JSON in analysis", analysis_id=analysis_id, error=str(e), length=len(json_str))
+        return default_value
+
 @app.get("/api/analysis/{analysis_id}")
 async def get_analysis_results(analysis_id: str):
     try:
-        analysis = await appwrite_service.get_analysis(analysis_id)
+        analysis = await storage.get_analysis(analysis_id)
         if not analysis:
             raise HTTPException(status_code=404, detail="Analysis not found")
 
-        company = await appwrite_service.get_company(analysis["company_id"])
-
-        # Safely parse JSON fields with error handling
-        def safe_json_loads(json_str, default_value):
-            if not json_str:
-                return default_value
-            try:
-                return json.loads(json_str)
-            except json.JSONDecodeError as e:
-                print(f"WARNING: Invalid JSON in analysis {analysis_id}: {e}")
-                print(f"JSON string: {json_str}")
-                return default_value
+        company = await storage.get_company(analysis["company_id"])
 
         return {
             "analysis_id": analysis_id,
@@ -301,91 +707,351 @@ async def get_analysis_results(analysis_id: str):
                 "name": company["name"],
                 "website_url": company["website_url"]
             },
-            "competitors": safe_json_loads(analysis.get("competitors"), []),
-            "market_trends": safe_json_loads(analysis.get("market_trends"), []),
-            "market_gaps": safe_json_loads(analysis.get("market_gaps"), []),
+            "competitors": safe_json_loads(analysis.get("competitors"), [], analysis_id),
+            "market_trends": safe_json_loads(analysis.get("market_trends"), [], analysis_id),
+            "market_gaps": safe_json_loads(analysis.get("market_gaps"), [], analysis_id),
             "positioning_strategy": analysis.get("positioning_strategy", ""),
-            "competitive_advantages": safe_json_loads(analysis.get("competitive_advantages"), [])
+            "competitive_advantages": safe_json_loads(analysis.get("competitive_advantages"), [], analysis_id)
         }
 
     except Exception as e:
-        print(f"ERROR: Failed to get analysis results for {analysis_id}: {e}")
+        logger.error("Failed to get analysis results", analysis_id=analysis_id, error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+def summarize_analysis(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """Listing view of an analysis document"""
+    return {
+        "analysis_id": analysis["$id"],
+        "company_id": analysis.get("company_id"),
+        "status": analysis.get("status", "pending"),
+        "created_at": analysis.get("$createdAt"),
+        "updated_at": analysis.get("$updatedAt")
+    }
+
+@app.get("/api/analyses")
+async def list_analyses(limit: int = 25, cursor: Optional[str] = None, user: Dict[str, Any] = Depends(current_user)):
+    """List the caller's analyses, newest first. Pass next_cursor back as cursor for the next page."""
+    try:
+        page = await storage.list_user_analyses_page(user["$id"], limit=limit, cursor=cursor)
+        return {
+            "analyses": [summarize_analysis(analysis) for analysis in page["documents"]],
+            "next_cursor": page["next_cursor"]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/analyses/export")
+async def export_analyses(user: Dict[str, Any] = Depends(current_user)):
+    """Stream the caller's full analysis history as newline-delimited JSON"""
+    async def generate():
+        async for analysis in storage.iter_user_analyses(user["$id"]):
+            yield json.dumps(summarize_analysis(analysis)) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.get("/api/competitors")
+async def list_competitors(market_category: Optional[str] = None, limit: int = 50):
+    """Known competitors in a market category, or the indexed categories without one"""
+    try:
+        knowledge_base = agent_orchestrator.competitor_kb
+        if market_category is None:
+            return {"categories": await knowledge_base.categories(limit=limit)}
+        return {
+            "market_category": category_key(market_category),
+            "competitors": await knowledge_base.for_category(market_category, limit=limit)
+        }
+    except Exception as e:
+        logger.error("Failed to list competitors", error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
 # Marketing Asset Generation endpoints
+# Scripts are written from the analysis; its context is cached once the analysis is complete
+script_contexts = TTLCache("script_context", maxsize=256, ttl=600)
+
+async def load_script_context(analysis_id: str) -> Dict[str, Any]:
+    """Analysis and company fields a marketing script is written from.
+
+    "cacheable" is set only once the analysis has completed; scripts written
+    from a partial analysis must not be cached.
+    """
+    context = script_contexts.get(analysis_id)
+    if context is not None:
+        return context
+
+    analysis = await storage.get_analysis(analysis_id)
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    company = await storage.get_company(analysis["company_id"]) or {}
+
+    context = {
+        "company_id": analysis["company_id"],
+        "name": company.get("name", ""),
+        "product_description": company.get("product_description", ""),
+        "market_category": company.get("market_category", ""),
+        "competitors": safe_json_loads(analysis.get("competitors"), [], analysis_id),
+        "market_trends": safe_json_loads(analysis.get("market_trends"), [], analysis_id),
+        "market_gaps": safe_json_loads(analysis.get("market_gaps"), [], analysis_id),
+        "positioning_strategy": analysis.get("positioning_strategy", ""),
+        "competitive_advantages": safe_json_loads(analysis.get("competitive_advantages"), [], analysis_id),
+        "cacheable": analysis.get("status") == "completed"
+    }
+    if context["cacheable"]:
+        script_contexts.set(analysis_id, context)
+    return context
+
+async def store_script_asset(request: ScriptGenerationRequest, user: Dict[str, Any],
+                             context: Dict[str, Any], script: str) -> str:
+    asset_id = str(uuid.uuid4())
+    asset_data = {
+        "company_id": context["company_id"],
+        "analysis_id": request.analysis_id,
+        "user_id": user["$id"],
+        "script_content": script,
+        "duration": request.duration,
+        "style": request.style,
+        "status": "script_generated"
+    }
+    await storage.create_marketing_asset(asset_id, asset_data)
+    return asset_id
+
 @app.post("/api/generate-script")
-async def generate_script(request: ScriptGenerationRequest):
+async def generate_script(request: ScriptGenerationRequest, user: Dict[str, Any] = Depends(current_user)):
     try:
-        user = await appwrite_service.get_current_user()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not authenticated")
-
-        # Get analysis data
-        analysis = await appwrite_service.get_analysis(request.analysis_id)
-        if not analysis:
-            raise HTTPException(status_code=404, detail="Analysis not found")
+        context = await load_script_context(request.analysis_id)
 
         # Generate script using Agno agent orchestrator
         script = await agent_orchestrator.generate_marketing_script(
             analysis_id=request.analysis_id,
             style=request.style,
             duration=request.duration,
-            user_id=user["$id"]
+            user_id=user["$id"],
+            context=context,
+            cacheable=context["cacheable"]
         )
 
-        # Store marketing asset
-        asset_id = str(uuid.uuid4())
-        asset_data = {
-            "company_id": analysis["company_id"],
-            "analysis_id": request.analysis_id,
-            "user_id": user["$id"],
-            "script_content": script,
-            "duration": request.duration,
-            "style": request.style,
-            "status": "script_generated"
-        }
-        
-        await appwrite_service.create_marketing_asset(asset_id, asset_data)
-
+        asset_id = await store_script_asset(request, user, context, script)
         return {"script": script, "asset_id": asset_id}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/generate-images")
-async def generate_images(request: ImageGenerationRequest):
+@app.post("/api/generate-script/stream")
+async def generate_script_stream(request: ScriptGenerationRequest, user: Dict[str, Any] = Depends(current_user)):
+    """Stream the script as newline-delimited JSON: {"type": "delta", "text"}..., then {"type": "done", "script", "asset_id"}"""
     try:
-        user = await appwrite_service.get_current_user()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not authenticated")
+        context = await load_script_context(request.analysis_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Generate images using Agno agent orchestrator
+    async def generate():
+        chunks = []
+        try:
+            async for chunk in agent_orchestrator.stream_marketing_script(
+                request.analysis_id, request.style, request.duration, context, cacheable=context["cacheable"]
+            ):
+                chunks.append(chunk)
+                yield json.dumps({"type": "delta", "text": chunk}) + "\n"
+            script = "".join(chunks).strip()
+            asset_id = await store_script_asset(request, user, context, script)
+            yield json.dumps({"type": "done", "script": script, "asset_id": asset_id}) + "\n"
+        except Exception as e:
+            logger.error("Script streaming failed", analysis_id=request.analysis_id, error=str(e))
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.post("/api/generate-images")
+async def generate_images(request: ImageGenerationRequest, user: Dict[str, Any] = Depends(current_user)):
+    try:
+        # Generate images concurrently, uploading each to storage as it completes
         images = await agent_orchestrator.generate_images(
             script=request.script,
             company_name=request.company_name,
-            style=request.style
+            style=request.style,
+            count=request.count,
+            storage=storage
         )
 
         return {"images": images}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/generate-images/stream")
+async def generate_images_stream(request: ImageGenerationRequest, user: Dict[str, Any] = Depends(current_user)):
+    """Stream images as newline-delimited JSON in completion order: {"type": "image", ...}..., then {"type": "done", "count"}"""
+    async def generate():
+        count = 0
+        try:
+            async for image in agent_orchestrator.stream_images(
+                request.script, request.company_name, request.style, request.count, storage
+            ):
+                count += "url" in image
+                yield json.dumps({"type": "image", **image}) + "\n"
+            yield json.dumps({"type": "done", "count": count}) + "\n"
+        except Exception as e:
+            logger.error("Image streaming failed", company_name=request.company_name, error=str(e))
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+# file_id -> error of streamed voice-overs that were not stored
+failed_audio_streams = TTLCache("failed_audio_stream", maxsize=256, ttl=3600)
+
+@app.get("/api/files/{file_id}")
+async def get_file(file_id: str):
+    """Serve a generated media file from the storage backend"""
+    data = await storage.read_file(file_id)
+    if data is None:
+        error = failed_audio_streams.get(file_id)
+        if error is not None:
+            raise HTTPException(status_code=410, detail=f"Audio stream failed and was not stored: {error}")
+        raise HTTPException(status_code=404, detail="File not found")
+    media_type = mimetypes.guess_type(file_id)[0] or "application/octet-stream"
+    return Response(content=data, media_type=media_type, headers={"Cache-Control": "public, max-age=86400"})
+
 @app.post("/api/generate-audio")
-async def generate_audio(request: AudioGenerationRequest):
+async def generate_audio(request: AudioGenerationRequest, user: Dict[str, Any] = Depends(current_user)):
     try:
-        user = await appwrite_service.get_current_user()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not authenticated")
-
-        # Generate audio using Agno agent orchestrator
+        # Synthesize sentence chunks concurrently, then store the stitched voice-over
         audio_url = await agent_orchestrator.generate_audio(
             script=request.script,
-            voice=request.voice
+            voice=request.voice,
+            storage=storage
         )
 
         return {"audio_url": audio_url}
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/generate-audio/stream")
+async def generate_audio_stream(request: AudioGenerationRequest, user: Dict[str, Any] = Depends(current_user)):
+    """Stream the voice-over as chunked audio/mpeg, playable while later sentences are still being synthesized
+
+    The stitched file is stored once the stream completes and served from the
+    URL in the X-Audio-Url header. That URL returns 404 until the file is
+    stored, or 410 with the error if synthesis or storing failed.
+    """
+    file_id = f"{uuid.uuid4().hex}.mp3"
+
+    async def generate():
+        parts = []
+        try:
+            async for audio in agent_orchestrator.stream_audio(request.script, request.voice):
+                parts.append(audio)
+                yield audio
+            await agent_orchestrator.tts_pipeline.store(b"".join(parts), storage, file_id)
+        except Exception as e:
+            # Headers are already sent; the stream may be complete, but the file never will be
+            failed_audio_streams.set(file_id, str(e))
+            logger.error("Audio streaming failed", file_id=file_id, error=str(e))
+
+    return StreamingResponse(generate(), media_type="audio/mpeg", headers={"X-Audio-Url": f"/api/files/{file_id}"})
+
+@app.post("/api/generate-assets")
+async def generate_assets(request: AssetGenerationRequest, user: Dict[str, Any] = Depends(current_user)):
+    """Start a script -> (images, audio) asset job in the background and return its asset_id"""
+    try:
+        context = await load_script_context(request.analysis_id)
+
+        asset_id = str(uuid.uuid4())
+        await storage.create_marketing_asset(asset_id, {
+            "company_id": context["company_id"],
+            "analysis_id": request.analysis_id,
+            "user_id": user["$id"],
+            "duration": request.duration,
+            "style": request.style,
+            "status": "pending"
+        })
+
+        with tracer.start_span("POST /api/generate-assets", {"asset.id": asset_id, "user.id": user["$id"]},
+                               trace_id=trace_id_for(asset_id)):
+            start_asset_task(asset_id, request, context, user["$id"])
+
+        return {"asset_id": asset_id, "status": "started"}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in generate_assets")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def start_asset_task(asset_id: str, request: AssetGenerationRequest, context: Dict[str, Any], user_id: str):
+    """Run an asset job in the background, registered so it is not garbage-collected and can be cancelled"""
+    task = asyncio.create_task(run_asset_job(asset_id, request, context, user_id))
+    asset_tasks[asset_id] = task
+    task.add_done_callback(lambda _: asset_tasks.pop(asset_id, None))
+
+async def run_asset_job(asset_id: str, request: AssetGenerationRequest, context: Dict[str, Any], user_id: str):
+    """Run an asset generation job, reporting progress over the WebSocket channel"""
+    structlog.contextvars.bind_contextvars(asset_id=asset_id, analysis_id=request.analysis_id, user_id=user_id)
+    with tracer.start_span("run_asset_job", {"asset.id": asset_id, "user.id": user_id}), activity("run_asset_job"):
+        try:
+            result = await agent_orchestrator.run_asset_generation(
+                asset_id=asset_id,
+                analysis_id=request.analysis_id,
+                context=context,
+                user_id=user_id,
+                storage=storage,
+                style=request.style,
+                duration=request.duration,
+                voice=request.voice,
+                image_count=request.image_count,
+                progress_callback=lambda step, progress, status, message:
+                    asyncio.create_task(send_progress_update(asset_id, {
+                        "step": step,
+                        "progress": progress,
+                        "status": status,
+                        "message": message
+                    }))
+            )
+            logger.info("Asset job finished", status=result["status"])
+        except (asyncio.CancelledError, Exception) as e:
+            cancelled = isinstance(e, asyncio.CancelledError)
+            if cancelled:
+                logger.warning("Asset job cancelled")
+            else:
+                logger.error("Asset job failed", error=str(e))
+            try:
+                await storage.update_marketing_asset(asset_id, {"status": "failed"})
+            except Exception as update_error:
+                logger.error("Failed to update asset status to failed", error=str(update_error))
+            if cancelled:
+                raise
+
+@app.get("/api/assets/{asset_id}")
+async def get_asset(asset_id: str):
+    """Asset job status, step progress and whatever outputs are ready so far"""
+    try:
+        asset = await storage.get_marketing_asset(asset_id)
+        if not asset:
+            raise HTTPException(status_code=404, detail="Asset not found")
+
+        progress = agent_orchestrator.get_progress(asset_id)
+        return {
+            "asset_id": asset_id,
+            "analysis_id": asset.get("analysis_id"),
+            "status": asset.get("status", "pending"),
+            "progress": progress.get("progress", 0),
+            "steps": progress.get("steps", []),
+            "script": asset.get("script_content"),
+            "images": safe_json_loads(asset.get("images"), [], asset_id),
+            "audio_url": asset.get("audio_url"),
+            "style": asset.get("style"),
+            "duration": asset.get("duration")
+        }
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -397,7 +1063,7 @@ async def generate_audio(request: AudioGenerationRequest):
 #         if not user:
 #             raise HTTPException(status_code=401, detail="User not authenticated")
 # 
-#         sessions = await appwrite_service.get_user_sessions(user["$id"])
+#         sessions = await storage.get_user_sessions(user["$id"])
 #         return {"sessions": sessions}
 # 
 #     except Exception as e:
@@ -410,7 +1076,7 @@ async def generate_audio(request: AudioGenerationRequest):
 #         if not user:
 #             raise HTTPException(status_code=401, detail="User not authenticated")
 # 
-#         session = await appwrite_service.create_session({
+#         session = await storage.create_session({
 #             "session_name": session_data.session_name,
 #             "company_data": session_data.company_data,
 #             "analysis_data": session_data.analysis_data,
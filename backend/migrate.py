@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Schema migration CLI for CompeteIQ Backend
+
+Applies the declared Appwrite schema (collections and attributes) outside of
+API startup, so replicas only ever need the fast cached verification path.
+
+    python migrate.py            # migrate if the deployed schema is outdated
+    python migrate.py --check    # exit 1 if a migration is needed
+    python migrate.py --force    # reconcile even if the version matches
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+from dotenv import load_dotenv
+
+from services.appwrite_service import AppwriteService
+from services.schema_migrations import SCHEMA_VERSION
+from services.logging_config import configure_logging
+
+
+async def run(check: bool, force: bool) -> int:
+    service = AppwriteService()
+    await service.initialize(verify_schema=False)
+    migrator = service.schema_migrator()
+
+    deployed = await migrator.get_deployed_schema()
+    deployed_version = deployed.get("version") if deployed else None
+    up_to_date = await migrator.is_up_to_date()
+    print(f"   - Database: {service.database_id}")
+    print(f"   - Declared schema version: {SCHEMA_VERSION}")
+    print(f"   - Deployed schema version: {deployed_version if deployed_version is not None else 'none'}")
+
+    if check:
+        if up_to_date:
+            print("✅ Schema is up to date")
+            return 0
+        print("❌ Schema migration required")
+        return 1
+
+    if up_to_date and not force:
+        migrator.write_cache()
+        print("✅ Schema is up to date, nothing to migrate")
+        return 0
+
+    try:
+        await migrator.migrate()
+    except Exception as e:
+        # Nothing is recorded as applied; rerunning retries what is missing
+        print(f"❌ {e}")
+        return 1
+    print("✅ Migration complete")
+    return 0
+
+
+def main():
+    """Main migration entry point"""
+    load_dotenv()
+    configure_logging()
+
+    parser = argparse.ArgumentParser(description="Apply the CompeteIQ Appwrite schema")
+    parser.add_argument("--check", action="store_true", help="only report whether a migration is needed")
+    parser.add_argument("--force", action="store_true", help="reconcile collections even if the version matches")
+    args = parser.parse_args()
+
+    missing_vars = [var for var in ["APPWRITE_PROJECT_ID", "APPWRITE_API_KEY"] if not os.getenv(var)]
+    if missing_vars:
+        print("❌ Missing required environment variables:")
+        for var in missing_vars:
+            print(f"   - {var}")
+        sys.exit(1)
+
+    print("🛠️  Running CompeteIQ schema migration...")
+    sys.exit(asyncio.run(run(args.check, args.force)))
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,9 @@ class CompanyAnalysisRequest(BaseModel):
     product_description: str = Field(..., description="Product description")
     market_category: str = Field(..., description="Market category")
     user_name: Optional[str] = Field(None, description="Logged-in user's name")
+    priority: str = Field(default="interactive", pattern="^(interactive|batch)$", description="Scheduling class")
+    deadline_seconds: Optional[float] = Field(None, gt=0, description="Cancel the analysis if not finished within this time")
+    mode: str = Field(default="full", pattern="^(full|incremental)$", description="incremental reuses fresh stage results")
 
 class CompetitorData(BaseModel):
     name: str = Field(..., description="Competitor name")
@@ -58,15 +61,26 @@ class ImageGenerationRequest(BaseModel):
     script: str = Field(..., description="Marketing script")
     company_name: str = Field(..., description="Company name")
     style: str = Field(default="professional", description="Image style")
+    count: int = Field(default=3, ge=1, le=8, description="Number of images")
 
 class AudioGenerationRequest(BaseModel):
     script: str = Field(..., description="Script to convert to audio")
     voice: str = Field(default="professional_male", description="Voice type")
 
+class AssetGenerationRequest(BaseModel):
+    analysis_id: str = Field(..., description="Analysis ID")
+    style: str = Field(default="professional", description="Script and image style")
+    duration: int = Field(default=30, ge=15, le=60, description="Script duration in seconds")
+    voice: str = Field(default="professional_male", description="Voice type")
+    image_count: int = Field(default=3, ge=1, le=8, description="Number of images")
+
 class GeneratedImage(BaseModel):
-    url: str = Field(..., description="Image URL")
+    index: int = Field(..., description="Position of the scene in the script")
+    url: Optional[str] = Field(None, description="Image URL (absent if generation failed)")
     prompt: str = Field(..., description="Image generation prompt")
     timestamp: float = Field(..., description="Timestamp in seconds")
+    source: Optional[str] = Field(None, description="Image provider")
+    error: Optional[str] = Field(None, description="Generation error")
 
 # Session management schemas
 class SessionCreateRequest(BaseModel):
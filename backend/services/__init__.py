@@ -1,4 +1,5 @@
 # Services package 
 from .appwrite_service import AppwriteService
+from .storage_backend import StorageBackend, create_storage_backend
 
-__all__ = ["AppwriteService"] 
\ No newline at end of file
+__all__ = ["AppwriteService", "StorageBackend", "create_storage_backend"]
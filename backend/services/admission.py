@@ -0,0 +1,107 @@
+import os
+import math
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+from .metrics import ADMISSION_REJECTED, PROVIDER_IN_FLIGHT
+
+# Admission control for new analyses.
+#
+# An analysis is admitted only while the process has room for it. Otherwise
+# the request is rejected up front with a Retry-After estimate, instead of
+# queueing work that would only slow everyone down:
+#
+#   429  the user already has ADMISSION_MAX_PER_USER analyses queued or running
+#   503  the scheduler queue is full (batch requests are shed at half the limit),
+#        ADMISSION_MAX_PROVIDER_IN_FLIGHT provider calls are queued or running,
+#        or the event loop lags by more than ADMISSION_MAX_LOOP_LAG_MS (opt-in; 0 disables)
+#
+# The same global signals drive readiness (GET /ready), so a load balancer
+# can route new work away from a saturated replica.
+
+PROVIDER_RETRY_AFTER = 5
+MAX_RETRY_AFTER = 300
+
+
+class ProviderLoad:
+    """Counts provider calls that are queued or running, per provider"""
+
+    def __init__(self):
+        self.in_flight: Counter = Counter()
+
+    @contextmanager
+    def track(self, provider: str):
+        self.in_flight[provider] += 1
+        PROVIDER_IN_FLIGHT.labels(provider).inc()
+        try:
+            yield
+        finally:
+            self.in_flight[provider] -= 1
+            PROVIDER_IN_FLIGHT.labels(provider).dec()
+
+    @property
+    def total(self) -> int:
+        return sum(self.in_flight.values())
+
+
+provider_load = ProviderLoad()
+
+
+def _retry_after(seconds: float) -> int:
+    return max(1, min(MAX_RETRY_AFTER, math.ceil(seconds)))
+
+
+class AdmissionController:
+    """Decides whether a new analysis may be queued, from scheduler, provider and event-loop load"""
+
+    def __init__(self, scheduler, loop_monitor, providers: ProviderLoad = provider_load):
+        self.scheduler = scheduler
+        self.loop_monitor = loop_monitor
+        self.providers = providers
+        self.max_queue = int(os.getenv("ADMISSION_MAX_QUEUE", str(scheduler.capacity * 4)))
+        self.max_per_user = int(os.getenv("ADMISSION_MAX_PER_USER", "20"))
+        self.max_provider_in_flight = int(os.getenv("ADMISSION_MAX_PROVIDER_IN_FLIGHT", "64"))
+        # Loop lag also rises under healthy bursts, so shedding on it is opt-in
+        self.max_loop_lag = float(os.getenv("ADMISSION_MAX_LOOP_LAG_MS", "0")) / 1000
+
+    def _saturation(self, priority: str = "interactive") -> Optional[Dict[str, Any]]:
+        """The first global limit exceeded, if any"""
+        queue_limit = self.max_queue if priority == "interactive" else self.max_queue // 2
+        if self.scheduler.queued() >= queue_limit:
+            return {"reason": "queue_full", "status": 503,
+                    "retry_after": _retry_after(self.scheduler.estimated_wait(priority))}
+        if self.providers.total >= self.max_provider_in_flight:
+            return {"reason": "provider_backlog", "status": 503, "retry_after": PROVIDER_RETRY_AFTER}
+        lag = self.loop_monitor.recent_lag()
+        if self.max_loop_lag and lag >= self.max_loop_lag:
+            return {"reason": "event_loop_lag", "status": 503, "retry_after": _retry_after(lag * 10)}
+        return None
+
+    def check(self, user_id: str, priority: str = "interactive") -> Optional[Dict[str, Any]]:
+        """None if the analysis may be queued, else {"reason", "status", "retry_after"}"""
+        pending = self.scheduler.user_pending(user_id)
+        if pending >= self.max_per_user:
+            # The user's own backlog drains at their per-user concurrency
+            wait = (pending - self.max_per_user + 1) / self.scheduler.per_user * self.scheduler.average_run_time
+            rejection = {"reason": "user_limit", "status": 429, "retry_after": _retry_after(wait)}
+        else:
+            rejection = self._saturation(priority)
+        if rejection is not None:
+            ADMISSION_REJECTED.labels(rejection["reason"], priority).inc()
+        return rejection
+
+    def readiness(self) -> Dict[str, Any]:
+        """Whether this replica should receive new work, with the load behind the decision"""
+        saturation = self._saturation()
+        return {
+            "ready": saturation is None,
+            "reason": saturation["reason"] if saturation else None,
+            "retry_after": saturation["retry_after"] if saturation else None,
+            "running": self.scheduler.running,
+            "capacity": self.scheduler.capacity,
+            "queued": self.scheduler.queued(),
+            "max_queue": self.max_queue,
+            "provider_in_flight": self.providers.total,
+            "loop_lag_ms": round(self.loop_monitor.recent_lag() * 1000, 1)
+        }
@@ -1,4 +1,5 @@
 import os
+import asyncio
 from typing import Dict, Any, List, Optional
 from appwrite.client import Client
 from appwrite.services.account import Account
@@ -7,9 +8,30 @@ from appwrite.services.storage import Storage
 from appwrite.input_file import InputFile
 from appwrite.id import ID
 from appwrite.query import Query
+from appwrite.exception import AppwriteException
 from datetime import datetime
+import structlog
+
+from .storage_backend import StorageBackend
+from .metrics import TimedClient
+from .tracing import run_in_context
+from .schema_migrations import (
+    SchemaMigrator,
+    SCHEMA_VERSION,
+    MARKETING_ASSETS_BUCKET_ID,
+    is_not_found,
+    COMPANIES_COLLECTION_ID,
+    ANALYSES_COLLECTION_ID,
+    MARKETING_ASSETS_COLLECTION_ID,
+    SESSIONS_COLLECTION_ID,
+    STAGE_RESULTS_COLLECTION_ID
+)
+
+logger = structlog.get_logger(__name__)
+
+class AppwriteService(StorageBackend):
+    name = "appwrite"
 
-class AppwriteService:
     def __init__(self):
         self.client = Client()
         self.account = None
@@ -21,14 +43,18 @@ class AppwriteService:
         self.project_id = os.getenv("APPWRITE_PROJECT_ID")
         self.api_key = os.getenv("APPWRITE_API_KEY")
         self.database_id = os.getenv("APPWRITE_DATABASE_ID", "competeiq")
+        self.auto_migrate = os.getenv("APPWRITE_AUTO_MIGRATE", "true").lower() == "true"
+        self.max_page_size = 100
         
         # Collection IDs
-        self.companies_collection_id = "companies"
-        self.analyses_collection_id = "analyses"
-        self.marketing_assets_collection_id = "marketing_assets"
-        self.sessions_collection_id = "sessions"
+        self.companies_collection_id = COMPANIES_COLLECTION_ID
+        self.analyses_collection_id = ANALYSES_COLLECTION_ID
+        self.marketing_assets_collection_id = MARKETING_ASSETS_COLLECTION_ID
+        self.sessions_collection_id = SESSIONS_COLLECTION_ID
+        self.stage_results_collection_id = STAGE_RESULTS_COLLECTION_ID
+        self.assets_bucket_id = MARKETING_ASSETS_BUCKET_ID
 
-    async def initialize(self):
+    async def initialize(self, verify_schema: bool = True):
         """Initialize Appwrite client and services"""
         try:
             # Check if required environment variables are set
@@ -41,225 +67,98 @@ class AppwriteService:
             self.client.set_project(self.project_id)
             self.client.set_key(self.api_key)
             
-            self.account = Account(self.client)
-            self.databases = Databases(self.client)
-            self.storage = Storage(self.client)
+            # SDK calls are timed into competeiq_storage_request_duration_seconds
+            self.account = TimedClient(Account(self.client), "appwrite")
+            self.databases = TimedClient(Databases(self.client), "appwrite")
+            self.storage = TimedClient(Storage(self.client), "appwrite")
             
             # Create collections if they don't exist
-            await self._ensure_collections_exist()
+            if verify_schema:
+                await self._ensure_collections_exist()
             
-            print("Appwrite service initialized successfully")
+            logger.info("Appwrite service initialized successfully")
             
         except Exception as e:
-            print(f"Failed to initialize Appwrite service: {e}")
+            logger.error("Failed to initialize Appwrite service", error=str(e))
             raise
 
+    async def _call(self, fn, **kwargs):
+        """Run a blocking Appwrite SDK call in the default executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, run_in_context(fn, **kwargs))
+
     async def _ensure_collections_exist(self):
-        """Ensure all required collections exist"""
+        """Ensure all required collections exist.
+
+        Uses the schema migrator's fast path: a local fingerprint cache hit
+        costs no network calls, and a matching deployed schema version costs
+        one. Full reconciliation only runs when the schema actually changed.
+        """
         try:
-            # Check if database exists, create if not
-            try:
-                self.databases.get(self.database_id)
-                print(f"Database '{self.database_id}' already exists")
-            except Exception as e:
-                if "Database not found" in str(e) or "not found" in str(e).lower():
-                    print(f"Creating database '{self.database_id}'...")
-                    self.databases.create(
-                        database_id=self.database_id,
-                        name="CompeteIQ Database"
-                    )
-                else:
-                    print(f"Error checking database: {e}")
-                    raise
-            
-            # Create collections with proper schemas
-            collections = [
-                {
-                    "id": self.companies_collection_id,
-                    "name": "Companies",
-                    "attributes": [
-                        {"key": "name", "type": "string", "required": True},
-                        {"key": "website_url", "type": "string", "required": True},
-                        {"key": "product_description", "type": "string", "required": True},
-                        {"key": "market_category", "type": "string", "required": True},
-                        {"key": "analysis_status", "type": "string", "default": "pending"},
-                        {"key": "scraped_data", "type": "string"},
-                        {"key": "user_id", "type": "string", "required": True}
-                    ]
-                },
-                {
-                    "id": self.analyses_collection_id,
-                    "name": "Analyses",
-                    "attributes": [
-                        {"key": "company_id", "type": "string", "required": True},
-                        {"key": "user_id", "type": "string", "required": True},
-                        {"key": "competitors", "type": "string"},
-                        {"key": "market_trends", "type": "string"},
-                        {"key": "market_gaps", "type": "string"},
-                        {"key": "positioning_strategy", "type": "string"},
-                        {"key": "competitive_advantages", "type": "string"},
-                        {"key": "status", "type": "string", "default": "pending"}
-                    ]
-                },
-                {
-                    "id": self.marketing_assets_collection_id,
-                    "name": "Marketing Assets",
-                    "attributes": [
-                        {"key": "company_id", "type": "string", "required": True},
-                        {"key": "analysis_id", "type": "string", "required": True},
-                        {"key": "user_id", "type": "string", "required": True},
-                        {"key": "script_content", "type": "string"},
-                        {"key": "audio_url", "type": "string"},
-                        {"key": "images", "type": "string"},
-                        {"key": "duration", "type": "integer", "default": 30},
-                        {"key": "style", "type": "string"},
-                        {"key": "status", "type": "string", "default": "pending"}
-                    ]
-                },
-                {
-                    "id": self.sessions_collection_id,
-                    "name": "Sessions",
-                    "attributes": [
-                        {"key": "session_name", "type": "string", "required": True},
-                        {"key": "company_data", "type": "string"},
-                        {"key": "analysis_data", "type": "string"},
-                        {"key": "app_state", "type": "string", "required": True},
-                        {"key": "last_accessed", "type": "string", "required": True},
-                        {"key": "is_active", "type": "boolean", "default": True},
-                        {"key": "user_id", "type": "string", "required": True}
-                    ]
-                }
-            ]
-            
-            for collection in collections:
-                try:
-                    # First, try to get the collection
-                    existing_collection = self.databases.get_collection(self.database_id, collection["id"])
-                    print(f"Collection '{collection['id']}' already exists")
-                    
-                    # Check if all required attributes exist
-                    existing_attrs = self.databases.list_attributes(
-                        database_id=self.database_id,
-                        collection_id=collection["id"]
-                    )
-                    existing_attr_keys = {attr['key'] for attr in existing_attrs['attributes']}
-                    
-                    # Add any missing attributes
-                    for attr in collection["attributes"]:
-                        if attr["key"] not in existing_attr_keys:
-                            try:
-                                if attr["type"] == "string":
-                                    self.databases.create_string_attribute(
-                                        database_id=self.database_id,
-                                        collection_id=collection["id"],
-                                        key=attr["key"],
-                                        size=255,  # Default size for string attributes
-                                        required=attr.get("required", False),
-                                        default=attr.get("default")
-                                    )
-                                    print(f"Added string attribute '{attr['key']}' to collection '{collection['id']}'")
-                                elif attr["type"] == "integer":
-                                    self.databases.create_integer_attribute(
-                                        database_id=self.database_id,
-                                        collection_id=collection["id"],
-                                        key=attr["key"],
-                                        required=attr.get("required", False),
-                                        default=attr.get("default")
-                                    )
-                                    print(f"Added integer attribute '{attr['key']}' to collection '{collection['id']}'")
-                                elif attr["type"] == "boolean":
-                                    self.databases.create_boolean_attribute(
-                                        database_id=self.database_id,
-                                        collection_id=collection["id"],
-                                        key=attr["key"],
-                                        required=attr.get("required", False),
-                                        default=attr.get("default")
-                                    )
-                                    print(f"Added boolean attribute '{attr['key']}' to collection '{collection['id']}'")
-                            except Exception as e:
-                                print(f"Failed to add attribute {attr['key']} to collection {collection['id']}: {e}")
-                    
-                except Exception as e:
-                    if "Collection with the requested ID could not be found" in str(e) or "not found" in str(e).lower():
-                        print(f"Creating collection '{collection['id']}'...")
-                        # Create collection first
-                        self.databases.create_collection(
-                            database_id=self.database_id,
-                            collection_id=collection["id"],
-                            name=collection["name"]
-                        )
-                        
-                        # Then add attributes one by one
-                        for attr in collection["attributes"]:
-                            try:
-                                if attr["type"] == "string":
-                                    self.databases.create_string_attribute(
-                                        database_id=self.database_id,
-                                        collection_id=collection["id"],
-                                        key=attr["key"],
-                                        size=255,  # Default size for string attributes
-                                        required=attr.get("required", False),
-                                        default=attr.get("default")
-                                    )
-                                    print(f"Created string attribute '{attr['key']}'")
-                                elif attr["type"] == "integer":
-                                    self.databases.create_integer_attribute(
-                                        database_id=self.database_id,
-                                        collection_id=collection["id"],
-                                        key=attr["key"],
-                                        required=attr.get("required", False),
-                                        default=attr.get("default")
-                                    )
-                                    print(f"Created integer attribute '{attr['key']}'")
-                                elif attr["type"] == "boolean":
-                                    self.databases.create_boolean_attribute(
-                                        database_id=self.database_id,
-                                        collection_id=collection["id"],
-                                        key=attr["key"],
-                                        required=attr.get("required", False),
-                                        default=attr.get("default")
-                                    )
-                                    print(f"Created boolean attribute '{attr['key']}'")
-                            except Exception as attr_error:
-                                print(f"Failed to create attribute {attr['key']}: {attr_error}")
-                    else:
-                        print(f"Error checking collection {collection['id']}: {e}")
-                        raise
-            
-            print("All collections and attributes verified successfully")
-                            
+            status = await self.schema_migrator().ensure(auto_migrate=self.auto_migrate)
+            if status == "outdated":
+                logger.warning("Appwrite schema is outdated; run `python migrate.py` to update it", version=SCHEMA_VERSION)
+            else:
+                logger.info(f"Appwrite schema {status}", version=SCHEMA_VERSION)
         except Exception as e:
-            print(f"Failed to ensure collections exist: {e}")
+            logger.error("Failed to ensure collections exist", error=str(e))
             raise
 
+    def schema_migrator(self) -> SchemaMigrator:
+        """Build a schema migrator bound to this service's database"""
+        cache_key = f"{self.endpoint}|{self.project_id}|{self.database_id}"
+        return SchemaMigrator(self.databases, self.database_id, cache_key, storage=self.storage)
+
     # Authentication methods
     async def login(self, email: str, password: str) -> Dict[str, Any]:
         """Login user with email and password"""
         try:
-            session = self.account.create_email_session(email, password)
+            session = await self._call(self.account.create_email_session, email=email, password=password)
             return session
         except Exception as e:
             raise Exception(f"Login failed: {str(e)}")
 
-    async def logout(self):
-        """Logout current user"""
+    def _user_account(self, jwt: Optional[str] = None, session: Optional[str] = None) -> TimedClient:
+        """Account service acting as one user (by JWT or session secret) instead of the API key"""
+        client = Client().set_endpoint(self.endpoint).set_project(self.project_id)
+        if jwt:
+            client.set_jwt(jwt)
+        if session:
+            client.set_session(session)
+        return TimedClient(Account(client), "appwrite")
+
+    async def create_jwt(self, session_secret: str) -> str:
+        """Exchange a session secret for a short-lived JWT to authenticate API requests"""
         try:
-            self.account.delete_sessions()
+            response = await self._call(self._user_account(session=session_secret).create_jwt)
+            return response["jwt"]
         except Exception as e:
-            raise Exception(f"Logout failed: {str(e)}")
+            raise Exception(f"Failed to create JWT: {str(e)}")
 
-    async def get_current_user(self) -> Optional[Dict[str, Any]]:
-        """Get current authenticated user"""
+    async def logout(self, jwt: str):
+        """Delete the session the JWT belongs to"""
         try:
-            user = self.account.get()
-            return user
+            await self._call(self._user_account(jwt=jwt).delete_session, session_id="current")
         except Exception as e:
-            return None
+            raise Exception(f"Logout failed: {str(e)}")
+
+    async def get_user_for_jwt(self, jwt: str) -> Optional[Dict[str, Any]]:
+        """Get the user a JWT belongs to, or None if Appwrite rejects the token
+
+        Errors other than an authentication failure (network, 5xx) are raised.
+        """
+        try:
+            return await self._call(self._user_account(jwt=jwt).get)
+        except AppwriteException as e:
+            if e.code == 401:
+                return None
+            raise
 
     async def register(self, email: str, password: str, name: str) -> Dict[str, Any]:
         """Register new user"""
         try:
-            user = self.account.create(
+            user = await self._call(
+                self.account.create,
                 user_id=ID.unique(),
                 email=email,
                 password=password,
@@ -274,7 +173,8 @@ class AppwriteService:
         """Create a new company document"""
         try:
             # Try to create with user_id first
-            document = self.databases.create_document(
+            document = await self._call(
+                self.databases.create_document,
                 database_id=self.database_id,
                 collection_id=self.companies_collection_id,
                 document_id=company_id,
@@ -282,11 +182,12 @@ class AppwriteService:
             )
             return document
         except Exception as e:
-            print(f"Failed to create company with user_id, trying without: {e}")
+            logger.warning("Failed to create company with user_id, trying without", error=str(e))
             # If that fails, try without user_id (for cases where schema doesn't have user_id)
             try:
                 company_data_without_user = {k: v for k, v in company_data.items() if k != 'user_id'}
-                document = self.databases.create_document(
+                document = await self._call(
+                    self.databases.create_document,
                     database_id=self.database_id,
                     collection_id=self.companies_collection_id,
                     document_id=company_id,
@@ -294,13 +195,14 @@ class AppwriteService:
                 )
                 return document
             except Exception as e2:
-                print(f"Failed to create company document: {e2}")
+                logger.error("Failed to create company document", error=str(e2))
                 raise Exception(f"Could not create company document: {e2}")
 
     async def get_company(self, company_id: str) -> Optional[Dict[str, Any]]:
         """Get company by ID"""
         try:
-            return self.databases.get_document(
+            return await self._call(
+                self.databases.get_document,
                 database_id=self.database_id,
                 collection_id=self.companies_collection_id,
                 document_id=company_id
@@ -311,7 +213,8 @@ class AppwriteService:
     async def update_company(self, company_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
         """Update company record"""
         try:
-            return self.databases.update_document(
+            return await self._call(
+                self.databases.update_document,
                 database_id=self.database_id,
                 collection_id=self.companies_collection_id,
                 document_id=company_id,
@@ -325,7 +228,8 @@ class AppwriteService:
         """Create a new analysis document"""
         try:
             # Try to create with user_id first
-            document = self.databases.create_document(
+            document = await self._call(
+                self.databases.create_document,
                 database_id=self.database_id,
                 collection_id=self.analyses_collection_id,
                 document_id=analysis_id,
@@ -333,11 +237,12 @@ class AppwriteService:
             )
             return document
         except Exception as e:
-            print(f"Failed to create analysis with user_id, trying without: {e}")
+            logger.warning("Failed to create analysis with user_id, trying without", error=str(e))
             # If that fails, try without user_id (for cases where schema doesn't have user_id)
             try:
                 analysis_data_without_user = {k: v for k, v in analysis_data.items() if k != 'user_id'}
-                document = self.databases.create_document(
+                document = await self._call(
+                    self.databases.create_document,
                     database_id=self.database_id,
                     collection_id=self.analyses_collection_id,
                     document_id=analysis_id,
@@ -345,13 +250,14 @@ class AppwriteService:
                 )
                 return document
             except Exception as e2:
-                print(f"Failed to create analysis document: {e2}")
+                logger.error("Failed to create analysis document", error=str(e2))
                 raise Exception(f"Could not create analysis document: {e2}")
 
     async def get_analysis(self, analysis_id: str) -> Optional[Dict[str, Any]]:
         """Get analysis by ID"""
         try:
-            return self.databases.get_document(
+            return await self._call(
+                self.databases.get_document,
                 database_id=self.database_id,
                 collection_id=self.analyses_collection_id,
                 document_id=analysis_id
@@ -362,7 +268,8 @@ class AppwriteService:
     async def update_analysis(self, analysis_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
         """Update analysis record"""
         try:
-            return self.databases.update_document(
+            return await self._call(
+                self.databases.update_document,
                 database_id=self.database_id,
                 collection_id=self.analyses_collection_id,
                 document_id=analysis_id,
@@ -371,25 +278,58 @@ class AppwriteService:
         except Exception as e:
             raise Exception(f"Failed to update analysis: {str(e)}")
 
-    async def get_user_analyses(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get all analyses for a user"""
-        try:
-            response = self.databases.list_documents(
-                database_id=self.database_id,
-                collection_id=self.analyses_collection_id,
-                queries=[Query.equal("user_id", user_id)],
-                limit=limit
-            )
-            return response.get("documents", [])
-        except Exception as e:
-            print(f"Failed to get user analyses: {e}")
-            return []
+    async def list_user_analyses_page(
+        self, user_id: str, limit: int = 25, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get one page of a user's analyses, newest first.
+
+        Served by the (user_id, $createdAt) index. Pass the returned
+        next_cursor back in to fetch the following page; it is None on the
+        last page.
+        """
+        return await self._list_page(
+            self.analyses_collection_id,
+            [Query.equal("user_id", user_id), Query.order_desc("$createdAt")],
+            limit,
+            cursor
+        )
+
+    async def list_analyses_by_status(self, statuses: List[str], limit: int = 100) -> List[Dict[str, Any]]:
+        """Get analyses in one of the given statuses, oldest first (served by the status index)"""
+        page = await self._list_page(
+            self.analyses_collection_id,
+            [Query.equal("status", statuses), Query.order_asc("$createdAt")],
+            limit,
+            None
+        )
+        return page["documents"]
+
+    async def _list_page(
+        self, collection_id: str, queries: List[str], limit: int, cursor: Optional[str]
+    ) -> Dict[str, Any]:
+        """Run a cursor-paginated list query"""
+        limit = max(1, min(limit, self.max_page_size))
+        queries = queries + [Query.limit(limit)]
+        if cursor:
+            queries.append(Query.cursor_after(cursor))
+        response = await self._call(
+            self.databases.list_documents,
+            database_id=self.database_id,
+            collection_id=collection_id,
+            queries=queries
+        )
+        documents = response.get("documents", [])
+        return {
+            "documents": documents,
+            "next_cursor": documents[-1]["$id"] if len(documents) == limit else None
+        }
 
     # Marketing Assets methods
     async def create_marketing_asset(self, asset_id: str, asset_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new marketing asset record"""
         try:
-            return self.databases.create_document(
+            return await self._call(
+                self.databases.create_document,
                 database_id=self.database_id,
                 collection_id=self.marketing_assets_collection_id,
                 document_id=asset_id,
@@ -401,7 +341,8 @@ class AppwriteService:
     async def get_marketing_asset(self, asset_id: str) -> Optional[Dict[str, Any]]:
         """Get marketing asset by ID"""
         try:
-            return self.databases.get_document(
+            return await self._call(
+                self.databases.get_document,
                 database_id=self.database_id,
                 collection_id=self.marketing_assets_collection_id,
                 document_id=asset_id
@@ -412,7 +353,8 @@ class AppwriteService:
     async def update_marketing_asset(self, asset_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
         """Update marketing asset record"""
         try:
-            return self.databases.update_document(
+            return await self._call(
+                self.databases.update_document,
                 database_id=self.database_id,
                 collection_id=self.marketing_assets_collection_id,
                 document_id=asset_id,
@@ -421,11 +363,74 @@ class AppwriteService:
         except Exception as e:
             raise Exception(f"Failed to update marketing asset: {str(e)}")
 
+    # Stage result methods
+    async def get_stage_result(self, result_id: str) -> Optional[Dict[str, Any]]:
+        """Get a stored stage result by ID"""
+        try:
+            return await self._call(
+                self.databases.get_document,
+                database_id=self.database_id,
+                collection_id=self.stage_results_collection_id,
+                document_id=result_id
+            )
+        except Exception as e:
+            if is_not_found(e):
+                return None
+            raise
+
+    async def put_stage_result(self, result_id: str, result_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create or replace a stage result"""
+        try:
+            try:
+                return await self._call(
+                    self.databases.update_document,
+                    database_id=self.database_id,
+                    collection_id=self.stage_results_collection_id,
+                    document_id=result_id,
+                    data=result_data
+                )
+            except Exception as e:
+                if not is_not_found(e):
+                    raise
+                return await self._call(
+                    self.databases.create_document,
+                    database_id=self.database_id,
+                    collection_id=self.stage_results_collection_id,
+                    document_id=result_id,
+                    data=result_data
+                )
+        except Exception as e:
+            raise Exception(f"Failed to store stage result: {str(e)}")
+
+    # File storage methods
+    async def upload_file(self, file_id: str, filename: str, data: bytes, content_type: str) -> str:
+        """Upload a file to the marketing assets bucket and return its view URL"""
+        try:
+            await self._call(
+                self.storage.create_file,
+                bucket_id=self.assets_bucket_id,
+                file_id=file_id,
+                file=InputFile.from_bytes(data, filename=filename, mime_type=content_type)
+            )
+        except Exception as e:
+            raise Exception(f"Failed to upload file: {str(e)}")
+        return f"{self.endpoint}/storage/buckets/{self.assets_bucket_id}/files/{file_id}/view?project={self.project_id}"
+
+    async def read_file(self, file_id: str) -> Optional[bytes]:
+        """Download a file from the marketing assets bucket"""
+        try:
+            return await self._call(self.storage.get_file_view, bucket_id=self.assets_bucket_id, file_id=file_id)
+        except Exception as e:
+            if is_not_found(e):
+                return None
+            raise Exception(f"Failed to read file: {str(e)}")
+
     # Session methods
     async def create_session(self, session_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new session record"""
         try:
-            return self.databases.create_document(
+            return await self._call(
+                self.databases.create_document,
                 database_id=self.database_id,
                 collection_id=self.sessions_collection_id,
                 document_id=ID.unique(),
@@ -434,42 +439,22 @@ class AppwriteService:
         except Exception as e:
             raise Exception(f"Failed to create session: {str(e)}")
 
-    async def get_user_sessions(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get all sessions for a user"""
-        try:
-            # Try to query with user_id first
-            response = self.databases.list_documents(
-                database_id=self.database_id,
-                collection_id=self.sessions_collection_id,
-                queries=[
-                    Query.equal("user_id", user_id),
-                    Query.order_desc("last_accessed")
-                ],
-                limit=limit
-            )
-            return response.get("documents", [])
-        except Exception as e:
-            print(f"Failed to get user sessions with user_id, trying without: {e}")
-            # If that fails, try without user_id filter
-            try:
-                response = self.databases.list_documents(
-                    database_id=self.database_id,
-                    collection_id=self.sessions_collection_id,
-                    queries=[
-                        Query.order_desc("last_accessed")
-                    ],
-                    limit=limit
-                )
-                return response.get("documents", [])
-            except Exception as e2:
-                print(f"Failed to get user sessions: {e2}")
-                return []
+    async def list_user_sessions_page(
+        self, user_id: str, limit: int = 25, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get one page of a user's sessions, most recently accessed first"""
+        return await self._list_page(
+            self.sessions_collection_id,
+            [Query.equal("user_id", user_id), Query.order_desc("last_accessed")],
+            limit,
+            cursor
+        )
 
     async def get_active_session(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get the active session for a user"""
         try:
-            # Try to query with user_id first
-            sessions = self.databases.list_documents(
+            sessions = await self._call(
+                self.databases.list_documents,
                 database_id=self.database_id,
                 collection_id=self.sessions_collection_id,
                 queries=[
@@ -479,31 +464,18 @@ class AppwriteService:
                     Query.limit(1)
                 ]
             )
-            if sessions.documents:
-                return sessions.documents[0]
+            documents = sessions.get("documents", [])
+            if documents:
+                return documents[0]
         except Exception as e:
-            print(f"Failed to get active session with user_id, trying without: {e}")
-            # If that fails, try without user_id filter
-            try:
-                sessions = self.databases.list_documents(
-                    database_id=self.database_id,
-                    collection_id=self.sessions_collection_id,
-                    queries=[
-                        Query.equal("is_active", True),
-                        Query.order_desc("last_accessed"),
-                        Query.limit(1)
-                    ]
-                )
-                if sessions.documents:
-                    return sessions.documents[0]
-            except Exception as e2:
-                print(f"Failed to get active session: {e2}")
+            logger.warning("Failed to get active session", user_id=user_id, error=str(e))
         return None
 
     async def update_session(self, session_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
         """Update session record"""
         try:
-            return self.databases.update_document(
+            return await self._call(
+                self.databases.update_document,
                 database_id=self.database_id,
                 collection_id=self.sessions_collection_id,
                 document_id=session_id,
@@ -513,30 +485,47 @@ class AppwriteService:
             raise Exception(f"Failed to update session: {str(e)}")
 
     async def set_active_session(self, user_id: str, session_id: str) -> Dict[str, Any]:
-        """Set a session as active and deactivate others"""
+        """Set a session as active and deactivate others.
+
+        Only sessions that are currently active are touched (normally at most
+        one), found via the (user_id, is_active, last_accessed) index, and all
+        updates run concurrently, so switching costs a constant number of
+        round-trips regardless of how many sessions the user has.
+        """
         try:
-            # Deactivate all other sessions for this user
-            response = self.databases.list_documents(
+            response = await self._call(
+                self.databases.list_documents,
                 database_id=self.database_id,
                 collection_id=self.sessions_collection_id,
-                queries=[Query.equal("user_id", user_id)]
+                queries=[
+                    Query.equal("user_id", user_id),
+                    Query.equal("is_active", True),
+                    Query.not_equal("$id", session_id),
+                    Query.limit(self.max_page_size)
+                ]
             )
-            
-            for doc in response.get("documents", []):
-                if doc["$id"] != session_id:
-                    self.databases.update_document(
-                        database_id=self.database_id,
-                        collection_id=self.sessions_collection_id,
-                        document_id=doc["$id"],
-                        data={"is_active": False}
-                    )
-            
-            # Activate the specified session
-            return self.databases.update_document(
-                database_id=self.database_id,
-                collection_id=self.sessions_collection_id,
-                document_id=session_id,
-                data={"is_active": True}
+
+            updates = [
+                self._call(
+                    self.databases.update_document,
+                    database_id=self.database_id,
+                    collection_id=self.sessions_collection_id,
+                    document_id=doc["$id"],
+                    data={"is_active": False}
+                )
+                for doc in response.get("documents", [])
+            ]
+            # Activate the specified session alongside the deactivations
+            activated, *_ = await asyncio.gather(
+                self._call(
+                    self.databases.update_document,
+                    database_id=self.database_id,
+                    collection_id=self.sessions_collection_id,
+                    document_id=session_id,
+                    data={"is_active": True}
+                ),
+                *updates
             )
+            return activated
         except Exception as e:
-            raise Exception(f"Failed to set active session: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"Failed to set active session: {str(e)}")
@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import base64
+import asyncio
+import hashlib
+from typing import Dict, Any, Optional
+
+import structlog
+
+from .cache import TTLCache
+
+logger = structlog.get_logger(__name__)
+
+# Per-request authentication with Appwrite JWTs.
+#
+# Clients send the JWT from `account.createJWT()` as "Authorization: Bearer
+# <jwt>" (or X-Appwrite-JWT). The first request with a token verifies it
+# against Appwrite as that user; the result is cached, so later requests with
+# the same token cost no network round-trip. Entries expire after
+# AUTH_CACHE_TTL or when the JWT itself expires, whichever is sooner, and are
+# evicted least-recently-used beyond AUTH_CACHE_SIZE. Rejected and logged-out
+# tokens are remembered too, so they are refused locally as well.
+#
+#   AUTH_CACHE_TTL=300         seconds a verified token is trusted without re-checking
+#   AUTH_CACHE_SIZE=10000      cached tokens
+#   AUTH_NEGATIVE_TTL=30       seconds a rejected token is refused without re-checking
+
+
+def token_key(token: str) -> str:
+    """Cache key for a token; raw tokens are not kept in memory"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def jwt_expiry(token: str) -> Optional[float]:
+    """The `exp` claim of a JWT, read without verifying it
+
+    Only ever used to shorten how long a token Appwrite has accepted is
+    cached, never to accept one.
+    """
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class SessionAuthenticator:
+    """Verifies JWTs against Appwrite and caches the outcome"""
+
+    def __init__(self, appwrite_service, ttl: Optional[float] = None, maxsize: Optional[int] = None):
+        self.appwrite_service = appwrite_service
+        self.ttl = ttl if ttl is not None else float(os.getenv("AUTH_CACHE_TTL", "300"))
+        maxsize = maxsize if maxsize is not None else int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+        self.sessions = TTLCache("auth_session", maxsize=maxsize, ttl=self.ttl)
+        self.rejected = TTLCache("auth_rejected", maxsize=maxsize, ttl=float(os.getenv("AUTH_NEGATIVE_TTL", "30")))
+        # Concurrent first requests with the same token share one verification
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    def _ttl_for(self, token: str) -> float:
+        expires_at = jwt_expiry(token)
+        if expires_at is None:
+            return self.ttl
+        return max(0.0, min(self.ttl, expires_at - time.time()))
+
+    async def authenticate(self, token: str) -> Optional[Dict[str, Any]]:
+        """The user a token belongs to, or None if it is invalid, expired or revoked"""
+        key = token_key(token)
+        user = self.sessions.get(key)
+        if user is not None:
+            return user
+        if self.rejected.get(key) is not None:
+            return None
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            user = await self.appwrite_service.get_user_for_jwt(token)
+            if user is None:
+                self.rejected.set(key, True)
+            else:
+                ttl = self._ttl_for(token)
+                if ttl > 0:
+                    self.sessions.set(key, user, ttl=ttl)
+            future.set_result(user)
+            return user
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it; retrieve it here so an unawaited future doesn't warn
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    def revoke(self, token: str):
+        """Forget a token and refuse it locally until it would have expired"""
+        key = token_key(token)
+        self.sessions.delete(key)
+        self.rejected.set(key, True, ttl=self._ttl_for(token) or self.ttl)
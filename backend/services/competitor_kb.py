@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from urllib.parse import urlsplit
+from typing import Dict, Any, Iterable, List, Optional
+
+import structlog
+
+from .metrics import COMPETITOR_KB_LOOKUPS
+from .tracing import tracer, run_in_context
+from .schema_migrations import local_state_dir
+
+logger = structlog.get_logger(__name__)
+
+# Competitor knowledge base shared by all analyses.
+#
+# Competitors found by the competitor-research agent are stored once per
+# domain (name, website, market share, strengths, weaknesses, when they were
+# first and last seen) and indexed by the market categories they were found
+# in. An analysis in a category the index already knows is seeded from it: with
+# COMPETITOR_KB_MIN_SEED competitors seen within COMPETITOR_KB_MAX_AGE_DAYS
+# the agent is skipped entirely, otherwise it is only asked for competitors
+# beyond the known ones.
+#
+#   COMPETITOR_KB=true                 set to false to always ask the agent
+#   COMPETITOR_KB_PATH=.competeiq/competitors.db
+#   COMPETITOR_KB_MIN_SEED=3           known competitors needed to skip the agent
+#   COMPETITOR_KB_MAX_AGE_DAYS=30      ignore competitors not seen since
+#   COMPETITOR_KB_LIMIT=8              competitors returned per category
+#
+# Queries run in the default executor, so they never block the event loop.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS competitors (
+    domain TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    website TEXT NOT NULL,
+    market_share REAL,
+    strengths TEXT NOT NULL,
+    weaknesses TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    seen_count INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS competitor_categories (
+    category TEXT NOT NULL,
+    domain TEXT NOT NULL REFERENCES competitors (domain),
+    last_seen REAL NOT NULL,
+    seen_count INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (category, domain)
+);
+CREATE INDEX IF NOT EXISTS competitor_categories_recent
+    ON competitor_categories (category, last_seen DESC);
+"""
+
+
+def domain_of(url: Optional[str]) -> str:
+    """Registrable-looking host of a URL ("https://www.Acme.com/x" -> "acme.com"), or "" """
+    url = (url or "").strip().lower()
+    if not url:
+        return ""
+    host = urlsplit(url if "://" in url else f"https://{url}").hostname or ""
+    return host.removeprefix("www.")
+
+
+def category_key(category: Optional[str]) -> str:
+    return " ".join((category or "").lower().split())
+
+
+def competitor_list(output: Any) -> List[Dict[str, Any]]:
+    """Competitor stage output (one model, one dict or a list of either) as a list of dicts"""
+    if output is None:
+        return []
+    items = output if isinstance(output, (list, tuple)) else [output]
+    competitors = []
+    for item in items:
+        if hasattr(item, "model_dump"):
+            item = item.model_dump()
+        if isinstance(item, dict) and item.get("name"):
+            competitors.append(item)
+    return competitors
+
+
+def merge_competitors(*groups: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Concatenate competitor lists, keeping the first entry per domain (or name, without a website)"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for group in groups:
+        for competitor in group:
+            key = domain_of(competitor.get("website")) or competitor["name"].lower()
+            merged.setdefault(key, competitor)
+    return list(merged.values())
+
+
+class CompetitorKnowledgeBase:
+    """SQLite-backed competitor entities, deduplicated by domain and indexed by market category"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.enabled = os.getenv("COMPETITOR_KB", "true").lower() == "true"
+        self.path = path or os.getenv("COMPETITOR_KB_PATH", os.path.join(local_state_dir(), "competitors.db"))
+        self.min_seed = int(os.getenv("COMPETITOR_KB_MIN_SEED", "3"))
+        self.max_age = float(os.getenv("COMPETITOR_KB_MAX_AGE_DAYS", "30")) * 86400
+        self.limit = int(os.getenv("COMPETITOR_KB_LIMIT", "8"))
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def _call(self, fn, *args, **kwargs):
+        """Run a blocking (locked) SQLite operation in the default executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, run_in_context(fn, *args, **kwargs))
+
+    @staticmethod
+    def _to_competitor(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "name": row["name"],
+            "website": row["website"],
+            "market_share": row["market_share"] or 0.0,
+            "strengths": json.loads(row["strengths"]),
+            "weaknesses": json.loads(row["weaknesses"]),
+            "last_seen": row["last_seen"]
+        }
+
+    async def record(self, category: str, competitors: List[Dict[str, Any]], exclude_domains: Iterable[str] = ()) -> int:
+        """Upsert competitors found for a category; returns how many were stored"""
+        return await self._call(self._record, category, competitors, exclude_domains)
+
+    def _record(self, category: str, competitors: List[Dict[str, Any]], exclude_domains: Iterable[str]) -> int:
+        category = category_key(category)
+        excluded = set(exclude_domains)
+        now = time.time()
+        stored = 0
+        with tracer.child_span("competitor_kb.record", {"category": category}), self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for competitor in competitors:
+                    domain = domain_of(competitor.get("website"))
+                    if not domain or domain in excluded:
+                        continue
+                    # Newer findings replace older ones, except where they are empty
+                    conn.execute(
+                        "INSERT INTO competitors (domain, name, website, market_share, strengths, weaknesses, first_seen, last_seen)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                        " ON CONFLICT (domain) DO UPDATE SET name = excluded.name, website = excluded.website,"
+                        " market_share = COALESCE(excluded.market_share, market_share),"
+                        " strengths = CASE WHEN excluded.strengths = '[]' THEN strengths ELSE excluded.strengths END,"
+                        " weaknesses = CASE WHEN excluded.weaknesses = '[]' THEN weaknesses ELSE excluded.weaknesses END,"
+                        " last_seen = excluded.last_seen, seen_count = seen_count + 1",
+                        (
+                            domain, competitor["name"], competitor.get("website") or f"https://{domain}",
+                            competitor.get("market_share"),
+                            json.dumps(competitor.get("strengths") or []), json.dumps(competitor.get("weaknesses") or []),
+                            now, now
+                        )
+                    )
+                    conn.execute(
+                        "INSERT INTO competitor_categories (category, domain, last_seen) VALUES (?, ?, ?)"
+                        " ON CONFLICT (category, domain) DO UPDATE SET last_seen = excluded.last_seen,"
+                        " seen_count = seen_count + 1",
+                        (category, domain, now)
+                    )
+                    stored += 1
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return stored
+
+    async def for_category(self, category: str, exclude_domains: Iterable[str] = (),
+                           limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Competitors seen recently in a category, most often seen first"""
+        return await self._call(self._for_category, category, exclude_domains, limit)
+
+    def _for_category(self, category: str, exclude_domains: Iterable[str], limit: Optional[int]) -> List[Dict[str, Any]]:
+        excluded = [domain for domain in exclude_domains if domain]
+        with tracer.child_span("competitor_kb.for_category"), self._lock:
+            rows = self._connect().execute(
+                "SELECT c.* FROM competitor_categories cc JOIN competitors c ON c.domain = cc.domain"
+                " WHERE cc.category = ? AND cc.last_seen >= ?"
+                f" AND cc.domain NOT IN ({', '.join('?' for _ in excluded)})"
+                " ORDER BY cc.seen_count DESC, cc.last_seen DESC LIMIT ?",
+                [category_key(category), time.time() - self.max_age, *excluded, limit or self.limit]
+            ).fetchall()
+        return [self._to_competitor(row) for row in rows]
+
+    async def seed(self, category: str, exclude_domains: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """Known competitors to start an analysis from, shaped like agent output (recorded as a lookup outcome)"""
+        try:
+            known = [
+                {key: value for key, value in competitor.items() if key != "last_seen"}
+                for competitor in await self.for_category(category, exclude_domains)
+            ]
+        except Exception as e:
+            logger.warning("Competitor knowledge base lookup failed", error=str(e))
+            known = []
+        if len(known) >= self.min_seed:
+            outcome = "seeded"
+        else:
+            outcome = "partial" if known else "empty"
+        COMPETITOR_KB_LOOKUPS.labels(outcome).inc()
+        return known
+
+    async def categories(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Indexed categories with how many competitors each has"""
+        return await self._call(self._categories, limit)
+
+    def _categories(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT category, COUNT(*) AS competitors, MAX(last_seen) AS last_seen FROM competitor_categories"
+                " GROUP BY category ORDER BY competitors DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
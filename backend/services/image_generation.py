@@ -0,0 +1,199 @@
+import os
+import re
+import time
+import uuid
+import zlib
+import base64
+import struct
+import asyncio
+import hashlib
+from typing import Dict, Any, AsyncIterator, List, Optional
+
+import structlog
+
+from .metrics import PROVIDER_LATENCY, IMAGE_TIME_TO_FIRST
+from .rate_limit import RateLimiter
+from .admission import provider_load
+
+logger = structlog.get_logger(__name__)
+
+# Marketing image generation.
+#
+# The script is split into N scenes, each turned into an image prompt. Images
+# are generated concurrently, bounded by IMAGE_CONCURRENCY in-flight requests
+# and IMAGE_RATE_PER_MINUTE, uploaded to storage as soon as each one is ready
+# (so uploads overlap with the remaining generations), and yielded in
+# completion order so clients can show the first image early.
+#
+#   IMAGE_PROVIDER=openai|stub   (default: openai when OPENAI_API_KEY is set)
+#   IMAGE_MODEL=dall-e-3, IMAGE_SIZE=1024x1024
+#   IMAGE_STUB_LATENCY_MS=1500   simulated provider latency for the stub
+
+# Speaking rate used to place scenes on the voice-over timeline
+WORDS_PER_SECOND = 2.5
+
+STYLE_HINTS = {
+    "professional": "clean corporate photography, soft natural light",
+    "casual": "bright, friendly lifestyle photography",
+    "technical": "sleek isometric technology illustration"
+}
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in re.split(r"(?<=[.!?])\s+", " ".join(text.split())) if s.strip()]
+
+
+def derive_image_prompts(script: str, company_name: str, style: str, count: int) -> List[Dict[str, Any]]:
+    """Split the script into `count` consecutive scenes and build one prompt per scene"""
+    sentences = split_sentences(script) or [f"{company_name} product showcase"]
+    count = max(1, min(count, len(sentences)))
+    per_scene = len(sentences) / count
+    hint = STYLE_HINTS.get(style, STYLE_HINTS["professional"])
+    prompts = []
+    words_before = 0
+    for index in range(count):
+        scene = " ".join(sentences[int(index * per_scene):int((index + 1) * per_scene)])
+        prompts.append({
+            "index": index,
+            # When the scene starts in the voice-over, in seconds
+            "timestamp": round(words_before / WORDS_PER_SECOND, 1),
+            "prompt": f"Marketing image for {company_name}, {hint}. Scene: {scene[:600]} No text or logos."
+        })
+        words_before += len(scene.split())
+    return prompts
+
+
+class ImageProvider:
+    name = "base"
+    content_type = "image/png"
+    extension = "png"
+
+    async def generate(self, prompt: str) -> bytes:
+        raise NotImplementedError
+
+
+class OpenAIImageProvider(ImageProvider):
+    name = "openai"
+
+    def __init__(self, model: Optional[str] = None, size: Optional[str] = None):
+        self.model = model or os.getenv("IMAGE_MODEL", "dall-e-3")
+        self.size = size or os.getenv("IMAGE_SIZE", "1024x1024")
+        self._client = None
+
+    async def generate(self, prompt: str) -> bytes:
+        if self._client is None:
+            from openai import AsyncOpenAI
+            self._client = AsyncOpenAI()
+        # DALL-E returns URLs unless asked for base64; gpt-image models always return base64
+        extra = {"response_format": "b64_json"} if self.model.startswith("dall-e") else {}
+        response = await self._client.images.generate(model=self.model, prompt=prompt, size=self.size, n=1, **extra)
+        return base64.b64decode(response.data[0].b64_json)
+
+
+def _png(width: int, height: int, rgb: tuple) -> bytes:
+    """Minimal solid-colour PNG"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    row = b"\x00" + bytes(rgb) * width
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(row * height))
+        + chunk(b"IEND", b"")
+    )
+
+
+class StubImageProvider(ImageProvider):
+    """Offline provider: a solid-colour PNG derived from the prompt after a simulated delay"""
+    name = "stub"
+
+    def __init__(self, latency_ms: Optional[float] = None):
+        self.latency = float(latency_ms if latency_ms is not None else os.getenv("IMAGE_STUB_LATENCY_MS", "1500")) / 1000
+
+    async def generate(self, prompt: str) -> bytes:
+        await asyncio.sleep(self.latency)
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        return _png(64, 64, tuple(digest[:3]))
+
+
+def create_image_provider() -> ImageProvider:
+    provider = os.getenv("IMAGE_PROVIDER") or ("openai" if os.getenv("OPENAI_API_KEY") else "stub")
+    if provider == "openai":
+        return OpenAIImageProvider()
+    if provider == "stub":
+        return StubImageProvider()
+    raise ValueError(f"Unknown IMAGE_PROVIDER: {provider}")
+
+
+class ImagePipeline:
+    """Generates a script's images concurrently under a concurrency and rate budget"""
+
+    def __init__(self, provider: Optional[ImageProvider] = None):
+        self._provider = provider
+        self.concurrency = asyncio.Semaphore(int(os.getenv("IMAGE_CONCURRENCY", "3")))
+        self.rate_limiter = RateLimiter(float(os.getenv("IMAGE_RATE_PER_MINUTE", "30")))
+
+    @property
+    def provider(self) -> ImageProvider:
+        if self._provider is None:
+            self._provider = create_image_provider()
+        return self._provider
+
+    async def _generate_one(self, item: Dict[str, Any], storage) -> Dict[str, Any]:
+        try:
+            with provider_load.track(self.provider.name):
+                return await self._generate_and_store(item, storage)
+        except Exception as e:
+            logger.warning("Image generation failed", index=item["index"], error=str(e))
+            return {**item, "error": str(e)}
+
+    async def _generate_and_store(self, item: Dict[str, Any], storage) -> Dict[str, Any]:
+        provider = self.provider
+        async with self.concurrency:
+            await self.rate_limiter.acquire()
+            start = time.perf_counter()
+            status = "ok"
+            try:
+                data = await provider.generate(item["prompt"])
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                PROVIDER_LATENCY.labels(provider.name, "image", status).observe(time.perf_counter() - start)
+
+        image = {**item, "source": provider.name}
+        file_id = f"{uuid.uuid4().hex}.{provider.extension}"
+        if storage is not None:
+            # Upload outside the semaphore so it overlaps with the next generations
+            image["url"] = await storage.upload_file(
+                file_id, f"image-{item['index']}.{provider.extension}", data, provider.content_type
+            )
+        else:
+            image["url"] = f"data:{provider.content_type};base64,{base64.b64encode(data).decode('ascii')}"
+        return image
+
+    async def stream(
+        self, script: str, company_name: str, style: str = "professional", count: int = 3, storage=None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield images as they complete; failed images are yielded with an "error" instead of a "url" """
+        prompts = derive_image_prompts(script, company_name, style, count)
+        started = time.perf_counter()
+        first = True
+        tasks = [asyncio.create_task(self._generate_one(item, storage)) for item in prompts]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                image = await next_done
+                if first and "url" in image:
+                    IMAGE_TIME_TO_FIRST.labels(self.provider.name).observe(time.perf_counter() - started)
+                    first = False
+                yield image
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def generate(self, script: str, company_name: str, style: str = "professional",
+                       count: int = 3, storage=None) -> List[Dict[str, Any]]:
+        """All images, in script order (failed ones included with an "error")"""
+        images = [image async for image in self.stream(script, company_name, style, count, storage)]
+        return sorted(images, key=lambda image: image.get("index", 0))
@@ -0,0 +1,139 @@
+import os
+import sys
+import queue
+import random
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+import structlog
+
+from .metrics import LOG_RECORDS_DROPPED
+from .tracing import tracer
+
+# Structured, non-blocking logging on structlog.
+#
+# structlog builds the event dict on the calling thread; the record is then
+# put on a bounded in-memory queue and rendered and written by a background
+# QueueListener thread, so a slow stdout/log collector never stalls the event
+# loop. When the queue is full, records are dropped (and counted) rather than
+# blocking. Debug events are sampled (LOG_DEBUG_SAMPLE_RATE) and every event
+# logged inside `bound_contextvars(analysis_id=...)` carries that context.
+#
+#   LOG_LEVEL=INFO                 minimum level
+#   LOG_FORMAT=console|json        human-readable or JSON lines
+#   LOG_DEBUG_SAMPLE_RATE=0.1      fraction of debug events kept
+#   LOG_QUEUE_SIZE=10000           records buffered before dropping
+
+_listener: Optional[QueueListener] = None
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full and leaves rendering to the listener"""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The default prepare() formats the message on the calling thread,
+        # which would also stringify structlog's event dict; the record never
+        # leaves the process, so hand it over untouched.
+        return record
+
+
+def _sample_debug(rate: float):
+    def processor(logger, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+        if method_name == "debug" and rate < 1.0 and random.random() >= rate:
+            raise structlog.DropEvent
+        return event_dict
+    return processor
+
+
+def _add_trace_context(logger, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    span = tracer.current_span()
+    if span is not None:
+        event_dict.setdefault("trace_id", span.trace_id)
+        event_dict.setdefault("span_id", span.span_id)
+    return event_dict
+
+
+def _capture_exc_info(logger, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+    # Rendering happens on the listener thread, where sys.exc_info() is empty
+    if event_dict.get("exc_info") is True:
+        event_dict["exc_info"] = sys.exc_info()
+    return event_dict
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None):
+    """Configure structlog and the stdlib root logger (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    level_name = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "console")).lower()
+    sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+    queue_size = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+    shared_processors = [
+        structlog.contextvars.merge_contextvars,
+        structlog.stdlib.add_logger_name,
+        structlog.stdlib.add_log_level,
+        _add_trace_context,
+        structlog.processors.TimeStamper(fmt="iso", utc=True)
+    ]
+
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            _sample_debug(sample_rate),
+            *shared_processors,
+            structlog.processors.StackInfoRenderer(),
+            structlog.dev.set_exc_info,
+            _capture_exc_info,
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True
+    )
+
+    renderer = (
+        structlog.processors.JSONRenderer()
+        if fmt == "json"
+        else structlog.dev.ConsoleRenderer(colors=sys.stdout.isatty())
+    )
+    render_processors = [structlog.stdlib.ProcessorFormatter.remove_processors_meta]
+    if fmt == "json":
+        render_processors.append(structlog.processors.format_exc_info)
+    render_processors.append(renderer)
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(structlog.stdlib.ProcessorFormatter(
+        processors=render_processors,
+        # Records from stdlib loggers (uvicorn, httpx, ...) get the same fields
+        foreign_pre_chain=shared_processors
+    ))
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=queue_size)
+    root = logging.getLogger()
+    root.handlers = [_NonBlockingQueueHandler(log_queue)]
+    root.setLevel(level_name)
+    # httpx logs every request at INFO, which is noise on hot paths
+    logging.getLogger("httpx").setLevel(max(logging.WARNING, root.level))
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the background writer"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
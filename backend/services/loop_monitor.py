@@ -0,0 +1,264 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+import structlog
+
+from .metrics import LOOP_LAG, LOOP_BLOCKS
+
+# Event-loop lag monitor and blocking-call detector.
+#
+# A heartbeat task on the loop measures how late asyncio.sleep wakes up (lag).
+# A watchdog thread notices when the heartbeat stops beating for longer than
+# the threshold and captures the loop thread's stack at that moment, i.e. the
+# code that is blocking it. Stalls are attributed to the endpoint or analysis
+# stage running in the blocking task, labelled with `activity(...)`.
+
+logger = structlog.get_logger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_STACK_FRAMES = 30
+
+# Activity labels per task; a stack so labels nest (endpoint -> stage)
+_task_labels: Dict[asyncio.Task, List[str]] = {}
+
+
+@contextmanager
+def activity(label: str):
+    """Label the current task (endpoint, stage, ...) so blocking calls in it can be attributed"""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is None:
+        yield
+        return
+
+    labels = _task_labels.setdefault(task, [])
+    labels.append(label)
+    try:
+        yield
+    finally:
+        labels.pop()
+        if not labels:
+            _task_labels.pop(task, None)
+
+
+def _describe_task(task: Optional[asyncio.Task]) -> str:
+    if task is None:
+        return "<loop callback>"
+    labels = _task_labels.get(task)
+    if labels:
+        return " > ".join(labels)
+    coro = task.get_coro()
+    return getattr(coro, "__qualname__", None) or task.get_name()
+
+
+def _blocking_site(stack: traceback.StackSummary) -> str:
+    """Innermost application frame of a stack (skipping stdlib/site-packages and this module)"""
+    for frame in reversed(stack):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(BACKEND_DIR) and "site-packages" not in filename and filename != __file__:
+            return f"{os.path.relpath(filename, BACKEND_DIR)}:{frame.lineno} in {frame.name}"
+    frame = stack[-1] if stack else None
+    return f"{frame.filename}:{frame.lineno} in {frame.name}" if frame else "<unknown>"
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+class LoopMonitor:
+    """Samples event-loop lag and reports callbacks that block the loop"""
+
+    def __init__(self):
+        self.enabled = os.getenv("LOOP_MONITOR", "true").lower() == "true"
+        self.interval = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "50")) / 1000
+        self.threshold = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100")) / 1000
+        self.lag_samples: deque = deque(maxlen=1200)
+        self.stalls: deque = deque(maxlen=50)
+        self.offenders: Dict[str, Dict[str, Any]] = {}
+        self.started_at: Optional[float] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._last_beat = time.monotonic()
+        self._pending: Optional[Dict[str, Any]] = None
+
+    @property
+    def running(self) -> bool:
+        return self._heartbeat is not None and not self._heartbeat.done()
+
+    def start(self):
+        """Start monitoring the running event loop (call from inside the loop)"""
+        if not self.enabled or self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self.started_at = time.time()
+        self._heartbeat = self._loop.create_task(self._beat(), name="loop-monitor-heartbeat")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info("Event loop monitor started", threshold_ms=self.threshold * 1000)
+
+    async def stop(self):
+        self._stop.set()
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+
+    async def _beat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self._last_beat = time.monotonic()
+            self.lag_samples.append(lag)
+            LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                self._record_stall(lag)
+
+    def _watch(self):
+        """Watchdog thread: capture the loop thread's stack while the heartbeat is overdue"""
+        poll = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(poll):
+            overdue = time.monotonic() - self._last_beat - self.interval
+            if overdue < self.threshold:
+                continue
+            with self._lock:
+                if self._pending is not None:
+                    continue
+                task = self._current_task()
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is None or self._current_task() is not task:
+                    continue  # the loop moved on while we looked; retry on the next poll
+                stack = traceback.extract_stack(frame)[-MAX_STACK_FRAMES:]
+                self._pending = {
+                    "activity": _describe_task(task),
+                    "site": _blocking_site(stack),
+                    "stack": traceback.format_list(stack)
+                }
+
+    def _current_task(self) -> Optional[asyncio.Task]:
+        try:
+            return asyncio.current_task(self._loop)
+        except RuntimeError:
+            return None
+
+    def _record_stall(self, lag: float):
+        """Called on the loop once the heartbeat resumes after a stall"""
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is None:
+            # Shorter than the watchdog's poll interval: the stack was missed
+            pending = {"activity": "<unknown>", "site": "<not captured>", "stack": []}
+
+        duration_ms = round(lag * 1000, 1)
+        stall = {"at": time.time(), "duration_ms": duration_ms, **pending}
+        self.stalls.append(stall)
+        LOOP_BLOCKS.labels(pending["activity"]).inc()
+
+        key = f"{pending['activity']} @ {pending['site']}"
+        offender = self.offenders.get(key)
+        if offender is None:
+            offender = self.offenders[key] = {
+                "activity": pending["activity"],
+                "site": pending["site"],
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0
+            }
+            # Log the full stack the first time a blocking site is seen
+            logger.warning(
+                "Event loop blocked", duration_ms=duration_ms, activity=pending["activity"],
+                site=pending["site"], stack="".join(pending["stack"]).rstrip()
+            )
+        else:
+            logger.warning(
+                "Event loop blocked", duration_ms=duration_ms, activity=pending["activity"],
+                site=pending["site"], seen=offender["count"] + 1
+            )
+        offender["count"] += 1
+        offender["total_ms"] = round(offender["total_ms"] + duration_ms, 1)
+        offender["max_ms"] = max(offender["max_ms"], duration_ms)
+
+    def recent_lag(self, samples: int = 20) -> float:
+        """Worst lag (seconds) over the last few heartbeats, including a beat that is overdue right now"""
+        if not self.running:
+            return 0.0
+        recent = list(self.lag_samples)[-samples:]
+        overdue = max(0.0, time.monotonic() - self._last_beat - self.interval)
+        return max(recent + [overdue])
+
+    def summary(self, stalls: int = 10) -> Dict[str, Any]:
+        """Lag percentiles, worst blocking sites and the most recent stalls"""
+        samples_ms = [lag * 1000 for lag in self.lag_samples]
+        offenders = sorted(self.offenders.values(), key=lambda o: o["total_ms"], reverse=True)
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "threshold_ms": self.threshold * 1000,
+            "interval_ms": self.interval * 1000,
+            "uptime_s": round(time.time() - self.started_at, 1) if self.started_at else 0.0,
+            "lag_ms": {
+                "samples": len(samples_ms),
+                "p50": round(_percentile(samples_ms, 50), 2),
+                "p99": round(_percentile(samples_ms, 99), 2),
+                "max": round(max(samples_ms, default=0.0), 2)
+            },
+            "blocked_count": sum(o["count"] for o in offenders),
+            "offenders": offenders[:20],
+            "recent_stalls": list(self.stalls)[-stalls:][::-1]
+        }
+
+
+class LoopMonitorMiddleware:
+    """ASGI middleware labelling each request's task with its route, e.g. "GET /api/analysis/{analysis_id}"
+
+    Pure ASGI (rather than @app.middleware) so the endpoint runs in the same
+    task as the label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        with activity(self._route_label(scope)):
+            await self.app(scope, receive, send)
+
+    @staticmethod
+    def _route_label(scope) -> str:
+        from starlette.routing import Match
+
+        method = scope.get("method", "WS")
+        app = scope.get("app")
+        for route in getattr(getattr(app, "router", None), "routes", []):
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return f"{method} {route.path}"
+        return f"{method} {scope.get('path', '')}"
+
+
+loop_monitor = LoopMonitor()
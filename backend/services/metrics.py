@@ -0,0 +1,381 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from .tracing import tracer
+
+# Dependency-free Prometheus metrics: counters, gauges and histograms with
+# labels, rendered in the text exposition format (version 0.0.4) on /metrics.
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        REGISTRY.register(self)
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(str(kwargs[name]) for name in self.labelnames)
+        else:
+            values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+            return child
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} requires labels {self.labelnames}")
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"]
+
+
+class _Value:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = float(value)
+
+    def get(self) -> float:
+        return self._value
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, values, child) -> List[str]:
+        with child._lock:
+            counts, total, count = list(child.counts), child.sum, child.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(child.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labelnames, values, ("le", _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# Application metrics
+STAGE_DURATION = Histogram(
+    "competeiq_analysis_stage_duration_seconds",
+    "Duration of each analysis stage",
+    ["stage", "status"]
+)
+PROVIDER_LATENCY = Histogram(
+    "competeiq_provider_request_duration_seconds",
+    "Latency of external provider calls (an agent run includes its OpenAI and tool calls)",
+    ["provider", "operation", "status"]
+)
+STORAGE_LATENCY = Histogram(
+    "competeiq_storage_request_duration_seconds",
+    "Latency of storage backend calls",
+    ["backend", "operation", "status"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LLM_TOKENS = Counter(
+    "competeiq_llm_tokens_total",
+    "OpenAI tokens used by agent runs",
+    ["agent", "type"]
+)
+TAVILY_CALLS = Counter(
+    "competeiq_tavily_calls_total",
+    "Tavily tool calls made by agent runs",
+    ["agent"]
+)
+FALLBACKS_USED = Counter(
+    "competeiq_fallbacks_total",
+    "Stages that fell back to default output instead of agent results",
+    ["stage"]
+)
+WEBSITE_FETCHES = Counter(
+    "competeiq_website_fetches_total",
+    "Company website fetches by outcome (fetched, not_modified, fresh, stale, disallowed, blocked, error)",
+    ["outcome"]
+)
+STAGE_RESULTS = Counter(
+    "competeiq_stage_results_total",
+    "Stage outputs by whether they were reused or recomputed (and why)",
+    ["stage", "outcome"]
+)
+COMPETITOR_KB_LOOKUPS = Counter(
+    "competeiq_competitor_kb_lookups_total",
+    "Competitor knowledge base lookups by outcome (seeded, partial, empty)",
+    ["outcome"]
+)
+SIMILAR_REQUESTS = Counter(
+    "competeiq_similar_requests_total",
+    "Near-duplicate request lookups by outcome (matched, below_threshold, empty)",
+    ["outcome"]
+)
+TREND_REPORT_LOOKUPS = Counter(
+    "competeiq_trend_report_lookups_total",
+    "Precomputed market trend report lookups by outcome (hit, stale, miss)",
+    ["outcome"]
+)
+TREND_REFRESHES = Counter(
+    "competeiq_trend_report_refreshes_total",
+    "Background market trend report refreshes by outcome (refreshed, failed)",
+    ["outcome"]
+)
+CACHE_HITS = Counter(
+    "competeiq_cache_hits_total",
+    "Cache hits",
+    ["cache"]
+)
+CACHE_MISSES = Counter(
+    "competeiq_cache_misses_total",
+    "Cache misses",
+    ["cache"]
+)
+ANALYSES_TOTAL = Counter(
+    "competeiq_analyses_total",
+    "Finished analyses by outcome",
+    ["status"]
+)
+ANALYSES_IN_FLIGHT = Gauge(
+    "competeiq_analyses_in_flight",
+    "Analyses currently running"
+)
+ANALYSES_QUEUED = Gauge(
+    "competeiq_analyses_queued",
+    "Analyses waiting for a scheduler slot",
+    ["priority"]
+)
+ANALYSIS_QUEUE_WAIT = Histogram(
+    "competeiq_analysis_queue_wait_seconds",
+    "Time analyses wait for a scheduler slot",
+    ["priority"]
+)
+ADMISSION_REJECTED = Counter(
+    "competeiq_admission_rejected_total",
+    "Analysis requests rejected by admission control",
+    ["reason", "priority"]
+)
+PROVIDER_IN_FLIGHT = Gauge(
+    "competeiq_provider_requests_in_flight",
+    "Provider calls queued or running",
+    ["provider"]
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    "competeiq_websocket_connections",
+    "Open progress WebSocket connections"
+)
+IMAGE_TIME_TO_FIRST = Histogram(
+    "competeiq_image_time_to_first_seconds",
+    "Time from starting an image batch to the first image being ready",
+    ["provider"]
+)
+TTS_TIME_TO_FIRST = Histogram(
+    "competeiq_tts_time_to_first_audio_seconds",
+    "Time from starting speech synthesis to the first audio chunk being ready",
+    ["provider"]
+)
+LOG_RECORDS_DROPPED = Counter(
+    "competeiq_log_records_dropped_total",
+    "Log records dropped because the logging queue was full"
+)
+LOOP_LAG = Histogram(
+    "competeiq_event_loop_lag_seconds",
+    "How late the event loop's heartbeat woke up",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_BLOCKS = Counter(
+    "competeiq_event_loop_blocked_total",
+    "Times the event loop was blocked beyond the threshold, by endpoint/stage",
+    ["activity"]
+)
+
+
+def record_agent_usage(agent: str, response: Any):
+    """Record token usage and Tavily tool calls from an Agno run response"""
+    metrics = getattr(response, "metrics", None) or {}
+    for key, token_type in (("input_tokens", "input"), ("output_tokens", "output")):
+        value = metrics.get(key) if isinstance(metrics, dict) else getattr(metrics, key, None)
+        if isinstance(value, (list, tuple)):
+            value = sum(v for v in value if v)
+        if value:
+            LLM_TOKENS.labels(agent, token_type).inc(value)
+
+    tools = getattr(response, "tools", None) or []
+    tavily_calls = 0
+    for tool in tools:
+        tool_name = tool.get("tool_name") if isinstance(tool, dict) else getattr(tool, "tool_name", "")
+        if tool_name and "tavily" in tool_name.lower():
+            tavily_calls += 1
+    if tavily_calls:
+        TAVILY_CALLS.labels(agent).inc(tavily_calls)
+
+
+class TimedClient:
+    """Proxy that records the latency of every method call on a blocking SDK client (and traces it)"""
+
+    def __init__(self, client: Any, backend: str, histogram: Histogram = STORAGE_LATENCY):
+        self._client = client
+        self._backend = backend
+        self._histogram = histogram
+
+    def __getattr__(self, name: str):
+        target = getattr(self._client, name)
+        if not callable(target):
+            return target
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            status = "ok"
+            with tracer.child_span(f"{self._backend}.{name}", {"db.operation": name}):
+                try:
+                    return target(*args, **kwargs)
+                except Exception:
+                    status = "error"
+                    raise
+                finally:
+                    self._histogram.labels(self._backend, name, status).observe(time.perf_counter() - start)
+
+        return call
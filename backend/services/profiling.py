@@ -0,0 +1,299 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import tracemalloc
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+import structlog
+
+from .schema_migrations import local_state_dir
+
+logger = structlog.get_logger(__name__)
+
+# On-demand CPU and allocation profiling.
+#
+# SamplingProfiler walks the Python stacks of running threads from a
+# background thread every few milliseconds (like py-spy, but in-process) and
+# aggregates them as collapsed stacks ("frame;frame;frame count"), the input
+# format of flamegraph.pl and speedscope. It can sample the whole process for
+# a time window, or only the event-loop thread while one analysis task is
+# running. MemoryTracker keeps tracemalloc snapshots taken after each
+# analysis so allocations can be diffed between them.
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_STACK_DEPTH = 128
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(BACKEND_DIR):
+        filename = os.path.relpath(filename, BACKEND_DIR)
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename})"
+
+
+def _collapse(frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Samples thread stacks into collapsed-stack counts
+
+    With `task` set, only the event-loop thread is sampled, and only while
+    that task is the one running on the loop.
+    """
+
+    def __init__(self, interval: float = 0.005, task: Optional[asyncio.Task] = None):
+        self.interval = interval
+        self.task = task
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self._loop = task.get_loop() if task else None
+        self._loop_thread_id = threading.get_ident() if task else None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = time.time() - self.started_at if self.started_at else 0.0
+        return self
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.task is not None:
+                if asyncio.current_task(self._loop) is not self.task:
+                    continue
+                frame = frames.get(self._loop_thread_id)
+                if frame is not None:
+                    self.samples[_collapse(frame)] += 1
+                    self.sample_count += 1
+                continue
+
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                self.samples[f"{names.get(thread_id, thread_id)};{_collapse(frame)}"] += 1
+            self.sample_count += 1
+
+    def collapsed(self) -> str:
+        """Collapsed stacks, one "stack count" per line, heaviest first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "started_at": self.started_at,
+            "duration_s": round(self.duration, 3),
+            "interval_ms": self.interval * 1000,
+            "samples": self.sample_count,
+            "unique_stacks": len(self.samples)
+        }
+
+
+class AnalysisProfiles:
+    """Arms profiling for upcoming analyses and keeps the captured profiles"""
+
+    def __init__(self, max_profiles: int = 20):
+        self.max_profiles = max_profiles
+        self.interval = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+        self.directory = os.path.join(local_state_dir(), "profiles")
+        self.profiles: "OrderedDict[str, SamplingProfiler]" = OrderedDict()
+        self._armed = 0
+        self._lock = threading.Lock()
+
+    def arm(self, count: int = 1) -> int:
+        with self._lock:
+            self._armed += count
+            return self._armed
+
+    @property
+    def armed(self) -> int:
+        return self._armed
+
+    def _take_armed(self) -> bool:
+        with self._lock:
+            if self._armed <= 0:
+                return False
+            self._armed -= 1
+            return True
+
+    @contextmanager
+    def profile(self, analysis_id: str):
+        """Profile the current task if profiling is armed (a no-op otherwise)"""
+        task = asyncio.current_task()
+        if task is None or not self._take_armed():
+            yield
+            return
+
+        profiler = SamplingProfiler(self.interval, task=task)
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            # Rendering and writing the profile is file I/O; keep it off the event loop
+            asyncio.get_running_loop().run_in_executor(None, self._store, analysis_id, profiler)
+
+    def _store(self, analysis_id: str, profiler: SamplingProfiler):
+        with self._lock:
+            self.profiles[analysis_id] = profiler
+            while len(self.profiles) > self.max_profiles:
+                self.profiles.popitem(last=False)
+        path = os.path.join(self.directory, f"{analysis_id}.collapsed")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "w") as f:
+                f.write(profiler.collapsed())
+        except OSError as e:
+            logger.warning("Failed to write profile", path=path, error=str(e))
+            path = None
+        logger.info("Captured analysis profile", analysis_id=analysis_id, path=path, **profiler.summary())
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            profiles = list(self.profiles.items())
+        return [{"analysis_id": analysis_id, **profiler.summary()} for analysis_id, profiler in reversed(profiles)]
+
+    def get(self, analysis_id: str) -> Optional[str]:
+        """The analysis's collapsed stacks, from memory or disk (blocking; run in the executor)"""
+        with self._lock:
+            profiler = self.profiles.get(analysis_id)
+        if profiler is not None:
+            return profiler.collapsed()
+        path = os.path.join(self.directory, f"{os.path.basename(analysis_id)}.collapsed")
+        if os.path.exists(path):
+            with open(path) as f:
+                return f.read()
+        return None
+
+
+class MemoryTracker:
+    """tracemalloc snapshots taken after each analysis, for diffing between analyses"""
+
+    def __init__(self, max_snapshots: int = 5):
+        self.max_snapshots = max_snapshots
+        self.snapshots: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Set only by start(): other tracemalloc users (benchmarks, tests) must not trigger snapshots
+        self._active = False
+        self._started_tracing = False
+
+    @property
+    def tracing(self) -> bool:
+        return self._active and tracemalloc.is_tracing()
+
+    def start(self, frames: int = 25):
+        self._active = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._started_tracing = True
+
+    def stop(self):
+        self._active = False
+        # Leave tracing on if someone else started it
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        with self._lock:
+            self.snapshots.clear()
+
+    def snapshot(self, label: str):
+        """Take a snapshot (blocking; run it in an executor)"""
+        if not self.tracing:
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>")
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            self.snapshots[label] = {"snapshot": snapshot, "taken_at": time.time(), "current": current, "peak": peak}
+            while len(self.snapshots) > self.max_snapshots:
+                self.snapshots.popitem(last=False)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"label": label, "taken_at": entry["taken_at"],
+                 "traced_kb": round(entry["current"] / 1024, 1), "peak_kb": round(entry["peak"] / 1024, 1)}
+                for label, entry in self.snapshots.items()
+            ]
+
+    def diff(self, base: Optional[str] = None, target: Optional[str] = None,
+             limit: int = 25, group_by: str = "lineno") -> Dict[str, Any]:
+        """Top allocation differences between two snapshots (default: the last two)"""
+        with self._lock:
+            labels = list(self.snapshots)
+            if len(labels) < 2 and not (base and target):
+                raise ValueError("Need at least two snapshots to diff")
+            base = base or labels[-2]
+            target = target or labels[-1]
+            if base not in self.snapshots or target not in self.snapshots:
+                raise ValueError(f"Unknown snapshot: {base if base not in self.snapshots else target}")
+            old, new = self.snapshots[base]["snapshot"], self.snapshots[target]["snapshot"]
+
+        stats = new.compare_to(old, group_by)
+        return {
+            "base": base,
+            "target": target,
+            "size_diff_kb": round(sum(stat.size_diff for stat in stats) / 1024, 1),
+            "top": [
+                {
+                    "location": str(stat.traceback[0]) if group_by != "traceback" else stat.traceback.format(),
+                    "size_diff_kb": round(stat.size_diff / 1024, 1),
+                    "size_kb": round(stat.size / 1024, 1),
+                    "count_diff": stat.count_diff
+                }
+                for stat in stats[:limit]
+            ]
+        }
+
+
+analysis_profiles = AnalysisProfiles()
+memory_tracker = MemoryTracker()
+
+
+@contextmanager
+def profile_analysis(analysis_id: str):
+    """Wrap one run_analysis: CPU profile if armed, memory snapshot afterwards if memory tracking is on"""
+    with analysis_profiles.profile(analysis_id):
+        try:
+            yield
+        finally:
+            if memory_tracker.tracing:
+                asyncio.get_running_loop().run_in_executor(None, memory_tracker.snapshot, analysis_id)
+
+
+async def profile_window(seconds: float, interval: float = 0.005) -> SamplingProfiler:
+    """Sample every thread of the process for a time window"""
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+    return profiler
@@ -0,0 +1,261 @@
+import os
+import re
+import json
+import time
+import zlib
+import uuid
+import asyncio
+from urllib.parse import urlsplit
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
+
+import structlog
+
+from .metrics import SIMILAR_REQUESTS
+from .schema_migrations import local_state_dir
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = structlog.get_logger(__name__)
+
+# Near-duplicate detection for analysis requests.
+#
+# The same company is often submitted under slightly different names, URLs
+# and descriptions ("Acme Inc." at http://www.acme.com/ vs "ACME" at
+# acme.com). Requests are first normalized (URL scheme, "www." and trailing
+# slash, case, punctuation and legal suffixes of the name, whitespace), which
+# makes stage-result fingerprints agree for trivially different spellings.
+# Beyond that, every analysed request is embedded as a hashed bag of
+# character and word n-grams per field, and an incremental analysis looks up
+# the most similar earlier request with one matrix-vector product; above
+# REQUEST_SIMILARITY_THRESHOLD (cosine) that request's stored stage outputs are
+# reused as well. The index keeps the latest request per company and is
+# persisted to disk as a .npz file. numpy is imported on first use, keeping
+# it out of the API's startup time.
+#
+#   REQUEST_INDEX=true                    set to false to disable similarity matching
+#   REQUEST_INDEX_PATH=.competeiq/request_index.npz
+#   REQUEST_INDEX_MAX_ENTRIES=5000        least recently analysed companies are evicted beyond this
+#   REQUEST_SIMILARITY_THRESHOLD=0.85     minimum cosine similarity to reuse results
+
+FIELD_DIMENSIONS = 128
+# Share of the cosine similarity each field contributes
+FIELD_WEIGHTS = {"name": 0.3, "website_url": 0.45, "product_description": 0.15, "market_category": 0.1}
+VECTOR_DIMENSIONS = FIELD_DIMENSIONS * len(FIELD_WEIGHTS)
+SAVE_DELAY = 5.0
+# Fields a near-duplicate may spell differently; its other stage inputs must match exactly
+IDENTITY_FIELDS = ("name", "website_url")
+
+LEGAL_SUFFIXES = {
+    "inc", "incorporated", "llc", "ltd", "limited", "corp", "corporation", "co", "company",
+    "gmbh", "ag", "sa", "sas", "bv", "plc", "pty", "oy", "ab"
+}
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def canonical_url(url: Optional[str]) -> str:
+    """Host (without "www.") and path (without trailing slash) of a URL, lowercased"""
+    url = (url or "").strip().lower()
+    if not url:
+        return ""
+    parts = urlsplit(url if "://" in url else f"https://{url}")
+    host = parts.netloc.removeprefix("www.")
+    return f"{host}{parts.path.rstrip('/')}" if host else ""
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """Lowercase words of a company name without punctuation or trailing legal suffixes"""
+    words = _NON_WORD.sub(" ", (name or "").lower()).split()
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+def normalize_request(company_data: Dict[str, Any]) -> Dict[str, str]:
+    """The request fields that identify a company, in canonical form"""
+    return {
+        "name": normalize_name(company_data.get("name")),
+        "website_url": canonical_url(company_data.get("website_url")),
+        "product_description": " ".join((company_data.get("product_description") or "").lower().split()),
+        "market_category": " ".join((company_data.get("market_category") or "").lower().split())
+    }
+
+
+def _features(field: str, value: str) -> List[str]:
+    if field == "website_url":
+        # Whole-host tokens keep acme.com and acme.io (often different companies) apart
+        host = value.split("/", 1)[0]
+        return [f"#{value}", f"#{host}"] + _char_ngrams(host)
+    if field == "name":
+        return [f"#{word}" for word in value.split()] + _char_ngrams(value)
+    words = _NON_WORD.sub(" ", value).split()
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def _char_ngrams(text: str, n: int = 3) -> List[str]:
+    padded = f" {text} "
+    return [padded[i:i + n] for i in range(len(padded) - n + 1)] if text else []
+
+
+def embed(request: Dict[str, str]) -> "np.ndarray":
+    """Unit-length hashed n-gram vector of a normalized request, one weighted block per field"""
+    import numpy as np
+
+    blocks = []
+    for field, weight in FIELD_WEIGHTS.items():
+        block = np.zeros(FIELD_DIMENSIONS, dtype=np.float32)
+        features = _features(field, request.get(field, ""))
+        if features:
+            hashes = np.array([zlib.crc32(feature.encode("utf-8")) for feature in features], dtype=np.uint32)
+            # The hash's top bit picks a sign, so colliding features tend to cancel out
+            signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+            np.add.at(block, hashes % FIELD_DIMENSIONS, signs)
+            norm = np.linalg.norm(block)
+            if norm:
+                block *= np.sqrt(weight) / norm
+        blocks.append(block)
+    vector = np.concatenate(blocks)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class RequestIndex:
+    """Nearest-neighbour index over earlier analysis requests, one entry per company"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.enabled = os.getenv("REQUEST_INDEX", "true").lower() == "true"
+        self.path = path or os.getenv("REQUEST_INDEX_PATH", os.path.join(local_state_dir(), "request_index.npz"))
+        self.max_entries = int(os.getenv("REQUEST_INDEX_MAX_ENTRIES", "5000"))
+        self.threshold = float(os.getenv("REQUEST_SIMILARITY_THRESHOLD", "0.85"))
+        # Rows past len(self._entries) are spare capacity; allocated on first load
+        self._vectors: Optional["np.ndarray"] = None
+        self._entries: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._save_task: Optional[asyncio.Task] = None
+
+    # Persistence
+    def _read(self):
+        import numpy as np
+
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                vectors = data["vectors"].astype(np.float32)
+                entries = json.loads(str(data["entries"]))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Failed to load request index; starting empty", path=self.path, error=str(e))
+            return None
+        if vectors.shape != (len(entries), VECTOR_DIMENSIONS):
+            logger.warning("Request index has a different layout; starting empty", path=self.path)
+            return None
+        return vectors, entries
+
+    def _write(self, vectors: "np.ndarray", entries: List[Dict[str, Any]]):
+        import numpy as np
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, vectors=vectors, entries=np.array(json.dumps(entries)))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Failed to save request index", path=self.path, error=str(e))
+
+    async def _ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            stored = await asyncio.get_running_loop().run_in_executor(None, self._read)
+            if stored is not None:
+                self._vectors, self._entries = stored
+                self._rows = {entry["key"]: row for row, entry in enumerate(self._entries)}
+            else:
+                import numpy as np
+
+                self._vectors = np.zeros((0, VECTOR_DIMENSIONS), dtype=np.float32)
+            self._loaded = True
+
+    def _schedule_save(self):
+        # Requests arrive in bursts; write the index once per burst
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.get_running_loop().create_task(self._save_later())
+
+    async def _save_later(self):
+        await asyncio.sleep(SAVE_DELAY)
+        size = len(self._entries)
+        await asyncio.get_running_loop().run_in_executor(None, self._write, self._vectors[:size].copy(), self._entries[:])
+
+    def flush(self):
+        """Write pending changes now (on shutdown)"""
+        if self._save_task is not None and not self._save_task.done():
+            self._save_task.cancel()
+            self._write(self._vectors[:len(self._entries)], self._entries)
+
+    # Index
+    async def add(self, key: str, request: Dict[str, str]):
+        """Record a company's latest analysed request"""
+        if not self.enabled:
+            return
+        # Loading runs in the executor and imports numpy there, off the event loop
+        await self._ensure_loaded()
+        import numpy as np
+
+        vector = embed(request)
+        entry = {"key": key, "request": request, "added_at": time.time()}
+        row = self._rows.get(key)
+        if row is None and len(self._entries) >= self.max_entries:
+            # Replace the company whose request is oldest
+            row = min(range(len(self._entries)), key=lambda index: self._entries[index]["added_at"])
+            del self._rows[self._entries[row]["key"]]
+        if row is None:
+            row = len(self._entries)
+            if row == len(self._vectors):
+                grown = np.zeros((max(64, 2 * row), self._vectors.shape[1]), dtype=np.float32)
+                grown[:row] = self._vectors
+                self._vectors = grown
+            self._vectors[row] = vector
+            self._entries.append(entry)
+        else:
+            self._vectors[row] = vector
+            self._entries[row] = entry
+        self._rows[key] = row
+        self._schedule_save()
+
+    async def nearest(self, request: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """The most similar earlier request other than this exact one: {"key", "request", "similarity"}"""
+        await self._ensure_loaded()
+        import numpy as np
+
+        if not self._entries:
+            return None
+        similarities = self._vectors[:len(self._entries)] @ embed(request)
+        # At most one entry (this company's own latest request) can be identical
+        for row in np.argsort(-similarities)[:2]:
+            entry = self._entries[row]
+            if entry["request"] != request:
+                return {"key": entry["key"], "request": entry["request"], "similarity": float(similarities[row])}
+        return None
+
+    async def match(self, request: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """The nearest earlier request if it is similar enough to reuse its results"""
+        if not self.enabled:
+            return None
+        try:
+            nearest = await self.nearest(request)
+        except Exception as e:
+            logger.warning("Request index lookup failed", error=str(e))
+            nearest = None
+        if nearest is None:
+            outcome = "empty"
+        elif nearest["similarity"] >= self.threshold:
+            outcome = "matched"
+        else:
+            outcome = "below_threshold"
+        SIMILAR_REQUESTS.labels(outcome).inc()
+        return nearest if outcome == "matched" else None
@@ -0,0 +1,206 @@
+import os
+import time
+import asyncio
+import itertools
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, Tuple
+
+import structlog
+
+from .metrics import ANALYSES_QUEUED, ANALYSIS_QUEUE_WAIT
+
+logger = structlog.get_logger(__name__)
+
+# Fair-share scheduling of analyses across tenants.
+#
+# Every analysis waits for one of ANALYSIS_CONCURRENCY slots. A tenant (user)
+# holds at most ANALYSIS_PER_USER_CONCURRENCY slots at a time, whatever it
+# submits. Interactive analyses are always dispatched before batch ones, and
+# batch work may only use ANALYSIS_BATCH_SHARE of the slots, so there is
+# always headroom for interactive users. Within a priority class, tenants are
+# served by weighted fair queuing (self-clocked: each job gets a virtual
+# finish tag of max(virtual time, tenant's last tag) + 1 / weight, and the
+# smallest tag goes first), so a tenant with a long queue gets its share
+# without pushing everyone else to the back.
+#
+#   ANALYSIS_CONCURRENCY=8               analyses running at once
+#   ANALYSIS_PER_USER_CONCURRENCY=2      per-tenant limit
+#   ANALYSIS_BATCH_SHARE=0.5             fraction of slots batch work may use
+#   ANALYSIS_TENANT_WEIGHTS=acme=2,bulk=0.5   WFQ weights (default 1)
+#   ANALYSIS_EXPECTED_DURATION=60        initial run-time estimate for wait estimates (s)
+
+PRIORITIES = ("interactive", "batch")
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        tenant, _, weight = item.rpartition("=")
+        if tenant:
+            weights[tenant] = float(weight)
+    return weights
+
+
+class _Job:
+    def __init__(self, job_id: str, user_id: str, priority: str, finish: float, seq: int):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.priority = priority
+        self.finish = finish
+        self.seq = seq
+        self.submitted_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.granted = asyncio.get_running_loop().create_future()
+
+    def sort_key(self) -> Tuple[int, float, int]:
+        return PRIORITIES.index(self.priority), self.finish, self.seq
+
+
+class FairScheduler:
+    """Admits analyses to a bounded number of slots, fairly across tenants"""
+
+    def __init__(self, capacity: Optional[int] = None, per_user: Optional[int] = None,
+                 batch_share: Optional[float] = None, weights: Optional[Dict[str, float]] = None):
+        self.capacity = capacity or int(os.getenv("ANALYSIS_CONCURRENCY", "8"))
+        self.per_user = per_user or int(os.getenv("ANALYSIS_PER_USER_CONCURRENCY", "2"))
+        share = batch_share if batch_share is not None else float(os.getenv("ANALYSIS_BATCH_SHARE", "0.5"))
+        self.batch_slots = max(1, int(self.capacity * share))
+        self.weights = weights if weights is not None else parse_weights(os.getenv("ANALYSIS_TENANT_WEIGHTS", ""))
+        self._waiting: Dict[str, _Job] = {}
+        self._running: Dict[str, _Job] = {}
+        self._running_by_user: Counter = Counter()
+        self._running_batch = 0
+        self._virtual_time = {priority: 0.0 for priority in PRIORITIES}
+        self._last_finish: Dict[Tuple[str, str], float] = {}
+        self._seq = itertools.count()
+        # Moving average of how long a job holds its slot, for wait estimates
+        self.average_run_time = float(os.getenv("ANALYSIS_EXPECTED_DURATION", "60"))
+
+    def _submit(self, job_id: str, user_id: str, priority: str) -> _Job:
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        key = (user_id, priority)
+        start = max(self._virtual_time[priority], self._last_finish.get(key, 0.0))
+        finish = start + 1.0 / self.weights.get(user_id, 1.0)
+        self._last_finish[key] = finish
+        job = _Job(job_id, user_id, priority, finish, next(self._seq))
+        self._waiting[job_id] = job
+        ANALYSES_QUEUED.labels(priority).inc()
+        self._dispatch()
+        return job
+
+    def _eligible(self, job: _Job) -> bool:
+        if self._running_by_user[job.user_id] >= self.per_user:
+            return False
+        return job.priority != "batch" or self._running_batch < self.batch_slots
+
+    def _dispatch(self):
+        while len(self._running) < self.capacity:
+            candidates = [job for job in self._waiting.values() if self._eligible(job)]
+            if not candidates:
+                return
+            job = min(candidates, key=_Job.sort_key)
+            del self._waiting[job.job_id]
+            ANALYSES_QUEUED.labels(job.priority).dec()
+            if job.granted.done():
+                # Cancelled while waiting; its task has not run its cleanup yet
+                continue
+            self._running[job.job_id] = job
+            self._running_by_user[job.user_id] += 1
+            if job.priority == "batch":
+                self._running_batch += 1
+            self._virtual_time[job.priority] = job.finish
+            job.started_at = time.perf_counter()
+            job.granted.set_result(None)
+
+    def _release(self, job: _Job):
+        if self._running.pop(job.job_id, None) is None:
+            return
+        self._running_by_user[job.user_id] -= 1
+        if not self._running_by_user[job.user_id]:
+            del self._running_by_user[job.user_id]
+        if job.priority == "batch":
+            self._running_batch -= 1
+        if job.started_at is not None:
+            self.average_run_time += 0.1 * (time.perf_counter() - job.started_at - self.average_run_time)
+        self._dispatch()
+
+    def submit(self, job_id: str, user_id: str, priority: str = "interactive"):
+        """Queue a job now (so it counts towards load right away); `slot` later waits for it"""
+        if job_id not in self._waiting and job_id not in self._running:
+            self._submit(job_id, user_id, priority)
+
+    def discard(self, job_id: str):
+        """Drop a submitted job that will never call `slot`"""
+        job = self._waiting.pop(job_id, None)
+        if job is not None:
+            ANALYSES_QUEUED.labels(job.priority).dec()
+            job.granted.cancel()
+        elif job_id in self._running:
+            self._release(self._running[job_id])
+
+    @asynccontextmanager
+    async def slot(self, job_id: str, user_id: str, priority: str = "interactive"):
+        """Wait for a slot for `job_id` (submitting it unless already submitted) and hold it for the block"""
+        job = self._waiting.get(job_id) or self._running.get(job_id) or self._submit(job_id, user_id, priority)
+        try:
+            await job.granted
+        except asyncio.CancelledError:
+            if self._waiting.pop(job_id, None) is not None:
+                ANALYSES_QUEUED.labels(priority).dec()
+            else:
+                self._release(job)
+            raise
+        wait = time.perf_counter() - job.submitted_at
+        ANALYSIS_QUEUE_WAIT.labels(priority).observe(wait)
+        if wait > 1.0:
+            logger.info("Analysis waited for a scheduler slot", job_id=job_id, priority=priority, wait_s=round(wait, 3))
+        try:
+            yield
+        finally:
+            self._release(job)
+
+    def position(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Queue state of a job: queued with its 1-based position, running, or None if unknown"""
+        if job_id in self._running:
+            return {"state": "running"}
+        job = self._waiting.get(job_id)
+        if job is None:
+            return None
+        ahead = sum(1 for other in self._waiting.values() if other.sort_key() < job.sort_key())
+        return {"state": "queued", "position": ahead + 1, "queued": len(self._waiting)}
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    def queued(self, priority: Optional[str] = None) -> int:
+        if priority is None:
+            return len(self._waiting)
+        return sum(1 for job in self._waiting.values() if job.priority == priority)
+
+    def user_pending(self, user_id: str) -> int:
+        """Jobs a user has queued or running"""
+        return self._running_by_user[user_id] + sum(1 for job in self._waiting.values() if job.user_id == user_id)
+
+    def estimated_wait(self, priority: str = "interactive") -> float:
+        """Rough seconds until a job submitted now would start"""
+        ahead = self.queued("interactive") if priority == "interactive" else self.queued()
+        slots = self.capacity if priority == "interactive" else self.batch_slots
+        if ahead == 0 and self.running < slots:
+            return 0.0
+        return (ahead / slots + 1) * self.average_run_time
+
+    def summary(self) -> Dict[str, Any]:
+        queued: Counter = Counter(job.priority for job in self._waiting.values())
+        return {
+            "capacity": self.capacity,
+            "per_user": self.per_user,
+            "batch_slots": self.batch_slots,
+            "running": len(self._running),
+            "running_batch": self._running_batch,
+            "average_run_time_s": round(self.average_run_time, 2),
+            "queued": {priority: queued[priority] for priority in PRIORITIES},
+            "running_by_user": dict(self._running_by_user.most_common(20))
+        }
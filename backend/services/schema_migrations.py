@@ -0,0 +1,448 @@
+import os
+import json
+import asyncio
+import hashlib
+import functools
+from typing import Dict, Any, List, Optional
+
+import structlog
+from appwrite.enums.index_type import IndexType
+
+logger = structlog.get_logger(__name__)
+
+# Bump this whenever COLLECTIONS changes so deployed databases get migrated
+SCHEMA_VERSION = 6
+
+# Collection IDs
+COMPANIES_COLLECTION_ID = "companies"
+ANALYSES_COLLECTION_ID = "analyses"
+MARKETING_ASSETS_COLLECTION_ID = "marketing_assets"
+SESSIONS_COLLECTION_ID = "sessions"
+STAGE_RESULTS_COLLECTION_ID = "stage_results"
+SCHEMA_META_COLLECTION_ID = "schema_meta"
+SCHEMA_META_DOCUMENT_ID = "schema"
+
+# Storage bucket IDs
+MARKETING_ASSETS_BUCKET_ID = "marketing_assets"
+
+BUCKETS: List[Dict[str, Any]] = [
+    {
+        "id": MARKETING_ASSETS_BUCKET_ID,
+        "name": "Marketing Assets",
+        "maximum_file_size": 30 * 1024 * 1024,
+        "allowed_file_extensions": ["png", "jpg", "jpeg", "webp", "mp3"]
+    }
+]
+
+COLLECTIONS: List[Dict[str, Any]] = [
+    {
+        "id": COMPANIES_COLLECTION_ID,
+        "name": "Companies",
+        "attributes": [
+            {"key": "name", "type": "string", "required": True},
+            {"key": "website_url", "type": "string", "required": True},
+            {"key": "product_description", "type": "string", "required": True},
+            {"key": "market_category", "type": "string", "required": True},
+            {"key": "analysis_status", "type": "string", "default": "pending"},
+            {"key": "scraped_data", "type": "string"},
+            {"key": "user_id", "type": "string", "required": True}
+        ]
+    },
+    {
+        "id": ANALYSES_COLLECTION_ID,
+        "name": "Analyses",
+        "attributes": [
+            {"key": "company_id", "type": "string", "required": True},
+            {"key": "user_id", "type": "string", "required": True},
+            {"key": "competitors", "type": "string"},
+            {"key": "market_trends", "type": "string"},
+            {"key": "market_gaps", "type": "string"},
+            {"key": "positioning_strategy", "type": "string"},
+            {"key": "competitive_advantages", "type": "string"},
+            {"key": "status", "type": "string", "default": "pending"},
+            # Request parameters and completed stage outputs, for resuming after a crash
+            {"key": "checkpoint", "type": "string", "size": 100000}
+        ],
+        "indexes": [
+            # get_user_analyses / list_user_analyses_page: user_id filter, newest first
+            {"key": "user_created", "type": "key", "attributes": ["user_id", "$createdAt"], "orders": ["ASC", "DESC"]},
+            # list_analyses_by_status: interrupted analyses to resume, oldest first
+            {"key": "status_created", "type": "key", "attributes": ["status", "$createdAt"], "orders": ["ASC", "ASC"]}
+        ]
+    },
+    {
+        "id": MARKETING_ASSETS_COLLECTION_ID,
+        "name": "Marketing Assets",
+        "attributes": [
+            {"key": "company_id", "type": "string", "required": True},
+            {"key": "analysis_id", "type": "string", "required": True},
+            {"key": "user_id", "type": "string", "required": True},
+            {"key": "script_content", "type": "string", "size": 100000},
+            {"key": "audio_url", "type": "string"},
+            # JSON list of {index, timestamp, source, url | error}
+            {"key": "images", "type": "string", "size": 100000},
+            {"key": "duration", "type": "integer", "default": 30},
+            {"key": "style", "type": "string"},
+            {"key": "status", "type": "string", "default": "pending"}
+        ]
+    },
+    {
+        "id": SESSIONS_COLLECTION_ID,
+        "name": "Sessions",
+        "attributes": [
+            {"key": "session_name", "type": "string", "required": True},
+            {"key": "company_data", "type": "string"},
+            {"key": "analysis_data", "type": "string"},
+            {"key": "app_state", "type": "string", "required": True},
+            {"key": "last_accessed", "type": "string", "required": True},
+            {"key": "is_active", "type": "boolean", "default": True},
+            {"key": "user_id", "type": "string", "required": True}
+        ],
+        "indexes": [
+            # get_user_sessions / list_user_sessions_page: user_id filter, most recently accessed first
+            {"key": "user_accessed", "type": "key", "attributes": ["user_id", "last_accessed"], "orders": ["ASC", "DESC"]},
+            # get_active_session / set_active_session: the user's active sessions
+            {
+                "key": "user_active_accessed",
+                "type": "key",
+                "attributes": ["user_id", "is_active", "last_accessed"],
+                "orders": ["ASC", "ASC", "DESC"]
+            }
+        ]
+    },
+    {
+        "id": STAGE_RESULTS_COLLECTION_ID,
+        "name": "Stage Results",
+        "attributes": [
+            {"key": "company_key", "type": "string", "size": 512, "required": True},
+            {"key": "stage", "type": "string", "size": 64, "required": True},
+            {"key": "fingerprint", "type": "string", "size": 64, "required": True},
+            {"key": "output", "type": "string", "size": 100000, "required": True},
+            {"key": "computed_at", "type": "string", "size": 64, "required": True}
+        ]
+    },
+    {
+        "id": SCHEMA_META_COLLECTION_ID,
+        "name": "Schema Meta",
+        "attributes": [
+            {"key": "version", "type": "integer", "required": True},
+            {"key": "fingerprint", "type": "string", "required": True}
+        ]
+    }
+]
+
+
+def local_state_dir() -> str:
+    """Directory for process-local state files (caches, indexes, checkpoints)"""
+    return os.getenv("LOCAL_STATE_DIR", ".competeiq")
+
+
+def is_not_found(error: Exception) -> bool:
+    """Whether an Appwrite error means the requested resource does not exist"""
+    message = str(error).lower()
+    return getattr(error, "code", None) == 404 or "not found" in message or "could not be found" in message
+
+
+def schema_fingerprint(database_id: str) -> str:
+    """Stable hash of the declared schema for a database"""
+    payload = json.dumps(
+        {"version": SCHEMA_VERSION, "database_id": database_id, "collections": COLLECTIONS, "buckets": BUCKETS},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SchemaMigrator:
+    """Verifies and migrates the Appwrite schema.
+
+    Verification is tiered so that API startup is near-instant:
+    1. a local fingerprint cache hit skips all network calls;
+    2. otherwise a single read of the schema meta document decides whether
+       the deployed schema already matches SCHEMA_VERSION;
+    3. only on mismatch are collections, attributes and indexes reconciled,
+       with attribute creation running concurrently.
+    """
+
+    def __init__(self, databases, database_id: str, cache_key: str, cache_path: Optional[str] = None, storage=None):
+        self.databases = databases
+        self.storage = storage
+        self.database_id = database_id
+        self.cache_key = cache_key
+        self.cache_path = cache_path or os.getenv(
+            "APPWRITE_SCHEMA_CACHE", os.path.join(local_state_dir(), "schema_cache.json")
+        )
+        self.fingerprint = schema_fingerprint(database_id)
+        self.concurrency = int(os.getenv("APPWRITE_MIGRATION_CONCURRENCY", "8"))
+
+    async def _call(self, fn, **kwargs):
+        """Run a blocking Appwrite SDK call in the default executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(fn, **kwargs))
+
+    # Local fingerprint cache
+    def _read_cache(self) -> Dict[str, str]:
+        try:
+            with open(self.cache_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def is_cached(self) -> bool:
+        return self._read_cache().get(self.cache_key) == self.fingerprint
+
+    def write_cache(self):
+        cache = self._read_cache()
+        cache[self.cache_key] = self.fingerprint
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning("Failed to write schema cache", path=self.cache_path, error=str(e))
+
+    # Remote schema version
+    async def get_deployed_schema(self) -> Optional[Dict[str, Any]]:
+        """Read the schema meta document, or None if it does not exist yet"""
+        try:
+            return await self._call(
+                self.databases.get_document,
+                database_id=self.database_id,
+                collection_id=SCHEMA_META_COLLECTION_ID,
+                document_id=SCHEMA_META_DOCUMENT_ID
+            )
+        except Exception as e:
+            if is_not_found(e):
+                return None
+            raise
+
+    async def is_up_to_date(self) -> bool:
+        deployed = await self.get_deployed_schema()
+        return bool(deployed) and deployed.get("version") == SCHEMA_VERSION \
+            and deployed.get("fingerprint") == self.fingerprint
+
+    async def ensure(self, auto_migrate: bool = True) -> str:
+        """Verify the schema, migrating if needed.
+
+        Returns "cached", "verified", "migrated" or "outdated" (when the
+        deployed schema is behind and auto_migrate is disabled).
+        """
+        if self.is_cached():
+            return "cached"
+
+        if await self.is_up_to_date():
+            self.write_cache()
+            return "verified"
+
+        if not auto_migrate:
+            return "outdated"
+
+        await self.migrate()
+        return "migrated"
+
+    # Migration
+    async def migrate(self):
+        """Reconcile database, collections, attributes and indexes with COLLECTIONS, and storage buckets with BUCKETS"""
+        await self._ensure_database()
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *[self._ensure_collection(collection, semaphore) for collection in COLLECTIONS],
+            *[self._ensure_bucket(bucket) for bucket in (BUCKETS if self.storage else [])]
+        )
+
+        # A partly applied schema must not be recorded as current, or it would never be retried
+        failures = [failure for result in results[:len(COLLECTIONS)] for failure in result]
+        if failures:
+            raise Exception(f"Schema migration incomplete, failed to apply: {', '.join(failures)}")
+
+        await self._write_schema_meta()
+        self.write_cache()
+        logger.info("Schema applied", version=SCHEMA_VERSION, database=self.database_id)
+
+    async def _ensure_database(self):
+        try:
+            await self._call(self.databases.get, database_id=self.database_id)
+        except Exception as e:
+            if is_not_found(e):
+                logger.info("Creating database", database=self.database_id)
+                await self._call(self.databases.create, database_id=self.database_id, name="CompeteIQ Database")
+            else:
+                logger.error("Error checking database", database=self.database_id, error=str(e))
+                raise
+
+    async def _ensure_bucket(self, bucket: Dict[str, Any]):
+        try:
+            await self._call(self.storage.get_bucket, bucket_id=bucket["id"])
+        except Exception as e:
+            if not is_not_found(e):
+                logger.error("Error checking bucket", bucket=bucket["id"], error=str(e))
+                raise
+            logger.info("Creating bucket", bucket=bucket["id"])
+            await self._call(
+                self.storage.create_bucket,
+                bucket_id=bucket["id"],
+                name=bucket["name"],
+                maximum_file_size=bucket["maximum_file_size"],
+                allowed_file_extensions=bucket["allowed_file_extensions"]
+            )
+
+    async def _ensure_collection(self, collection: Dict[str, Any], semaphore: asyncio.Semaphore) -> List[str]:
+        """Create the collection and its missing attributes and indexes; returns those that failed"""
+        existing_attr_keys = set()
+        existing_sizes: Dict[str, int] = {}
+        try:
+            async with semaphore:
+                existing_attrs = await self._call(
+                    self.databases.list_attributes,
+                    database_id=self.database_id,
+                    collection_id=collection["id"]
+                )
+            existing_attr_keys = {attr["key"] for attr in existing_attrs["attributes"]}
+            existing_sizes = {attr["key"]: attr["size"] for attr in existing_attrs["attributes"] if "size" in attr}
+        except Exception as e:
+            if not is_not_found(e):
+                logger.error("Error checking collection", collection=collection["id"], error=str(e))
+                raise
+            logger.info("Creating collection", collection=collection["id"])
+            async with semaphore:
+                await self._call(
+                    self.databases.create_collection,
+                    database_id=self.database_id,
+                    collection_id=collection["id"],
+                    name=collection["name"]
+                )
+
+        missing = [attr for attr in collection["attributes"] if attr["key"] not in existing_attr_keys]
+        results = await asyncio.gather(
+            *[self._create_attribute(collection["id"], attr, semaphore) for attr in missing],
+            return_exceptions=True
+        )
+        failures = []
+        for attr, result in zip(missing, results):
+            if isinstance(result, Exception):
+                logger.error("Failed to add attribute", collection=collection["id"], attribute=attr["key"], error=str(result))
+                failures.append(f"{collection['id']}.{attr['key']}")
+            else:
+                logger.info("Added attribute", collection=collection["id"], attribute=attr["key"], type=attr["type"])
+
+        created = [attr["key"] for attr, result in zip(missing, results) if not isinstance(result, Exception)]
+        if created:
+            await self._wait_for_attributes(collection["id"], created)
+
+        # String attributes declared larger than deployed are grown in place
+        undersized = [
+            attr for attr in collection["attributes"]
+            if attr["type"] == "string" and existing_sizes.get(attr["key"], attr.get("size", 255)) < attr.get("size", 255)
+        ]
+        for attr in undersized:
+            try:
+                async with semaphore:
+                    await self._call(
+                        self.databases.update_string_attribute,
+                        database_id=self.database_id,
+                        collection_id=collection["id"],
+                        key=attr["key"],
+                        required=attr.get("required", False),
+                        default=attr.get("default"),
+                        size=attr["size"]
+                    )
+                logger.info("Resized attribute", collection=collection["id"], attribute=attr["key"], size=attr["size"])
+            except Exception as e:
+                logger.error("Failed to resize attribute", collection=collection["id"], attribute=attr["key"], error=str(e))
+                failures.append(f"{collection['id']}.{attr['key']} (size {attr['size']})")
+
+        if collection.get("indexes"):
+            failures += await self._ensure_indexes(collection, semaphore)
+        return failures
+
+    async def _ensure_indexes(self, collection: Dict[str, Any], semaphore: asyncio.Semaphore) -> List[str]:
+        async with semaphore:
+            existing = await self._call(
+                self.databases.list_indexes,
+                database_id=self.database_id,
+                collection_id=collection["id"]
+            )
+        existing_keys = {index["key"] for index in existing["indexes"]}
+
+        failures = []
+        for index in collection["indexes"]:
+            if index["key"] in existing_keys:
+                continue
+            try:
+                async with semaphore:
+                    await self._call(
+                        self.databases.create_index,
+                        database_id=self.database_id,
+                        collection_id=collection["id"],
+                        key=index["key"],
+                        type=IndexType(index["type"]),
+                        attributes=index["attributes"],
+                        orders=index.get("orders")
+                    )
+                logger.info("Added index", collection=collection["id"], index=index["key"])
+            except Exception as e:
+                logger.error("Failed to add index", collection=collection["id"], index=index["key"], error=str(e))
+                failures.append(f"{collection['id']}.{index['key']} (index)")
+        return failures
+
+    async def _wait_for_attributes(self, collection_id: str, keys: List[str], timeout: float = 60.0):
+        """Poll until newly created attributes finish processing server-side"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            response = await self._call(
+                self.databases.list_attributes,
+                database_id=self.database_id,
+                collection_id=collection_id
+            )
+            statuses = {attr["key"]: attr.get("status") for attr in response["attributes"]}
+            pending = [key for key in keys if statuses.get(key) != "available"]
+            if not pending:
+                return
+            if loop.time() >= deadline:
+                raise Exception(f"Attributes {pending} in collection {collection_id} still processing after {timeout}s")
+            await asyncio.sleep(0.5)
+
+    async def _create_attribute(self, collection_id: str, attr: Dict[str, Any], semaphore: asyncio.Semaphore):
+        kwargs = {
+            "database_id": self.database_id,
+            "collection_id": collection_id,
+            "key": attr["key"],
+            "required": attr.get("required", False),
+            "default": attr.get("default")
+        }
+        if attr["type"] == "string":
+            fn = self.databases.create_string_attribute
+            kwargs["size"] = attr.get("size", 255)
+        elif attr["type"] == "integer":
+            fn = self.databases.create_integer_attribute
+        elif attr["type"] == "boolean":
+            fn = self.databases.create_boolean_attribute
+        else:
+            raise Exception(f"Unsupported attribute type: {attr['type']}")
+
+        async with semaphore:
+            return await self._call(fn, **kwargs)
+
+    async def _write_schema_meta(self):
+        data = {"version": SCHEMA_VERSION, "fingerprint": self.fingerprint}
+        try:
+            await self._call(
+                self.databases.update_document,
+                database_id=self.database_id,
+                collection_id=SCHEMA_META_COLLECTION_ID,
+                document_id=SCHEMA_META_DOCUMENT_ID,
+                data=data
+            )
+        except Exception as e:
+            if not is_not_found(e):
+                raise
+            await self._call(
+                self.databases.create_document,
+                database_id=self.database_id,
+                collection_id=SCHEMA_META_COLLECTION_ID,
+                document_id=SCHEMA_META_DOCUMENT_ID,
+                data=data
+            )
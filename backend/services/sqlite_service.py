@@ -0,0 +1,384 @@
+import os
+import json
+import uuid
+import sqlite3
+import asyncio
+import threading
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timezone
+
+import structlog
+
+from .storage_backend import StorageBackend
+from .tracing import tracer, run_in_context
+from .schema_migrations import (
+    local_state_dir,
+    COMPANIES_COLLECTION_ID,
+    ANALYSES_COLLECTION_ID,
+    MARKETING_ASSETS_COLLECTION_ID,
+    SESSIONS_COLLECTION_ID,
+    STAGE_RESULTS_COLLECTION_ID
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    collection TEXT NOT NULL,
+    id TEXT NOT NULL,
+    user_id TEXT,
+    is_active INTEGER,
+    last_accessed TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, id)
+);
+CREATE INDEX IF NOT EXISTS documents_user_created
+    ON documents (collection, user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS documents_user_accessed
+    ON documents (collection, user_id, last_accessed DESC);
+CREATE INDEX IF NOT EXISTS documents_user_active
+    ON documents (collection, user_id, is_active, last_accessed DESC);
+"""
+
+logger = structlog.get_logger(__name__)
+
+# Fields mirrored into indexed columns for filtering and ordering
+INDEXED_FIELDS = ("user_id", "is_active", "last_accessed")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+
+class SQLiteService(StorageBackend):
+    """Embedded SQLite storage backend (WAL mode).
+
+    A drop-in for AppwriteService's persistence methods with no network
+    hop: used for offline runs, as a test double, and as the zero-latency
+    baseline when measuring how much time Appwrite I/O costs. Documents
+    are stored as JSON with Appwrite-style "$id"/"$createdAt"/"$updatedAt"
+    metadata so callers cannot tell the backends apart.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("SQLITE_PATH", os.path.join(local_state_dir(), "competeiq.db"))
+        self.max_page_size = 100
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.files_dir = os.getenv("LOCAL_FILES_DIR", os.path.join(local_state_dir(), "files"))
+
+    async def initialize(self):
+        """Open the database and create tables"""
+        try:
+            await self._call(self._connect)
+            logger.info("SQLite storage initialized", path=self.path)
+        except Exception as e:
+            logger.error("Failed to initialize SQLite storage", path=self.path, error=str(e))
+            raise
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def _call(self, fn, *args, **kwargs):
+        """Run a blocking (locked) SQLite operation in the default executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, run_in_context(fn, *args, **kwargs))
+
+    # Document primitives
+    def _to_document(self, collection: str, row: sqlite3.Row) -> Dict[str, Any]:
+        document = json.loads(row["data"])
+        document.update({
+            "$id": row["id"],
+            "$collectionId": collection,
+            "$createdAt": row["created_at"],
+            "$updatedAt": row["updated_at"]
+        })
+        return document
+
+    def _columns(self, data: Dict[str, Any]) -> List[Any]:
+        is_active = data.get("is_active")
+        return [
+            data.get("user_id"),
+            None if is_active is None else int(bool(is_active)),
+            data.get("last_accessed")
+        ]
+
+    def _create(self, collection: str, document_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        now = _now()
+        with tracer.child_span("sqlite.create_document", {"db.collection": collection}), self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO documents (collection, id, user_id, is_active, last_accessed, created_at, updated_at, data)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [collection, document_id, *self._columns(data), now, now, json.dumps(data)]
+            )
+            row = conn.execute(
+                "SELECT * FROM documents WHERE collection = ? AND id = ?", (collection, document_id)
+            ).fetchone()
+        return self._to_document(collection, row)
+
+    def _get(self, collection: str, document_id: str) -> Optional[Dict[str, Any]]:
+        with tracer.child_span("sqlite.get_document", {"db.collection": collection}), self._lock:
+            row = self._connect().execute(
+                "SELECT * FROM documents WHERE collection = ? AND id = ?", (collection, document_id)
+            ).fetchone()
+        return self._to_document(collection, row) if row else None
+
+    def _update(self, collection: str, document_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+        with tracer.child_span("sqlite.update_document", {"db.collection": collection}), self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT data FROM documents WHERE collection = ? AND id = ?", (collection, document_id)
+                ).fetchone()
+                if row is None:
+                    raise Exception(f"Document with the requested ID could not be found: {document_id}")
+                data = json.loads(row["data"])
+                data.update(updates)
+                conn.execute(
+                    "UPDATE documents SET user_id = ?, is_active = ?, last_accessed = ?, updated_at = ?, data = ?"
+                    " WHERE collection = ? AND id = ?",
+                    [*self._columns(data), _now(), json.dumps(data), collection, document_id]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            row = conn.execute(
+                "SELECT * FROM documents WHERE collection = ? AND id = ?", (collection, document_id)
+            ).fetchone()
+        return self._to_document(collection, row)
+
+    def _put(self, collection: str, document_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a document, or replace its data if it exists (keeping $createdAt)"""
+        now = _now()
+        with tracer.child_span("sqlite.put_document", {"db.collection": collection}), self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO documents (collection, id, user_id, is_active, last_accessed, created_at, updated_at, data)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (collection, id) DO UPDATE SET user_id = excluded.user_id, is_active = excluded.is_active,"
+                " last_accessed = excluded.last_accessed, updated_at = excluded.updated_at, data = excluded.data",
+                [collection, document_id, *self._columns(data), now, now, json.dumps(data)]
+            )
+            row = conn.execute(
+                "SELECT * FROM documents WHERE collection = ? AND id = ?", (collection, document_id)
+            ).fetchone()
+        return self._to_document(collection, row)
+
+    def _list_page(
+        self, collection: str, user_id: str, order_column: str, limit: int, cursor: Optional[str],
+        is_active: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        limit = max(1, min(limit, self.max_page_size))
+        where = ["collection = ?", "user_id = ?"]
+        params: List[Any] = [collection, user_id]
+        if is_active is not None:
+            where.append("is_active = ?")
+            params.append(int(is_active))
+
+        with tracer.child_span("sqlite.list_documents", {"db.collection": collection}), self._lock:
+            conn = self._connect()
+            if cursor:
+                anchor = conn.execute(
+                    f"SELECT {order_column}, rowid FROM documents WHERE collection = ? AND id = ?",
+                    (collection, cursor)
+                ).fetchone()
+                if anchor is None:
+                    raise Exception(f"Invalid cursor: {cursor}")
+                where.append(f"({order_column}, rowid) < (?, ?)")
+                params.extend([anchor[0], anchor[1]])
+            rows = conn.execute(
+                f"SELECT * FROM documents WHERE {' AND '.join(where)}"
+                f" ORDER BY {order_column} DESC, rowid DESC LIMIT ?",
+                [*params, limit]
+            ).fetchall()
+
+        documents = [self._to_document(collection, row) for row in rows]
+        return {
+            "documents": documents,
+            "next_cursor": documents[-1]["$id"] if len(documents) == limit else None
+        }
+
+    # Company methods
+    async def create_company(self, company_id: str, company_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a new company document"""
+        try:
+            return await self._call(self._create, COMPANIES_COLLECTION_ID, company_id, company_data)
+        except Exception as e:
+            raise Exception(f"Could not create company document: {e}")
+
+    async def get_company(self, company_id: str) -> Optional[Dict[str, Any]]:
+        """Get company by ID"""
+        return await self._call(self._get, COMPANIES_COLLECTION_ID, company_id)
+
+    async def update_company(self, company_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+        """Update company record"""
+        try:
+            return await self._call(self._update, COMPANIES_COLLECTION_ID, company_id, updates)
+        except Exception as e:
+            raise Exception(f"Failed to update company: {str(e)}")
+
+    # Analysis methods
+    async def create_analysis(self, analysis_id: str, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a new analysis document"""
+        try:
+            return await self._call(self._create, ANALYSES_COLLECTION_ID, analysis_id, analysis_data)
+        except Exception as e:
+            raise Exception(f"Could not create analysis document: {e}")
+
+    async def get_analysis(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """Get analysis by ID"""
+        return await self._call(self._get, ANALYSES_COLLECTION_ID, analysis_id)
+
+    async def update_analysis(self, analysis_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+        """Update analysis record"""
+        try:
+            return await self._call(self._update, ANALYSES_COLLECTION_ID, analysis_id, updates)
+        except Exception as e:
+            raise Exception(f"Failed to update analysis: {str(e)}")
+
+    async def list_user_analyses_page(
+        self, user_id: str, limit: int = 25, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get one page of a user's analyses, newest first"""
+        return await self._call(self._list_page, ANALYSES_COLLECTION_ID, user_id, "created_at", limit, cursor)
+
+    async def list_analyses_by_status(self, statuses: List[str], limit: int = 100) -> List[Dict[str, Any]]:
+        """Get analyses in one of the given statuses, oldest first"""
+        return await self._call(self._list_by_status, statuses, limit)
+
+    def _list_by_status(self, statuses: List[str], limit: int) -> List[Dict[str, Any]]:
+        placeholders = ", ".join("?" for _ in statuses)
+        with tracer.child_span("sqlite.list_documents", {"db.collection": ANALYSES_COLLECTION_ID}), self._lock:
+            rows = self._connect().execute(
+                "SELECT * FROM documents WHERE collection = ?"
+                f" AND json_extract(data, '$.status') IN ({placeholders})"
+                " ORDER BY created_at, rowid LIMIT ?",
+                [ANALYSES_COLLECTION_ID, *statuses, max(1, min(limit, self.max_page_size))]
+            ).fetchall()
+        return [self._to_document(ANALYSES_COLLECTION_ID, row) for row in rows]
+
+    # Marketing Assets methods
+    async def create_marketing_asset(self, asset_id: str, asset_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a new marketing asset record"""
+        try:
+            return await self._call(self._create, MARKETING_ASSETS_COLLECTION_ID, asset_id, asset_data)
+        except Exception as e:
+            raise Exception(f"Failed to create marketing asset: {str(e)}")
+
+    async def get_marketing_asset(self, asset_id: str) -> Optional[Dict[str, Any]]:
+        """Get marketing asset by ID"""
+        return await self._call(self._get, MARKETING_ASSETS_COLLECTION_ID, asset_id)
+
+    async def update_marketing_asset(self, asset_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+        """Update marketing asset record"""
+        try:
+            return await self._call(self._update, MARKETING_ASSETS_COLLECTION_ID, asset_id, updates)
+        except Exception as e:
+            raise Exception(f"Failed to update marketing asset: {str(e)}")
+
+    # Stage result methods
+    async def get_stage_result(self, result_id: str) -> Optional[Dict[str, Any]]:
+        """Get a stored stage result by ID"""
+        return await self._call(self._get, STAGE_RESULTS_COLLECTION_ID, result_id)
+
+    async def put_stage_result(self, result_id: str, result_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create or replace a stage result"""
+        try:
+            return await self._call(self._put, STAGE_RESULTS_COLLECTION_ID, result_id, result_data)
+        except Exception as e:
+            raise Exception(f"Failed to store stage result: {str(e)}")
+
+    # File storage methods
+    def _file_path(self, file_id: str) -> str:
+        return os.path.join(self.files_dir, os.path.basename(file_id))
+
+    def _write_file(self, path: str, data: bytes):
+        os.makedirs(self.files_dir, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def _read_file(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    async def upload_file(self, file_id: str, filename: str, data: bytes, content_type: str) -> str:
+        """Write a file to the local files directory; served by GET /api/files/{file_id}"""
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write_file, self._file_path(file_id), data)
+        except OSError as e:
+            raise Exception(f"Failed to upload file: {str(e)}")
+        return f"/api/files/{file_id}"
+
+    async def read_file(self, file_id: str) -> Optional[bytes]:
+        """Read a file from the local files directory"""
+        return await asyncio.get_running_loop().run_in_executor(None, self._read_file, self._file_path(file_id))
+
+    # Session methods
+    async def create_session(self, session_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a new session record"""
+        try:
+            session_data = dict(session_data)
+            session_data.setdefault("last_accessed", _now())
+            return await self._call(self._create, SESSIONS_COLLECTION_ID, uuid.uuid4().hex, session_data)
+        except Exception as e:
+            raise Exception(f"Failed to create session: {str(e)}")
+
+    async def list_user_sessions_page(
+        self, user_id: str, limit: int = 25, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get one page of a user's sessions, most recently accessed first"""
+        return await self._call(self._list_page, SESSIONS_COLLECTION_ID, user_id, "last_accessed", limit, cursor)
+
+    async def get_active_session(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get the active session for a user"""
+        page = await self._call(self._list_page, SESSIONS_COLLECTION_ID, user_id, "last_accessed", 1, None, is_active=True)
+        return page["documents"][0] if page["documents"] else None
+
+    async def update_session(self, session_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+        """Update session record"""
+        try:
+            return await self._call(self._update, SESSIONS_COLLECTION_ID, session_id, updates)
+        except Exception as e:
+            raise Exception(f"Failed to update session: {str(e)}")
+
+    async def set_active_session(self, user_id: str, session_id: str) -> Dict[str, Any]:
+        """Set a session as active and deactivate the user's other active sessions"""
+        try:
+            return await self._call(self._set_active_session, user_id, session_id)
+        except Exception as e:
+            raise Exception(f"Failed to set active session: {str(e)}")
+
+    def _set_active_session(self, user_id: str, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            active_ids = [
+                row["id"] for row in self._connect().execute(
+                    "SELECT id FROM documents WHERE collection = ? AND user_id = ? AND is_active = 1 AND id != ?",
+                    (SESSIONS_COLLECTION_ID, user_id, session_id)
+                ).fetchall()
+            ]
+        for other_id in active_ids:
+            self._update(SESSIONS_COLLECTION_ID, other_id, {"is_active": False})
+        return self._update(SESSIONS_COLLECTION_ID, session_id, {"is_active": True})
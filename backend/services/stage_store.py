@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import hashlib
+from typing import Dict, Any, Optional
+
+import structlog
+
+from .metrics import STAGE_RESULTS
+from .request_index import canonical_url
+
+logger = structlog.get_logger(__name__)
+
+# Stage outputs kept for incremental re-analysis.
+#
+# Every stage's output is stored per company together with a fingerprint of
+# the inputs its prompt is built from and the time it was computed. An
+# incremental analysis reuses a stored output while the fingerprint matches
+# and it is younger than the stage's TTL, and recomputes the rest, so
+# recurring refreshes of tracked companies only pay for stale stages. Outputs
+# that came from a fallback instead of an agent are never stored.
+#
+#   STAGE_TTL_WEB_SCRAPING=86400           website data: daily
+#   STAGE_TTL_COMPETITOR_RESEARCH=2592000  competitors: monthly
+#   STAGE_TTL_TREND_PREDICTION=604800      trends: weekly
+#   STAGE_TTL_MARKET_POSITIONING=604800    positioning: weekly
+
+DEFAULT_STAGE_TTLS = {
+    "web_scraping": 86400,
+    "competitor_research": 30 * 86400,
+    "trend_prediction": 7 * 86400,
+    "market_positioning": 7 * 86400
+}
+
+
+def company_key(company_data: Dict[str, Any]) -> str:
+    """Stable identity of a company across analyses: its website, else its name"""
+    return canonical_url(company_data.get("website_url")) or " ".join((company_data.get("name") or "").lower().split())
+
+
+def fingerprint(inputs: Dict[str, Any]) -> str:
+    """Hash of a stage's inputs"""
+    payload = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def to_jsonable(value: Any) -> Any:
+    """Stage output with pydantic models converted to plain data"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    return value
+
+
+class StageStore:
+    """Stores stage outputs in the storage backend and decides which ones are still fresh"""
+
+    def __init__(self, storage, ttls: Optional[Dict[str, float]] = None):
+        self.storage = storage
+        self.ttls = ttls or {
+            stage: float(os.getenv(f"STAGE_TTL_{stage.upper()}", str(ttl)))
+            for stage, ttl in DEFAULT_STAGE_TTLS.items()
+        }
+
+    @staticmethod
+    def result_id(key: str, stage: str) -> str:
+        # Appwrite document IDs are at most 36 characters
+        return hashlib.sha256(f"{key}|{stage}".encode("utf-8")).hexdigest()[:36]
+
+    async def load(self, key: str, stage: str, inputs_fingerprint: str) -> Optional[Dict[str, Any]]:
+        """The stored output of a stage if its inputs are unchanged and it has not expired
+
+        Returns {"output", "computed_at"} or None; lookup errors count as a miss.
+        """
+        try:
+            document = await self.storage.get_stage_result(self.result_id(key, stage))
+        except Exception as e:
+            logger.warning("Failed to load stage result", stage=stage, error=str(e))
+            document = None
+
+        if document is None:
+            outcome = "missing"
+        elif document.get("fingerprint") != inputs_fingerprint:
+            outcome = "changed"
+        elif time.time() - float(document.get("computed_at", 0)) > self.ttls.get(stage, 0):
+            outcome = "expired"
+        else:
+            outcome = "reused"
+        STAGE_RESULTS.labels(stage, outcome).inc()
+        if outcome != "reused":
+            return None
+        return {"output": json.loads(document["output"]), "computed_at": float(document["computed_at"])}
+
+    async def save(self, key: str, stage: str, inputs_fingerprint: str, output: Any):
+        """Store a freshly computed output; failures are logged, not raised"""
+        try:
+            await self.storage.put_stage_result(self.result_id(key, stage), {
+                "company_key": key,
+                "stage": stage,
+                "fingerprint": inputs_fingerprint,
+                "output": json.dumps(to_jsonable(output), default=str),
+                "computed_at": str(time.time())
+            })
+        except Exception as e:
+            logger.warning("Failed to store stage result", stage=stage, error=str(e))
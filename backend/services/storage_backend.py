@@ -0,0 +1,177 @@
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional, AsyncIterator
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+class StorageBackend(ABC):
+    """Persistence interface for companies, analyses, marketing assets, stage results and sessions.
+
+    Documents are plain dicts in Appwrite's shape: user fields plus "$id",
+    "$createdAt" and "$updatedAt". get_* methods return None for missing
+    documents; create/update methods raise on failure.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def initialize(self):
+        """Prepare the backend (connections, schema)"""
+
+    def close(self):
+        """Release connections on shutdown"""
+
+    # Company methods
+    @abstractmethod
+    async def create_company(self, company_id: str, company_data: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def get_company(self, company_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def update_company(self, company_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    # Analysis methods
+    @abstractmethod
+    async def create_analysis(self, analysis_id: str, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def get_analysis(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def update_analysis(self, analysis_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def list_user_analyses_page(
+        self, user_id: str, limit: int = 25, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """One page of a user's analyses, newest first: {"documents", "next_cursor"}"""
+
+    @abstractmethod
+    async def list_analyses_by_status(self, statuses: List[str], limit: int = 100) -> List[Dict[str, Any]]:
+        """Analyses (of any user) in one of `statuses`, oldest first"""
+
+    async def get_user_analyses(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Get the most recent analyses for a user"""
+        try:
+            page = await self.list_user_analyses_page(user_id, limit=limit)
+            return page["documents"]
+        except Exception as e:
+            logger.warning("Failed to get user analyses", user_id=user_id, error=str(e))
+            return []
+
+    async def iter_user_analyses(self, user_id: str, page_size: int = 100) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a user's full analysis history, newest first, one page at a time"""
+        cursor = None
+        while True:
+            page = await self.list_user_analyses_page(user_id, limit=page_size, cursor=cursor)
+            for document in page["documents"]:
+                yield document
+            cursor = page["next_cursor"]
+            if not cursor:
+                return
+
+    # Marketing Assets methods
+    @abstractmethod
+    async def create_marketing_asset(self, asset_id: str, asset_data: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def get_marketing_asset(self, asset_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def update_marketing_asset(self, asset_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    # Stage result methods
+    @abstractmethod
+    async def get_stage_result(self, result_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def put_stage_result(self, result_id: str, result_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create or replace a stage result"""
+
+    # File storage methods
+    @abstractmethod
+    async def upload_file(self, file_id: str, filename: str, data: bytes, content_type: str) -> str:
+        """Store a generated media file and return a URL it can be fetched from"""
+
+    @abstractmethod
+    async def read_file(self, file_id: str) -> Optional[bytes]:
+        ...
+
+    # Session methods
+    @abstractmethod
+    async def create_session(self, session_data: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def list_user_sessions_page(
+        self, user_id: str, limit: int = 25, cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """One page of a user's sessions, most recently accessed first"""
+
+    async def get_user_sessions(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Get the most recently accessed sessions for a user"""
+        try:
+            page = await self.list_user_sessions_page(user_id, limit=limit)
+            return page["documents"]
+        except Exception as e:
+            logger.warning("Failed to get user sessions", user_id=user_id, error=str(e))
+            return []
+
+    async def iter_user_sessions(self, user_id: str, page_size: int = 100) -> AsyncIterator[Dict[str, Any]]:
+        """Stream all of a user's sessions, one page at a time"""
+        cursor = None
+        while True:
+            page = await self.list_user_sessions_page(user_id, limit=page_size, cursor=cursor)
+            for document in page["documents"]:
+                yield document
+            cursor = page["next_cursor"]
+            if not cursor:
+                return
+
+    @abstractmethod
+    async def get_active_session(self, user_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def update_session(self, session_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def set_active_session(self, user_id: str, session_id: str) -> Dict[str, Any]:
+        ...
+
+
+def storage_backend_name() -> str:
+    return os.getenv("STORAGE_BACKEND", "appwrite").lower()
+
+
+def create_storage_backend(appwrite_service=None) -> StorageBackend:
+    """Build the backend selected by STORAGE_BACKEND ("appwrite" or "sqlite").
+
+    An existing AppwriteService can be passed in so that auth and storage
+    share one client when the Appwrite backend is selected.
+    """
+    backend = storage_backend_name()
+    if backend == "sqlite":
+        from .sqlite_service import SQLiteService
+        return SQLiteService()
+    if backend == "appwrite":
+        if appwrite_service is not None:
+            return appwrite_service
+        from .appwrite_service import AppwriteService
+        return AppwriteService()
+    raise Exception(f"Unknown STORAGE_BACKEND '{backend}' (expected 'appwrite' or 'sqlite')")
@@ -0,0 +1,222 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+from .schema_migrations import local_state_dir
+
+# Lightweight OpenTelemetry-style tracing.
+#
+# The current span lives in a contextvar, so it follows the code across
+# `await` and into tasks created with asyncio.create_task (which copy the
+# context); use `run_in_context` when handing work to an executor thread.
+# Finished spans are exported off the event loop by a background thread,
+# selected with TRACE_EXPORTER=none|console|file (file: TRACE_FILE, JSON
+# lines shaped like OTLP spans).
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def trace_id_for(analysis_id: str) -> str:
+    """Derive a stable 32-hex-digit trace id from an analysis id so each analysis is one trace"""
+    hex_id = "".join(c for c in analysis_id.lower() if c in "0123456789abcdef")
+    return (hex_id + "0" * 32)[:32] if hex_id else secrets.token_hex(16)
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[Dict[str, Any]] = []
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.events.append({"name": name, "timeUnixNano": time.time_ns(), "attributes": attributes or {}})
+
+    def record_error(self, error: BaseException):
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns or time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "events": self.events,
+            "status": {"code": self.status, "message": self.error}
+        }
+
+
+class _NoopSpan:
+    """Returned by child_span when there is no active trace"""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class SpanExporter:
+    """Exports finished spans from a background thread so the event loop never does I/O"""
+
+    def __init__(self, mode: str, path: Optional[str] = None):
+        self.mode = mode
+        self.path = path
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=10000)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def export(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass  # drop spans rather than block request handling
+
+    def _run(self):
+        handle = None
+        if self.mode == "file":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            handle = open(self.path, "a", buffering=1)
+        try:
+            while True:
+                span = self._queue.get()
+                if span is None:
+                    return
+                if handle:
+                    handle.write(json.dumps(span.to_dict(), default=str) + "\n")
+                else:
+                    parent = span.parent_id or "-"
+                    status = "" if span.status == "ok" else f" [{span.error}]"
+                    sys.stderr.write(
+                        f"[trace {span.trace_id[:8]}] {span.name} {span.duration_ms:.1f}ms "
+                        f"span={span.span_id} parent={parent}{status}\n"
+                    )
+        finally:
+            if handle:
+                handle.close()
+
+    def shutdown(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=2)
+
+
+class Tracer:
+    def __init__(self):
+        mode = os.getenv("TRACE_EXPORTER", "none").lower()
+        self.enabled = mode in ("console", "file")
+        self.path = os.getenv("TRACE_FILE", os.path.join(local_state_dir(), "traces.jsonl"))
+        self.exporter = SpanExporter(mode, self.path) if self.enabled else None
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    @contextmanager
+    def start_span(self, name: str, attributes: Optional[Dict[str, Any]] = None, trace_id: Optional[str] = None):
+        """Start a span as a child of the current span, or a new trace (with trace_id if given)"""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        if trace_id is None:
+            trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        parent_id = parent.span_id if parent and parent.trace_id == trace_id else None
+        span = Span(name, trace_id, parent_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self.exporter.export(span)
+
+    @contextmanager
+    def child_span(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        """Like start_span, but a no-op outside an active trace (e.g. storage calls during startup)"""
+        if not self.enabled or _current_span.get() is None:
+            yield NOOP_SPAN
+            return
+        with self.start_span(name, attributes) as span:
+            yield span
+
+
+def run_in_context(fn, *args, **kwargs):
+    """Bind fn to the caller's context (current span) for use with run_in_executor"""
+    context = contextvars.copy_context()
+    return lambda: context.run(fn, *args, **kwargs)
+
+
+tracer = Tracer()
+
+
+def print_trace(path: str, trace_id: str):
+    """Print a trace from a TRACE_FILE as an indented tree with durations"""
+    spans = []
+    with open(path) as f:
+        for line in f:
+            span = json.loads(line)
+            if span["traceId"].startswith(trace_id):
+                spans.append(span)
+    if not spans:
+        print(f"No spans found for trace {trace_id}")
+        return
+
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    span_ids = {span["spanId"] for span in spans}
+    for span in spans:
+        parent = span["parentSpanId"] if span["parentSpanId"] in span_ids else None
+        children.setdefault(parent, []).append(span)
+
+    def walk(parent_id: Optional[str], depth: int):
+        for span in sorted(children.get(parent_id, []), key=lambda s: s["startTimeUnixNano"]):
+            status = "" if span["status"]["code"] == "ok" else f"  !! {span['status']['message']}"
+            print(f"{'  ' * depth}{span['name']:<{48 - 2 * depth}} {span['durationMs']:>10.1f} ms{status}")
+            walk(span["spanId"], depth + 1)
+
+    walk(None, 0)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python -m services.tracing <trace_id_or_analysis_id> [trace_file]")
+        sys.exit(1)
+    trace_file = sys.argv[2] if len(sys.argv) > 2 else tracer.path
+    print_trace(trace_file, trace_id_for(sys.argv[1]))
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Tuple
+
+import structlog
+
+from .metrics import TREND_REPORT_LOOKUPS, TREND_REFRESHES
+from .competitor_kb import category_key
+from .schema_migrations import local_state_dir
+
+logger = structlog.get_logger(__name__)
+
+# Category-level market trend reports.
+#
+# The trend stage depends only on the market category, so instead of asking
+# the trend agent once per company, reports are kept per category: every
+# analysis request counts towards its category (an exponentially decayed
+# count, halving every TREND_FREQUENCY_HALF_LIFE_DAYS), and a background job
+# refreshes the reports of the TREND_PRECOMPUTE_TOP most-requested categories
+# once they are older than TREND_REFRESH_SECONDS. The trend stage then reads
+# the report from memory. Reports computed live by an analysis are kept too,
+# so a category's second analysis is already a lookup. Reports and counts
+# are persisted to LOCAL_STATE_DIR/trend_reports.json.
+#
+#   TREND_PRECOMPUTE=true                  set to false to run the trend agent per analysis
+#   TREND_PRECOMPUTE_TOP=20                categories kept precomputed
+#   TREND_PRECOMPUTE_MIN_REQUESTS=2        decayed request count a category needs to be precomputed
+#   TREND_PRECOMPUTE_INTERVAL=600          seconds between refresh passes
+#   TREND_REFRESH_SECONDS=86400            report age that triggers a refresh
+#   TREND_REPORT_MAX_AGE_SECONDS=172800    older reports are not served
+#   TREND_FREQUENCY_HALF_LIFE_DAYS=7
+
+
+class TrendPrecompute:
+    """Keeps market trend reports for the most-requested categories fresh"""
+
+    def __init__(self, compute: Callable[[str], Awaitable[Optional[List[Dict[str, Any]]]]], path: Optional[str] = None):
+        # compute(category) returns the trends, or None when the agent fell back
+        self.compute = compute
+        self.enabled = os.getenv("TREND_PRECOMPUTE", "true").lower() == "true"
+        self.path = path or os.path.join(local_state_dir(), "trend_reports.json")
+        self.top_n = int(os.getenv("TREND_PRECOMPUTE_TOP", "20"))
+        self.min_requests = float(os.getenv("TREND_PRECOMPUTE_MIN_REQUESTS", "2"))
+        self.interval = float(os.getenv("TREND_PRECOMPUTE_INTERVAL", "600"))
+        self.refresh_after = float(os.getenv("TREND_REFRESH_SECONDS", "86400"))
+        self.max_age = float(os.getenv("TREND_REPORT_MAX_AGE_SECONDS", "172800"))
+        self.half_life = float(os.getenv("TREND_FREQUENCY_HALF_LIFE_DAYS", "7")) * 86400
+        # category -> {"score", "updated_at"} and category -> {"trends", "computed_at"}
+        self._frequencies: Dict[str, Dict[str, float]] = {}
+        self._reports: Dict[str, Dict[str, Any]] = {}
+        self._refreshing: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        if self.enabled:
+            self._read()
+
+    # Persistence
+    def _read(self):
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+            self._frequencies = state.get("frequencies", {})
+            self._reports = state.get("reports", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load trend reports; starting empty", path=self.path, error=str(e))
+
+    def _write(self, state: Dict[str, Any]):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Failed to save trend reports", path=self.path, error=str(e))
+
+    def _state(self) -> Dict[str, Any]:
+        return {"frequencies": dict(self._frequencies), "reports": dict(self._reports)}
+
+    # Request frequencies
+    def _score(self, category: str, now: float) -> float:
+        entry = self._frequencies.get(category)
+        if entry is None:
+            return 0.0
+        return entry["score"] * 0.5 ** ((now - entry["updated_at"]) / self.half_life)
+
+    def record(self, category: str):
+        """Count an analysis request for a market category"""
+        if not self.enabled:
+            return
+        category = category_key(category)
+        if category:
+            now = time.time()
+            self._frequencies[category] = {"score": self._score(category, now) + 1, "updated_at": now}
+
+    def top(self, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Most-requested categories with their decayed request counts (rounded, so two requests count as 2)"""
+        now = time.time()
+        scores = ((category, round(self._score(category, now), 2)) for category in self._frequencies)
+        return sorted(scores, key=lambda item: item[1], reverse=True)[:limit or self.top_n]
+
+    # Reports
+    def lookup(self, category: str) -> Optional[Dict[str, Any]]:
+        """The category's report ({"trends", "computed_at"}) if it is recent enough to serve"""
+        if not self.enabled:
+            return None
+        report = self._reports.get(category_key(category))
+        if report is None:
+            outcome = "miss"
+        elif time.time() - report["computed_at"] > self.max_age:
+            outcome = "stale"
+        else:
+            outcome = "hit"
+        TREND_REPORT_LOOKUPS.labels(outcome).inc()
+        return report if outcome == "hit" else None
+
+    def store(self, category: str, trends: List[Dict[str, Any]]):
+        """Keep trends computed for a category (by an analysis or a refresh)"""
+        if self.enabled and trends:
+            self._reports[category_key(category)] = {"trends": trends, "computed_at": time.time()}
+
+    async def refresh(self) -> List[str]:
+        """Refresh the due reports of the top categories, one at a time; returns the refreshed categories"""
+        now = time.time()
+        wanted = [category for category, score in self.top() if score >= self.min_requests]
+        refreshed = []
+        for category in wanted:
+            report = self._reports.get(category)
+            if report is not None and now - report["computed_at"] < self.refresh_after:
+                continue
+            self._refreshing = category
+            try:
+                trends = await self.compute(category)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                trends = None
+                logger.warning("Trend report refresh failed", market_category=category, error=str(e))
+            finally:
+                self._refreshing = None
+            if trends:
+                self.store(category, trends)
+                refreshed.append(category)
+            TREND_REFRESHES.labels("refreshed" if trends else "failed").inc()
+
+        # Forget categories nobody asks for any more, and reports too old to serve outside the top
+        self._frequencies = {
+            category: entry for category, entry in self._frequencies.items() if self._score(category, now) >= 0.01
+        }
+        self._reports = {
+            category: report for category, report in self._reports.items()
+            if category in wanted or now - report["computed_at"] <= self.max_age
+        }
+        await asyncio.get_running_loop().run_in_executor(None, self._write, self._state())
+        if refreshed:
+            logger.info("Refreshed market trend reports", categories=refreshed)
+        return refreshed
+
+    # Background job
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the refresh job (call from inside the loop)"""
+        if not self.enabled or self.running:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="trend-precompute")
+        logger.info("Trend precompute started", top=self.top_n, interval_s=self.interval)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled:
+            self._write(self._state())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Trend precompute pass failed", error=str(e))
+            await asyncio.sleep(self.interval)
+
+    def summary(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "refreshing": self._refreshing,
+            "categories": [
+                {
+                    "market_category": category,
+                    "requests": score,
+                    "report_age_s": round(now - self._reports[category]["computed_at"]) if category in self._reports else None
+                }
+                for category, score in self.top()
+            ]
+        }
@@ -0,0 +1,196 @@
+import os
+import time
+import uuid
+import base64
+import asyncio
+from typing import Dict, Any, AsyncIterator, List, Optional
+
+import structlog
+
+from .metrics import PROVIDER_LATENCY, TTS_TIME_TO_FIRST
+from .rate_limit import RateLimiter
+from .admission import provider_load
+from .image_generation import split_sentences, WORDS_PER_SECOND
+
+logger = structlog.get_logger(__name__)
+
+# Text-to-speech for marketing scripts.
+#
+# The script is split into sentence chunks of up to TTS_CHUNK_CHARS, which are
+# synthesized concurrently (bounded by TTS_CONCURRENCY and
+# TTS_RATE_PER_MINUTE) and yielded in script order as soon as each next chunk
+# is ready, so playback can start after the first sentence instead of after
+# the whole script. MP3 frames are self-delimiting, so the final file is the
+# concatenation of the chunks.
+#
+#   TTS_PROVIDER=elevenlabs|stub   (default: elevenlabs when ELEVEN_LABS_API_KEY is set)
+#   ELEVEN_LABS_MODEL=eleven_multilingual_v2
+#   TTS_STUB_LATENCY_MS=400        simulated provider latency for the stub
+
+# Request voice names mapped to ElevenLabs premade voices
+ELEVEN_LABS_VOICES = {
+    "professional_male": "pNInz6obpgDQGcFmaJgB",
+    "professional_female": "21m00Tcm4TlvDq8ikWAM",
+    "casual_male": "TxGEqnHWrfWFTfGW9XjX",
+    "casual_female": "EXAVITQu4vr4xnSDxMaL"
+}
+
+
+def chunk_script(script: str, max_chars: int = 300) -> List[str]:
+    """Group consecutive sentences into chunks of at most `max_chars` (longer sentences stay whole)"""
+    chunks: List[str] = []
+    current = ""
+    for sentence in split_sentences(script):
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _strip_id3(data: bytes) -> bytes:
+    """Drop a leading ID3v2 tag so chunks concatenate into one MP3 stream"""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return data
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    return data[10 + size:]
+
+
+class TTSProvider:
+    name = "base"
+    content_type = "audio/mpeg"
+    extension = "mp3"
+
+    async def synthesize(self, text: str, voice: str, previous_text: str = "", next_text: str = "") -> bytes:
+        raise NotImplementedError
+
+
+class ElevenLabsProvider(TTSProvider):
+    name = "elevenlabs"
+    base_url = "https://api.elevenlabs.io/v1"
+
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
+        self.api_key = api_key or os.getenv("ELEVEN_LABS_API_KEY")
+        self.model = model or os.getenv("ELEVEN_LABS_MODEL", "eleven_multilingual_v2")
+        self._client = None
+
+    async def synthesize(self, text: str, voice: str, previous_text: str = "", next_text: str = "") -> bytes:
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"xi-api-key": self.api_key, "accept": "audio/mpeg"},
+                timeout=httpx.Timeout(60.0, connect=10.0)
+            )
+        voice_id = ELEVEN_LABS_VOICES.get(voice, voice)
+        # previous_text/next_text keep intonation continuous across chunk boundaries
+        response = await self._client.post(
+            f"/text-to-speech/{voice_id}",
+            params={"output_format": "mp3_44100_128"},
+            json={"text": text, "model_id": self.model, "previous_text": previous_text, "next_text": next_text}
+        )
+        if response.status_code != 200:
+            raise Exception(f"ElevenLabs returned {response.status_code}: {response.text[:200]}")
+        return _strip_id3(response.content)
+
+
+def _silent_mp3(seconds: float) -> bytes:
+    """Silent MPEG-1 Layer III audio (128 kbps, 44.1 kHz, mono)"""
+    frame = b"\xff\xfb\x90\xc4" + b"\x00" * 413  # 144 * 128000 / 44100 = 417 bytes per frame
+    frames = max(1, round(seconds * 44100 / 1152))
+    return frame * frames
+
+
+class StubTTSProvider(TTSProvider):
+    """Offline provider: silence as long as the text would take to speak, after a simulated delay"""
+    name = "stub"
+
+    def __init__(self, latency_ms: Optional[float] = None):
+        self.latency = float(latency_ms if latency_ms is not None else os.getenv("TTS_STUB_LATENCY_MS", "400")) / 1000
+
+    async def synthesize(self, text: str, voice: str, previous_text: str = "", next_text: str = "") -> bytes:
+        await asyncio.sleep(self.latency)
+        return _silent_mp3(len(text.split()) / WORDS_PER_SECOND)
+
+
+def create_tts_provider() -> TTSProvider:
+    provider = os.getenv("TTS_PROVIDER") or ("elevenlabs" if os.getenv("ELEVEN_LABS_API_KEY") else "stub")
+    if provider == "elevenlabs":
+        return ElevenLabsProvider()
+    if provider == "stub":
+        return StubTTSProvider()
+    raise ValueError(f"Unknown TTS_PROVIDER: {provider}")
+
+
+class TTSPipeline:
+    """Synthesizes a script's sentence chunks concurrently under a concurrency and rate budget"""
+
+    def __init__(self, provider: Optional[TTSProvider] = None):
+        self._provider = provider
+        self.chunk_chars = int(os.getenv("TTS_CHUNK_CHARS", "300"))
+        self.concurrency = asyncio.Semaphore(int(os.getenv("TTS_CONCURRENCY", "3")))
+        self.rate_limiter = RateLimiter(float(os.getenv("TTS_RATE_PER_MINUTE", "60")))
+
+    @property
+    def provider(self) -> TTSProvider:
+        if self._provider is None:
+            self._provider = create_tts_provider()
+        return self._provider
+
+    async def _synthesize_chunk(self, chunks: List[str], index: int, voice: str) -> bytes:
+        provider = self.provider
+        with provider_load.track(provider.name):
+            async with self.concurrency:
+                await self.rate_limiter.acquire()
+                start = time.perf_counter()
+                status = "ok"
+                try:
+                    return await provider.synthesize(
+                        chunks[index],
+                        voice,
+                        previous_text=chunks[index - 1] if index > 0 else "",
+                        next_text=chunks[index + 1] if index + 1 < len(chunks) else ""
+                    )
+                except Exception:
+                    status = "error"
+                    raise
+                finally:
+                    PROVIDER_LATENCY.labels(provider.name, "tts", status).observe(time.perf_counter() - start)
+
+    async def stream(self, script: str, voice: str = "professional_male") -> AsyncIterator[bytes]:
+        """Yield audio chunks in script order while later chunks are still being synthesized"""
+        chunks = chunk_script(script, self.chunk_chars)
+        if not chunks:
+            return
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(self._synthesize_chunk(chunks, index, voice)) for index in range(len(chunks))]
+        try:
+            for index, task in enumerate(tasks):
+                audio = await task
+                if index == 0:
+                    TTS_TIME_TO_FIRST.labels(self.provider.name).observe(time.perf_counter() - started)
+                yield audio
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def store(self, audio: bytes, storage=None, file_id: Optional[str] = None) -> str:
+        """Store stitched audio and return its URL (a data URL without storage)"""
+        provider = self.provider
+        if storage is None:
+            return f"data:{provider.content_type};base64,{base64.b64encode(audio).decode('ascii')}"
+        file_id = file_id or f"{uuid.uuid4().hex}.{provider.extension}"
+        return await storage.upload_file(file_id, f"voiceover.{provider.extension}", audio, provider.content_type)
+
+    async def synthesize(self, script: str, voice: str = "professional_male", storage=None) -> Dict[str, Any]:
+        """Synthesize the whole script, stitch the chunks and store the result"""
+        parts = [audio async for audio in self.stream(script, voice)]
+        if not parts:
+            raise ValueError("Script is empty")
+        audio = b"".join(parts)
+        url = await self.store(audio, storage)
+        logger.info("Synthesized voice-over", provider=self.provider.name, chunks=len(parts), bytes=len(audio))
+        return {"audio_url": url, "chunks": len(parts), "size": len(audio), "source": self.provider.name}
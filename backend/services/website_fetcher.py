@@ -0,0 +1,351 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import ipaddress
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+from urllib.robotparser import RobotFileParser
+from typing import Dict, Any, List, Optional
+
+import structlog
+
+from .metrics import PROVIDER_LATENCY, WEBSITE_FETCHES
+from .cache import TTLCache
+from .tracing import tracer
+from .schema_migrations import local_state_dir
+
+logger = structlog.get_logger(__name__)
+
+# First-party fetcher for company websites.
+#
+# The web-scraping stage reads the company's own homepage instead of relying
+# on a Tavily search for it. Pages are fetched with a pooled httpx client
+# (HTTP/2 when the h2 package is installed), only where robots.txt allows,
+# and only up to WEBSITE_MAX_BYTES of HTML. The extracted text is cached on
+# disk with the page's ETag/Last-Modified: within WEBSITE_CACHE_FRESH_SECONDS
+# the cached copy is used as is, after that it is revalidated with a
+# conditional request, so a repeat analysis usually costs one 304.
+#
+# The URL comes from the request, so only http(s) URLs whose host resolves to
+# public addresses are fetched; redirects are followed by hand (up to
+# MAX_REDIRECTS) and every hop is checked the same way, so a site can't point
+# the fetcher at loopback, private, link-local or cloud metadata addresses.
+#
+#   WEBSITE_FETCH=true                  set to false to skip fetching entirely
+#   WEBSITE_FETCH_TIMEOUT=10            seconds per request
+#   WEBSITE_MAX_BYTES=2000000           larger pages are truncated
+#   WEBSITE_MAX_TEXT_CHARS=6000         extracted text passed to the agent
+#   WEBSITE_CACHE_FRESH_SECONDS=3600    serve cached pages without revalidating
+#   WEBSITE_USER_AGENT=CompeteIQBot/1.0
+
+HTML_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+ROBOTS_TTL = 3600
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Elements whose text is never page content
+SKIP_TAGS = {"script", "style", "noscript", "svg", "template", "iframe", "nav", "footer", "form", "button"}
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "header", "li", "ul", "ol", "br", "tr", "table",
+    "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre"
+}
+
+
+class _TextExtractor(HTMLParser):
+    """Collects a page's title, meta description and visible text, preferring <main>/<article>"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.description = ""
+        self._in_title = False
+        self._skip_depth = 0
+        self._main_depth = 0
+        self._parts: List[str] = []
+        self._main_parts: List[str] = []
+
+    def handle_starttag(self, tag: str, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in ("main", "article"):
+            self._main_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            attributes = dict(attrs)
+            if (attributes.get("name") or attributes.get("property") or "").lower() in ("description", "og:description"):
+                self.description = self.description or (attributes.get("content") or "").strip()
+        if tag in BLOCK_TAGS:
+            self._newline()
+
+    def handle_endtag(self, tag: str):
+        if tag in SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in ("main", "article") and self._main_depth:
+            self._main_depth -= 1
+        elif tag == "title":
+            self._in_title = False
+        if tag in BLOCK_TAGS:
+            self._newline()
+
+    def handle_data(self, data: str):
+        if self._in_title:
+            self.title += data
+            return
+        if self._skip_depth:
+            return
+        self._parts.append(data)
+        if self._main_depth:
+            self._main_parts.append(data)
+
+    def _newline(self):
+        self._parts.append("\n")
+        if self._main_depth:
+            self._main_parts.append("\n")
+
+    def text(self) -> str:
+        parts = self._main_parts if "".join(self._main_parts).strip() else self._parts
+        lines = (" ".join(line.split()) for line in "".join(parts).splitlines())
+        return "\n".join(line for line in lines if line)
+
+
+def extract_text(html: str) -> Dict[str, str]:
+    """Title, meta description and main text of an HTML page"""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return {"title": " ".join(parser.title.split()), "description": parser.description, "text": parser.text()}
+
+
+def normalize_url(url: str) -> str:
+    url = url.strip()
+    return url if "://" in url else f"https://{url}"
+
+
+class BlockedURL(Exception):
+    """A URL the fetcher must not request (non-http(s) scheme or non-public address)"""
+
+
+def check_scheme(url: str):
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise BlockedURL(f"Only http(s) URLs with a host can be fetched: {url}")
+
+
+async def check_public_url(url: str):
+    """Raise BlockedURL unless `url` is http(s) and every address its host resolves to is public"""
+    check_scheme(url)
+    parts = urlsplit(url)
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError:
+        raise BlockedURL(f"Invalid port in {url}")
+    infos = await asyncio.get_running_loop().getaddrinfo(parts.hostname, port)
+    for *_, sockaddr in infos:
+        address = ipaddress.ip_address(sockaddr[0].split("%", 1)[0])
+        if not address.is_global or address.is_multicast:
+            raise BlockedURL(f"{parts.hostname} resolves to a non-public address ({address})")
+
+
+class WebsiteFetcher:
+    """Fetches company pages politely, with an on-disk conditional-request cache"""
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.enabled = os.getenv("WEBSITE_FETCH", "true").lower() == "true"
+        self.timeout = float(os.getenv("WEBSITE_FETCH_TIMEOUT", "10"))
+        self.max_bytes = int(os.getenv("WEBSITE_MAX_BYTES", "2000000"))
+        self.max_text_chars = int(os.getenv("WEBSITE_MAX_TEXT_CHARS", "6000"))
+        self.fresh_for = float(os.getenv("WEBSITE_CACHE_FRESH_SECONDS", "3600"))
+        self.user_agent = os.getenv("WEBSITE_USER_AGENT", "CompeteIQBot/1.0")
+        self.cache_dir = cache_dir or os.path.join(local_state_dir(), "web_cache")
+        self._robots = TTLCache("robots_txt", maxsize=1024, ttl=ROBOTS_TTL)
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import httpx
+            try:
+                import h2  # noqa: F401  (httpx's optional HTTP/2 support)
+                http2 = True
+            except ImportError:
+                http2 = False
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                # Redirects are followed in _open, so each hop's host is checked
+                follow_redirects=False,
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                headers={"User-Agent": self.user_agent, "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.5"}
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    # On-disk cache
+    def _cache_path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json")
+
+    def _read_cache(self, url: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._cache_path(url), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, url: str, entry: Dict[str, Any]):
+        path = self._cache_path(url)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Failed to write website cache", url=url, error=str(e))
+
+    async def _open(self, url: str, headers: Optional[Dict[str, str]] = None):
+        """GET `url` as a stream, following redirects to public hosts only; the caller closes the response"""
+        for _ in range(MAX_REDIRECTS + 1):
+            await check_public_url(url)
+            request = self.client.build_request("GET", url, headers=headers)
+            response = await self.client.send(request, stream=True)
+            location = response.headers.get("location")
+            if response.status_code not in REDIRECT_STATUSES or not location:
+                return response
+            await response.aclose()
+            url = urljoin(url, location)
+        raise Exception(f"More than {MAX_REDIRECTS} redirects")
+
+    # robots.txt
+    async def _robots_for(self, url: str) -> RobotFileParser:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        parser = self._robots.get(origin)
+        if parser is not None:
+            return parser
+
+        # Network errors propagate (and aren't cached): the page fetch would fail too
+        parser = RobotFileParser(f"{origin}/robots.txt")
+        response = await self._open(f"{origin}/robots.txt")
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+        if response.status_code in (401, 403) or response.status_code >= 500:
+            parser.disallow_all = True
+        elif response.status_code >= 400:
+            parser.allow_all = True
+        else:
+            parser.parse(response.text.splitlines())
+        self._robots.set(origin, parser)
+        return parser
+
+    async def allowed(self, url: str) -> bool:
+        """Whether robots.txt lets us fetch `url`; raises if the site is unreachable"""
+        parser = await self._robots_for(url)
+        return parser.can_fetch(self.user_agent, url)
+
+    # Fetching
+    def _page(self, entry: Dict[str, Any], outcome: str) -> Dict[str, Any]:
+        WEBSITE_FETCHES.labels(outcome).inc()
+        return {
+            "url": entry["url"],
+            "title": entry.get("title", ""),
+            "description": entry.get("description", ""),
+            "text": entry.get("text", "")[:self.max_text_chars],
+            "fetched_at": entry["fetched_at"],
+            "from_cache": outcome != "fetched"
+        }
+
+    async def fetch(self, url: str) -> Optional[Dict[str, Any]]:
+        """The page's title, description and text, or None if it can't be fetched
+
+        Never raises (except on cancellation): a failed fetch falls back to a
+        stale cached copy when there is one.
+        """
+        url = normalize_url(url)
+        try:
+            check_scheme(url)
+        except BlockedURL as e:
+            WEBSITE_FETCHES.labels("blocked").inc()
+            logger.warning("Website fetch blocked", url=url, error=str(e))
+            return None
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(None, self._read_cache, url)
+        if cached and time.time() - cached["fetched_at"] < self.fresh_for:
+            return self._page(cached, "fresh")
+
+        with tracer.start_span("website.fetch", {"url": url}) as span:
+            headers = {}
+            if cached and cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached and cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+            start = time.perf_counter()
+            status = "ok"
+            try:
+                if not await self.allowed(url):
+                    status = "disallowed"
+                    WEBSITE_FETCHES.labels("disallowed").inc()
+                    logger.info("Website fetch disallowed by robots.txt", url=url)
+                    return None
+
+                response = await self._open(url, headers)
+                try:
+                    span.set_attribute("http.status_code", response.status_code)
+                    if response.status_code == 304 and cached:
+                        cached["fetched_at"] = time.time()
+                        await loop.run_in_executor(None, self._write_cache, url, cached)
+                        return self._page(cached, "not_modified")
+                    if response.status_code != 200:
+                        raise Exception(f"HTTP {response.status_code}")
+                    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                    if content_type and content_type not in HTML_TYPES:
+                        raise Exception(f"Unsupported content type {content_type}")
+
+                    body = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        body.extend(chunk)
+                        if len(body) >= self.max_bytes:
+                            # The head of the page carries the title, description and intro
+                            del body[self.max_bytes:]
+                            break
+                    html = body.decode(response.encoding or "utf-8", errors="replace")
+                    etag = response.headers.get("etag")
+                    last_modified = response.headers.get("last-modified")
+                finally:
+                    await response.aclose()
+            except asyncio.CancelledError:
+                status = "cancelled"
+                raise
+            except BlockedURL as e:
+                status = "blocked"
+                WEBSITE_FETCHES.labels("blocked").inc()
+                logger.warning("Website fetch blocked", url=url, error=str(e))
+                return None
+            except Exception as e:
+                status = "error"
+                logger.warning("Website fetch failed", url=url, error=str(e), stale_copy=bool(cached))
+                if cached:
+                    return self._page(cached, "stale")
+                WEBSITE_FETCHES.labels("error").inc()
+                return None
+            finally:
+                PROVIDER_LATENCY.labels("website", "fetch", status).observe(time.perf_counter() - start)
+
+        entry = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": time.time(),
+            **await loop.run_in_executor(None, extract_text, html)
+        }
+        await loop.run_in_executor(None, self._write_cache, url, entry)
+        return self._page(entry, "fetched")
@@ -1,5 +1,9 @@
 // API client for connecting to our backend
+import { account } from './appwrite/client';
+
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:7000';
+// Appwrite JWTs are valid for 15 minutes; refresh a little before that
+const JWT_LIFETIME_MS = 14 * 60 * 1000;
 
 export interface CompanyInput {
   name: string;
@@ -56,23 +60,48 @@ export interface AudioGenerationRequest {
 
 class APIClient {
   private baseURL: string;
+  private jwt: string | null = null;
+  private jwtExpiresAt = 0;
 
   constructor(baseURL: string = API_BASE_URL) {
     this.baseURL = baseURL;
   }
 
+  // Use a JWT obtained elsewhere (e.g. from /auth/login) for API requests
+  setToken(jwt: string | null) {
+    this.jwt = jwt;
+    this.jwtExpiresAt = jwt ? Date.now() + JWT_LIFETIME_MS : 0;
+  }
+
+  // JWT for the Authorization header: the cached one, or a fresh one from the Appwrite session
+  private async authToken(): Promise<string | null> {
+    if (this.jwt && Date.now() < this.jwtExpiresAt) {
+      return this.jwt;
+    }
+    try {
+      const { jwt } = await account.createJWT();
+      this.setToken(jwt);
+    } catch (error) {
+      // No Appwrite session: the request goes out unauthenticated
+      this.setToken(null);
+    }
+    return this.jwt;
+  }
+
   private async request<T>(endpoint: string, options: RequestInit = {}): Promise<T> {
     const url = `${this.baseURL}${endpoint}`;
     
     console.log(`🌐 Making API request to: ${url}`);
     console.log(`📤 Request data:`, options.body ? JSON.parse(options.body as string) : 'No body');
     
+    const token = await this.authToken();
     const config: RequestInit = {
+      ...options,
       headers: {
         'Content-Type': 'application/json',
+        ...(token ? { Authorization: `Bearer ${token}` } : {}),
         ...options.headers,
       },
-      ...options,
     };
 
     try {
@@ -80,6 +109,10 @@ class APIClient {
       
       console.log(`📥 Response status: ${response.status} ${response.statusText}`);
       
+      if (response.status === 401) {
+        // Expired or revoked: fetch a new JWT on the next request
+        this.setToken(null);
+      }
       if (!response.ok) {
         const errorText = await response.text();
         console.error(`❌ API request failed: ${response.status} ${response.statusText}`);
@@ -149,17 +182,23 @@ class APIClient {
   }
 
   // Authentication
-  async login(email: string, password: string): Promise<{ session: any; message: string }> {
-    return this.request('/auth/login', {
+  async login(email: string, password: string): Promise<{ session: any; jwt: string | null; message: string }> {
+    const result = await this.request<{ session: any; jwt: string | null; message: string }>('/auth/login', {
       method: 'POST',
       body: JSON.stringify({ email, password }),
     });
+    this.setToken(result.jwt);
+    return result;
   }
 
   async logout(): Promise<{ message: string }> {
-    return this.request('/auth/logout', {
-      method: 'POST',
-    });
+    try {
+      return await this.request('/auth/logout', {
+        method: 'POST',
+      });
+    } finally {
+      this.setToken(null);
+    }
   }
 
   async getCurrentUser(): Promise<any> {